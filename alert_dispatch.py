@@ -0,0 +1,278 @@
+import os, time, queue, threading
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+import requests
+
+import metrics
+from app.models import db, AlertOutbox, MonitorWorker
+from alerts import notify_telegram, send_email, telegram_enabled, email_enabled, SmtpSession
+from sharding import WORKER_LEASE_S
+
+# ---- Alert delivery tuning (env)
+ALERT_DIGEST_S      = float(os.getenv("ALERT_DIGEST_S", "10"))      # changes within this window go out as one message
+ALERT_DIGEST_MAX    = int(os.getenv("ALERT_DIGEST_MAX", "50"))      # most changes per message
+ALERT_RATE_PER_MIN  = float(os.getenv("ALERT_RATE_PER_MIN", "20"))  # messages per channel (token bucket)
+ALERT_BURST         = int(os.getenv("ALERT_BURST", "5"))
+ALERT_RETRY_BASE_S  = float(os.getenv("ALERT_RETRY_BASE_S", "5"))   # doubles per failed attempt
+ALERT_RETRY_MAX_S   = float(os.getenv("ALERT_RETRY_MAX_S", "600"))
+ALERT_MAX_ATTEMPTS  = int(os.getenv("ALERT_MAX_ATTEMPTS", "8"))
+ALERT_QUEUE_MAX     = int(os.getenv("ALERT_QUEUE_MAX", "10000"))
+ALERT_RECLAIM_S     = float(os.getenv("ALERT_RECLAIM_S", "60"))     # how often to adopt a dead worker's pending rows
+
+CHANNELS = ("telegram", "email")
+_ENABLED = {"telegram": telegram_enabled, "email": email_enabled}
+TELEGRAM_MAX_CHARS = 4000   # API limit is 4096
+_STOP = object()
+
+# What a send needs from an outbox row, copied out so no session is open while it runs
+_Alert = namedtuple("_Alert", "id subject body")
+
+ALERT_DELIVERY_SECONDS = metrics.histogram("alert_delivery_seconds", "State change to delivered message, per alert",
+                                           ("channel",), buckets=metrics.SLOW_BUCKETS)
+ALERT_SEND_SECONDS = metrics.histogram("alert_send_seconds", "Duration of one Telegram/SMTP send", ("channel",))
+ALERT_MESSAGES = metrics.counter("alert_messages_total", "Messages sent by channel and outcome", ("channel", "result"))
+ALERTS_DROPPED = metrics.counter("alerts_dropped_total", "Alerts lost to a full queue or a failing database")
+
+def _now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+class TokenBucket:
+    def __init__(self, rate_per_s, burst, clock=time.monotonic):
+        self.rate = rate_per_s
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.clock = clock
+        self.t = clock()
+
+    # Take one token; returns 0 on success, else seconds until one is available
+    def take(self):
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.t) * self.rate)
+        self.t = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else 60.0
+
+
+# ------------------------------
+# Alert delivery off the probe path.
+# enqueue() only appends to an in-memory queue. An intake thread persists
+# events to alert_outbox (one row per enabled channel), and one worker thread
+# per channel delivers them: changes arriving within ALERT_DIGEST_S are sent
+# as a single digest, sends are rate limited by a token bucket, and failures
+# are retried with exponential backoff. Rows left pending on shutdown are
+# picked up on the next start by the dispatcher with the same owner; rows of a
+# shard worker whose heartbeat expired (sharding.py) are adopted by a live one.
+# ------------------------------
+class AlertDispatcher:
+    def __init__(self, app, owner="monitor"):
+        self.app = app
+        self.owner = owner
+        self._q = queue.Queue(maxsize=ALERT_QUEUE_MAX)
+        self._stop = threading.Event()
+        self._wake = {c: threading.Event() for c in CHANNELS}
+        self._threads = []
+        self._lock = threading.Lock()
+        self.dropped = 0
+        self.sent = {c: 0 for c in CHANNELS}       # messages delivered
+        self.delivered = {c: 0 for c in CHANNELS}  # alerts delivered (a digest carries several)
+        self.smtp = SmtpSession()
+        self.http = requests.Session()
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return self
+            self._stop.clear()
+            self._threads = [threading.Thread(target=self._intake_loop, name="alerts-intake", daemon=True)]
+            self._threads += [threading.Thread(target=self._channel_loop, args=(c,), name=f"alerts-{c}", daemon=True)
+                              for c in CHANNELS]
+            for t in self._threads:
+                t.start()
+        return self
+
+    # Never blocks: when the queue is full the alert is dropped and counted
+    def enqueue(self, device_id, subject, text, body):
+        if not self._threads:
+            self.start()
+        try:
+            self._q.put_nowait({"device_id": device_id, "subject": subject, "text": text, "body": body,
+                                "created_at": _now()})
+        except queue.Full:
+            self.dropped += 1
+            ALERTS_DROPPED.inc()
+
+    def qsize(self):
+        return self._q.qsize()
+
+    def close(self, timeout=10):
+        if not self._threads:
+            return
+        self._q.put(_STOP)
+        self._threads[0].join(timeout)
+        self._stop.set()
+        for e in self._wake.values():
+            e.set()
+        for t in self._threads[1:]:
+            t.join(timeout)
+        self._threads = []
+        self.smtp.close()
+        self.http.close()
+
+    # ---- intake: memory -> alert_outbox
+    def _intake_loop(self):
+        while True:
+            ev = self._q.get()
+            stop = ev is _STOP
+            batch = [] if stop else [ev]
+            while len(batch) < 1000:
+                try:
+                    ev = self._q.get_nowait()
+                except queue.Empty:
+                    break
+                if ev is _STOP:
+                    stop = True
+                    break
+                batch.append(ev)
+            if batch:
+                self._persist(batch)
+            if stop:
+                return
+
+    def _persist(self, batch):
+        for attempt in range(5):
+            try:
+                with self.app.app_context():
+                    channels = [c for c in CHANNELS if _ENABLED[c]()]
+                    rows = [{
+                        "owner": self.owner, "channel": c, "device_id": ev["device_id"],
+                        "subject": ev["subject"] if c == "email" else None,
+                        "body": ev["text"] if c == "telegram" else ev["body"],
+                        "state": "pending", "attempts": 0,
+                        "created_at": ev["created_at"], "next_attempt_at": ev["created_at"],
+                    } for ev in batch for c in channels]
+                    if rows:
+                        db.session.execute(AlertOutbox.__table__.insert(), rows)
+                        db.session.commit()
+                for c in channels:
+                    self._wake[c].set()
+                return
+            except Exception as e:
+                print(f"[alerts] could not queue {len(batch)} alerts (attempt {attempt + 1}): {e}", flush=True)
+                time.sleep(1.0)
+        self.dropped += len(batch)
+        ALERTS_DROPPED.inc(len(batch))
+
+    # ---- per-channel delivery
+    def _channel_loop(self, channel):
+        bucket = TokenBucket(ALERT_RATE_PER_MIN / 60.0, ALERT_BURST)
+        reclaimed = 0.0
+        while not self._stop.is_set():
+            try:
+                with self.app.app_context():
+                    if time.monotonic() - reclaimed >= ALERT_RECLAIM_S:
+                        reclaimed = time.monotonic()
+                        self._reclaim(channel)
+                    wait = self._deliver(channel, bucket)
+            except Exception as e:
+                print(f"[alerts] {channel} delivery error: {e}", flush=True)
+                wait = ALERT_RETRY_BASE_S
+            if wait > 0:
+                self._wake[channel].wait(wait)
+                self._wake[channel].clear()
+
+    # Take over the pending rows of workers whose lease ran out: nobody else
+    # would ever send them. The owner check in the UPDATE makes one worker win.
+    def _reclaim(self, channel):
+        expired = _now() - timedelta(seconds=WORKER_LEASE_S)
+        dead = [w for (w,) in db.session.query(MonitorWorker.worker_id)
+                .filter(MonitorWorker.heartbeat_at < expired, MonitorWorker.worker_id != self.owner)]
+        n = 0
+        if dead:
+            n = (AlertOutbox.query
+                 .filter(AlertOutbox.owner.in_(dead), AlertOutbox.channel == channel,
+                         AlertOutbox.state == "pending")
+                 .update({"owner": self.owner}, synchronize_session=False))
+        db.session.commit()
+        if n:
+            print(f"[alerts] {channel}: took over {n} pending alert(s) from stopped workers", flush=True)
+
+    # One step; returns how long to wait before the next one
+    def _deliver(self, channel, bucket):
+        now = _now()
+        pending = AlertOutbox.query.filter(
+            AlertOutbox.owner == self.owner, AlertOutbox.channel == channel,
+            AlertOutbox.state == "pending",
+        )
+        rows = (pending.filter(AlertOutbox.next_attempt_at <= now)
+                .order_by(AlertOutbox.id).limit(ALERT_DIGEST_MAX).all())
+        if not rows:
+            nxt = pending.with_entities(db.func.min(AlertOutbox.next_attempt_at)).scalar()
+            db.session.rollback()
+            return 30.0 if nxt is None else max(0.05, (nxt - now).total_seconds())
+
+        # hold the first change of a burst for the digest window to collect the rest
+        window_end = min(r.created_at for r in rows) + timedelta(seconds=ALERT_DIGEST_S)
+        if len(rows) < ALERT_DIGEST_MAX and window_end > now:
+            db.session.rollback()
+            return (window_end - now).total_seconds()
+
+        if not _ENABLED[channel]():
+            for r in rows:
+                r.state = "skipped"
+            db.session.commit()
+            return 0.0
+
+        wait = bucket.take()
+        if wait:
+            db.session.rollback()
+            return wait
+
+        # end the read transaction before the send: a slow SMTP/Telegram call must not pin
+        # a snapshot (on SQLite it would hold back WAL checkpoints)
+        alerts = [_Alert(r.id, r.subject, r.body) for r in rows]
+        db.session.rollback()
+
+        t0 = time.perf_counter()
+        ok, info = self._send(channel, alerts)
+        ALERT_SEND_SECONDS.labels(channel).observe(time.perf_counter() - t0)
+        ALERT_MESSAGES.labels(channel, "ok" if ok else "error").inc()
+        now = _now()
+        rows = AlertOutbox.query.filter(AlertOutbox.id.in_([a.id for a in alerts])).all()
+        for r in rows:
+            r.attempts += 1
+            if ok:
+                r.state, r.sent_at, r.last_error = "sent", now, None
+                ALERT_DELIVERY_SECONDS.labels(channel).observe((now - r.created_at).total_seconds())
+            else:
+                r.last_error = info[:500]
+                if r.attempts >= ALERT_MAX_ATTEMPTS:
+                    r.state = "failed"
+                else:
+                    delay = min(ALERT_RETRY_MAX_S, ALERT_RETRY_BASE_S * 2 ** (r.attempts - 1))
+                    r.next_attempt_at = now + timedelta(seconds=delay)
+        db.session.commit()
+        if ok:
+            self.sent[channel] += 1
+            self.delivered[channel] += len(alerts)
+        print(f"[alerts] {channel}: {len(alerts)} alert(s) in one message ok={ok} {info}", flush=True)
+        return 0.0
+
+    def _send(self, channel, rows):
+        if channel == "telegram":
+            if len(rows) == 1:
+                text = rows[0].body
+            else:
+                text = f"🔔 {len(rows)} status changes\n" + "\n".join(r.body for r in rows)
+                if len(text) > TELEGRAM_MAX_CHARS:
+                    text = text[:TELEGRAM_MAX_CHARS - 20].rsplit("\n", 1)[0] + "\n… (truncated)"
+            return notify_telegram(text, session=self.http)
+        if len(rows) == 1:
+            subject, body = rows[0].subject, rows[0].body
+        else:
+            subject = f"[Monitor] {len(rows)} status changes"
+            body = "\n\n".join(f"{r.subject}\n{r.body}" for r in rows)
+        return send_email(subject, body, smtp=self.smtp)
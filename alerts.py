@@ -1,20 +1,32 @@
-import os, smtplib, requests
+import os, time, smtplib, requests
 from email.mime.text import MIMEText
 from email.utils import formatdate
-from app.config_store import get_config
+from app.config_store import get_many
 
 # Telegram (DB first, then env)
 ENV_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "").strip()
 ENV_CHAT_ID   = os.getenv("TELEGRAM_CHAT_ID", "").strip()
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org").rstrip("/")
 
-def notify_telegram(text: str):
-    token = get_config("TELEGRAM_BOT_TOKEN", ENV_BOT_TOKEN)
-    chat_id = get_config("TELEGRAM_CHAT_ID", ENV_CHAT_ID)
+# Reused SMTP connections are dropped after this long idle (servers time them out anyway)
+ALERT_SMTP_IDLE_S = float(os.getenv("ALERT_SMTP_IDLE_S", "60"))
+
+def _telegram_settings():
+    cfg = get_many({"TELEGRAM_BOT_TOKEN": ENV_BOT_TOKEN, "TELEGRAM_CHAT_ID": ENV_CHAT_ID})
+    return cfg["TELEGRAM_BOT_TOKEN"], cfg["TELEGRAM_CHAT_ID"]
+
+def telegram_enabled():
+    token, chat_id = _telegram_settings()
+    return bool(token and chat_id)
+
+# session: a requests.Session to reuse the HTTPS connection across messages
+def notify_telegram(text: str, session=None):
+    token, chat_id = _telegram_settings()
     if not token or not chat_id:
         return False, "telegram disabled (missing token/chat_id)"
     try:
-        r = requests.post(
-            f"https://api.telegram.org/bot{token}/sendMessage",
+        r = (session or requests).post(
+            f"{TELEGRAM_API_URL}/bot{token}/sendMessage",
             json={"chat_id": chat_id, "text": text},
             timeout=5
         )
@@ -24,33 +36,108 @@ def notify_telegram(text: str):
     except requests.RequestException as e:
         return False, f"telegram error: {e}"
 
-def send_email(subject: str, body: str):
+def _smtp_settings():
     # Read from DB first; fallback to env if missing
-    SMTP_HOST = get_config("SMTP_HOST", os.getenv("SMTP_HOST", "").strip())
-    SMTP_PORT = int(get_config("SMTP_PORT", os.getenv("SMTP_PORT", "587")).strip())
-    SMTP_USER = get_config("SMTP_USER", os.getenv("SMTP_USER", "").strip())
-    SMTP_PASS = get_config("SMTP_PASS", os.getenv("SMTP_PASS", "").strip())
-    SMTP_STARTTLS = get_config("SMTP_STARTTLS", os.getenv("SMTP_STARTTLS", "true")).strip().lower() == "true"
+    c = get_many({
+        "SMTP_HOST": os.getenv("SMTP_HOST", "").strip(),
+        "SMTP_PORT": os.getenv("SMTP_PORT", "587"),
+        "SMTP_USER": os.getenv("SMTP_USER", "").strip(),
+        "SMTP_PASS": os.getenv("SMTP_PASS", "").strip(),
+        "SMTP_STARTTLS": os.getenv("SMTP_STARTTLS", "true"),
+        "ALERT_EMAIL_TO": os.getenv("ALERT_EMAIL_TO", "").strip(),
+        "ALERT_EMAIL_FROM": None,
+    })
+    user = c["SMTP_USER"]
+    sender = c["ALERT_EMAIL_FROM"]
+    if sender is None:
+        sender = os.getenv("ALERT_EMAIL_FROM", user).strip()
+    return {
+        "host": c["SMTP_HOST"],
+        "port": int((c["SMTP_PORT"] or "587").strip()),
+        "user": user,
+        "password": c["SMTP_PASS"],
+        "starttls": c["SMTP_STARTTLS"].strip().lower() == "true",
+        "to": c["ALERT_EMAIL_TO"],
+        "from": sender or "noreply@example.com",
+    }
+
+def email_enabled():
+    cfg = _smtp_settings()
+    return bool(cfg["host"] and cfg["to"])
+
+# ------------------------------
+# One SMTP connection kept open across alerts (connect + STARTTLS + login once),
+# reopened when the settings change, it sat idle too long, or the server hung up.
+# ------------------------------
+class SmtpSession:
+    def __init__(self, idle_s=ALERT_SMTP_IDLE_S):
+        self.idle_s = idle_s
+        self.conn = None
+        self.key = None
+        self.last_used = 0.0
+        self.connects = 0
+
+    def _open(self, cfg):
+        conn = smtplib.SMTP(cfg["host"], cfg["port"], timeout=10)
+        try:
+            if cfg["starttls"]:
+                conn.starttls()
+            if cfg["user"]:
+                conn.login(cfg["user"], cfg["password"])
+        except Exception:
+            conn.close()
+            raise
+        self.conn = conn
+        self.key = (cfg["host"], cfg["port"], cfg["user"], cfg["password"], cfg["starttls"])
+        self.connects += 1
+
+    def sendmail(self, cfg, from_addr, to_addrs, msg):
+        key = (cfg["host"], cfg["port"], cfg["user"], cfg["password"], cfg["starttls"])
+        if self.conn is not None and (key != self.key or time.monotonic() - self.last_used > self.idle_s):
+            self.close()
+        for attempt in (1, 2):
+            reused = self.conn is not None
+            if not reused:
+                self._open(cfg)
+            try:
+                self.conn.sendmail(from_addr, to_addrs, msg)
+                self.last_used = time.monotonic()
+                return
+            except (smtplib.SMTPServerDisconnected, OSError):
+                self.close()
+                if not reused or attempt == 2:
+                    raise
 
-    ALERT_EMAIL_TO   = get_config("ALERT_EMAIL_TO", os.getenv("ALERT_EMAIL_TO", "").strip())
-    ALERT_EMAIL_FROM = get_config("ALERT_EMAIL_FROM", os.getenv("ALERT_EMAIL_FROM", SMTP_USER).strip() or "noreply@example.com")
+    def close(self):
+        if self.conn is not None:
+            try:
+                self.conn.quit()
+            except Exception:
+                self.conn.close()
+            self.conn = None
 
-    if not SMTP_HOST or not ALERT_EMAIL_TO:
+# smtp: an SmtpSession to reuse its connection; without one, connect for this message only
+def send_email(subject: str, body: str, smtp=None):
+    cfg = _smtp_settings()
+    if not cfg["host"] or not cfg["to"]:
         return False, "email disabled (missing SMTP_HOST/ALERT_EMAIL_TO)"
 
     msg = MIMEText(body, _charset="utf-8")
     msg["Subject"] = subject
-    msg["From"] = ALERT_EMAIL_FROM
-    msg["To"] = ALERT_EMAIL_TO
+    msg["From"] = cfg["from"]
+    msg["To"] = cfg["to"]
     msg["Date"] = formatdate(localtime=True)
 
     try:
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=10) as s:
-            if SMTP_STARTTLS:
+        if smtp is not None:
+            smtp.sendmail(cfg, cfg["from"], [cfg["to"]], msg.as_string())
+            return True, "email sent"
+        with smtplib.SMTP(cfg["host"], cfg["port"], timeout=10) as s:
+            if cfg["starttls"]:
                 s.starttls()
-            if SMTP_USER:
-                s.login(SMTP_USER, SMTP_PASS)
-            s.sendmail(ALERT_EMAIL_FROM, [ALERT_EMAIL_TO], msg.as_string())
+            if cfg["user"]:
+                s.login(cfg["user"], cfg["password"])
+            s.sendmail(cfg["from"], [cfg["to"]], msg.as_string())
         return True, "email sent"
     except Exception as e:
         return False, f"email error: {e}"
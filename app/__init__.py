@@ -1,7 +1,10 @@
 import os
 from dotenv import load_dotenv
 from flask import Flask
-from .models import db
+from .models import db, migrate_db_if_needed
+from .latest_status import backfill_latest_status
+from .live import ChangeHub
+from .db_profile import engine_options
 
 def create_app():
     load_dotenv()
@@ -9,6 +12,8 @@ def create_app():
 
     app.config["SQLALCHEMY_DATABASE_URI"] = os.getenv("DATABASE_URL", "sqlite:///monitor.db")
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    # pooled connections with WAL, busy timeout and cache PRAGMAs (SQLite files only)
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
     app.config["SECRET_KEY"] = os.getenv("SECRET_KEY", "change-me")
 
     # Debug line so you can confirm both web & worker share the same DB
@@ -16,7 +21,11 @@ def create_app():
 
     db.init_app(app)
     with app.app_context():
-        db.create_all()
+        migrate_db_if_needed()
+        backfill_latest_status()
+
+    # one change feed per process for all /api/stream clients
+    app.extensions["change_hub"] = ChangeHub(app)
 
     from .routes import bp
     app.register_blueprint(bp)
@@ -1,14 +1,72 @@
+import os, time, threading
+
+from sqlalchemy import update, cast, Integer, String
+
 from app.models import db, Config
 
+# ------------------------------
+# Settings are served from an in-process copy of the config table.
+# Every set_many() bumps CONFIG_VERSION in the same transaction; readers
+# compare it at most every CONFIG_CHECK_S and reload the whole (small) table
+# when it moved, so the web app and the monitor see each other's changes
+# within a couple of seconds at the cost of one primary-key read.
+# Writers that bypass set_config/set_many (e.g. rollup watermarks) are not
+# cached reliably; read those from the table directly.
+# ------------------------------
+CONFIG_CHECK_S = float(os.getenv("CONFIG_CHECK_S", "2"))
+VERSION_KEY = "CONFIG_VERSION"
+
+_lock = threading.Lock()
+_values = {}
+_version = None
+_loaded = False
+_checked = float("-inf")
+
+
+def _refresh(force=False):
+    # needs an app context when it actually has to look at the table
+    global _values, _version, _loaded, _checked
+    if not force and time.monotonic() - _checked < CONFIG_CHECK_S:
+        return
+    with _lock:
+        now = time.monotonic()
+        if not force and now - _checked < CONFIG_CHECK_S:
+            return
+        version = db.session.query(Config.value).filter(Config.key == VERSION_KEY).scalar()
+        if force or not _loaded or version != _version:
+            _values = dict(db.session.query(Config.key, Config.value).all())
+            _version = version
+            _loaded = True
+        _checked = now
+
 def get_config(key, default=None):
-    row = Config.query.get(key)
-    return row.value if row else default
+    _refresh()
+    return _values.get(key, default)
 
-def set_config(key, value):
-    row = Config.query.get(key)
-    if not row:
-        row = Config(key=key, value=value)
-        db.session.add(row)
-    else:
-        row.value = value
+# {key: default} -> {key: value}
+def get_many(defaults):
+    _refresh()
+    values = _values
+    return {k: values.get(k, d) for k, d in defaults.items()}
+
+def config_version():
+    _refresh()
+    return _version
+
+# Write all of `values` and bump the version in one transaction
+def set_many(values):
+    for key, value in values.items():
+        db.session.merge(Config(key=key, value=value))
+    db.session.flush()
+    table = Config.__table__
+    bumped = db.session.execute(
+        update(table).where(table.c.key == VERSION_KEY)
+        .values(value=cast(cast(table.c.value, Integer) + 1, String))
+    )
+    if bumped.rowcount == 0:
+        db.session.add(Config(key=VERSION_KEY, value="1"))
     db.session.commit()
+    _refresh(force=True)
+
+def set_config(key, value):
+    set_many({key: value})
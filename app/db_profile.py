@@ -0,0 +1,131 @@
+import os, threading
+
+from dotenv import load_dotenv
+from flask import has_request_context, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import create_engine, event, orm
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool
+
+load_dotenv()
+
+# ---- SQLite engine profile (env)
+SQLITE_WAL             = os.getenv("SQLITE_WAL", "true").lower() == "true"  # readers and the writer stop blocking each other
+SQLITE_SYNCHRONOUS     = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL").upper()  # NORMAL: no fsync per commit in WAL mode, still crash-safe
+SQLITE_MMAP_MB         = int(os.getenv("SQLITE_MMAP_MB", "256"))            # memory-mapped reads, per database file
+SQLITE_CACHE_MB        = int(os.getenv("SQLITE_CACHE_MB", "32"))            # page cache, per connection
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "10000"))  # wait this long for a lock before "database is locked"
+DB_POOL_SIZE           = int(os.getenv("DB_POOL_SIZE", "5"))                # kept-open connections per engine
+DB_MAX_OVERFLOW        = int(os.getenv("DB_MAX_OVERFLOW", "20"))            # extra connections under load, closed when returned
+DB_POOL_TIMEOUT_S      = float(os.getenv("DB_POOL_TIMEOUT_S", "30"))        # wait for a free connection before failing
+DB_READ_ONLY_ROUTES    = os.getenv("DB_READ_ONLY_ROUTES", "true").lower() == "true"  # GET/HEAD requests use the read-only pool
+
+_SYNCHRONOUS = ("OFF", "NORMAL", "FULL", "EXTRA")
+
+
+def _is_sqlite_file(url):
+    url = make_url(url)
+    return url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:")
+
+
+def engine_options(uri):
+    """SQLALCHEMY_ENGINE_OPTIONS for the given database URI.
+
+    SQLAlchemy 1.4 gives file-backed SQLite a NullPool (a new connection, and a
+    fresh page cache, per checkout); use a real pool shared across threads instead.
+    """
+    if not _is_sqlite_file(uri):
+        return {}
+    return {
+        "poolclass": QueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT_S,
+        "connect_args": {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000.0},
+    }
+
+
+def _pragmas(read_only):
+    sync = SQLITE_SYNCHRONOUS if SQLITE_SYNCHRONOUS in _SYNCHRONOUS else "NORMAL"
+    out = []
+    if SQLITE_WAL and not read_only:
+        out.append("PRAGMA journal_mode=WAL")   # stored in the file; readers pick it up from there
+    out += [
+        f"PRAGMA synchronous={sync}",
+        f"PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT_MS)}",
+        f"PRAGMA mmap_size={SQLITE_MMAP_MB * 1024 * 1024}",
+        f"PRAGMA cache_size={-SQLITE_CACHE_MB * 1024}",   # negative = KiB
+    ]
+    if read_only:
+        out.append("PRAGMA query_only=ON")
+    return out
+
+
+def apply_profile(engine, read_only=False):
+    """Run the profile's PRAGMAs on every new DBAPI connection of a SQLite engine."""
+    if engine.dialect.name != "sqlite":
+        return engine
+    pragmas = _pragmas(read_only)
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_conn, record):
+        cur = dbapi_conn.cursor()
+        try:
+            if not read_only and cur.execute("PRAGMA page_count").fetchone()[0] == 0:
+                # brand-new file: auto_vacuum (see migrate_db_if_needed) can only be chosen
+                # before the first page is written, and switching to WAL writes it
+                cur.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            for p in pragmas:
+                cur.execute(p)
+        finally:
+            cur.close()
+
+    return engine
+
+
+# ------------------------------
+# Session that sends the web app's read requests to a second, read-only engine.
+# GET/HEAD requests run their queries on a pool whose connections have
+# PRAGMA query_only set, so dashboard reads never take the write lock (in WAL
+# mode they read a snapshot while the monitor commits) and a stray write from
+# a read route fails loudly instead of queueing behind the monitor.
+# Everything else (POSTs, the monitor, background threads) uses the primary engine.
+# ------------------------------
+class RoutingSession(SignallingSession):
+    def __init__(self, db, **options):
+        self._db = db
+        SignallingSession.__init__(self, db, **options)
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if DB_READ_ONLY_ROUTES and has_request_context() and request.method in ("GET", "HEAD"):
+            engine = self._db.get_read_engine(self.app)
+            if engine is not None:
+                return engine
+        return SignallingSession.get_bind(self, mapper, clause)
+
+
+class ProfiledSQLAlchemy(SQLAlchemy):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._read_engines = {}
+        self._read_lock = threading.Lock()
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def create_engine(self, sa_url, engine_opts):
+        return apply_profile(create_engine(sa_url, **engine_opts))
+
+    def get_read_engine(self, app=None):
+        """The read-only engine for app's database, or None when it isn't a SQLite file."""
+        app = self.get_app(app)
+        engine = self._read_engines.get(app)
+        if engine is None and app not in self._read_engines:
+            with self._read_lock:
+                if app not in self._read_engines:
+                    url = self.get_engine(app).url   # path already resolved by Flask-SQLAlchemy
+                    opts = engine_options(url)
+                    self._read_engines[app] = (apply_profile(create_engine(url, **opts), read_only=True)
+                                               if opts else None)
+                engine = self._read_engines[app]
+        return engine
@@ -0,0 +1,330 @@
+import os, mmap, math, time, struct, threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.engine import make_url
+
+import metrics
+from app.models import db
+
+try:
+    import fcntl   # serialises file growth between monitor workers (POSIX only)
+except ImportError:
+    fcntl = None
+
+# ---- Hot tier (env)
+HOT_TIER_PATH   = os.getenv("HOT_TIER_PATH")                    # ring file; default: <sqlite file>.hot
+HOT_TIER_POINTS = int(os.getenv("HOT_TIER_POINTS", "1024"))     # newest checks kept per device; 0 = off
+
+STATUS_CODES = {"up": 0, "degraded": 1, "down": 2, "unreachable": 3}
+STATUSES = {v: k for k, v in STATUS_CODES.items()}
+UNKNOWN = 255
+
+EPOCH = datetime(1970, 1, 1)
+MAGIC = b"HOTT"
+VERSION = 2
+_FILE_HDR = struct.Struct("<4sIII")   # magic, version, capacity, record size; padded to 64 bytes
+_FILE_HDR_SIZE = 64
+_SLOT_HDR = struct.Struct("<QIIIq")   # seq, head (next write index), count, device_id, generation; padded to 32
+_SLOT_HDR_SIZE = 32
+_SEQ = struct.Struct("<Q")
+RECORD = struct.Struct("<qfB3x")      # created_at (epoch µs), latency_ms (NaN = none), status code
+_NAN = float("nan")
+READ_RETRY_S = 0.05   # a reader gives up on a slot that stays mid-write this long
+
+HOT_READS = metrics.counter("hot_tier_reads_total", "History reads by where they were served from", ("source",))
+
+
+def default_path(app):
+    if HOT_TIER_PATH:
+        return HOT_TIER_PATH
+    url = make_url(db.get_engine(app).url)   # relative paths already resolved by Flask-SQLAlchemy
+    if url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:"):
+        return url.database + ".hot"
+    return None
+
+def to_us(dt):
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return (dt - EPOCH) // timedelta(microseconds=1)
+
+def from_us(us):
+    return EPOCH + timedelta(microseconds=us)
+
+def generation(created_at):
+    """A device row's identity in the ring: its created_at (epoch µs), 0 when unset.
+    SQLite hands a deleted device's id out again, the creation time tells them apart."""
+    return 0 if created_at is None else to_us(created_at)
+
+@contextmanager
+def _flocked(f):
+    if fcntl:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+    try:
+        yield f
+    finally:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+# ------------------------------
+# Newest checks per device in one memory-mapped file, shared by processes.
+# Slot i (device id i) is a fixed-size ring of HOT_TIER_POINTS packed records,
+# so memory per device is bounded and a device's slot is found by arithmetic.
+# The monitor's writer appends each committed batch (one writer per device:
+# sharded workers own disjoint devices); web processes map the same file and
+# read slots without any SQL. A slot also records which device row filled it
+# (generation()): readers pass the generation of the device they look up and
+# treat any other as empty, so a reused id never shows its predecessor's history. Each slot has a seqlock: the writer makes the
+# sequence odd while it changes the slot and even again after, and a reader
+# retries when the sequence moved under it, so readers never see a torn batch
+# and never block the writer. The file lives on disk (the kernel writes the
+# pages back), so rings survive restarts; unused slots stay sparse.
+# ------------------------------
+class HotTier:
+    # capacity given: (re)create the file with that layout (the monitor's writer);
+    # otherwise the existing file is mapped on first use with the layout it has
+    def __init__(self, path, capacity=None, writable=False):
+        self.path = path
+        self.writable = writable
+        self._lock = threading.Lock()
+        self._f = None
+        self._mm = None
+        self._size = 0
+        self._checked = 0.0
+        self.capacity = capacity
+        self.generations = {}    # writer: device id -> generation, the devices it appends for (track())
+        self._restart = set()    # writer: devices whose ring starts over with their next batch
+        if capacity is not None:
+            self.writable = True
+            self._create(capacity)
+
+    # ---- layout
+    @property
+    def slot_size(self):
+        return _SLOT_HDR_SIZE + self.capacity * RECORD.size
+
+    def _slot(self, device_id):
+        return _FILE_HDR_SIZE + device_id * self.slot_size
+
+    def _create(self, capacity):
+        self._f = os.fdopen(os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644), "r+b")
+        header = _FILE_HDR.pack(MAGIC, VERSION, capacity, RECORD.size)
+        old = None
+        with _flocked(self._f):   # sharded workers start together
+            hdr = self._f.read(_FILE_HDR.size)
+            if len(hdr) < _FILE_HDR.size:   # new file: nobody has mapped it yet
+                self._f.truncate(_FILE_HDR_SIZE)
+                self._f.seek(0)
+                self._f.write(header)
+                self._f.flush()
+            elif hdr != header:
+                cap = _FILE_HDR.unpack(hdr)[2]
+                print(f"[hot] {self.path}: layout changed (capacity {cap} -> {capacity}), starting empty", flush=True)
+                # a new file renamed over the old one: web processes still map the old
+                # inode, and truncating that under them would crash them (SIGBUS)
+                tmp = self.path + ".new"
+                with open(tmp, "wb") as f:
+                    f.write(header.ljust(_FILE_HDR_SIZE, b"\0"))
+                os.replace(tmp, self.path)
+                old, self._f = self._f, open(self.path, "r+b")
+        if old is not None:
+            old.close()
+        self._remap()
+
+    def _attach(self):
+        # map an existing file with the layout it was created with (the monitor's
+        # HOT_TIER_POINTS wins over this process's); False while there is no file yet
+        try:
+            f = open(self.path, "r+b" if self.writable else "rb")
+        except FileNotFoundError:
+            return False
+        hdr = f.read(_FILE_HDR.size)
+        if len(hdr) < _FILE_HDR.size:
+            f.close()
+            return False
+        magic, version, cap, rec = _FILE_HDR.unpack(hdr)
+        if magic != MAGIC or version != VERSION or rec != RECORD.size:
+            f.close()
+            return False
+        self._f, self.capacity = f, cap
+        self._remap()
+        return True
+
+    def _replaced(self):
+        # the monitor started with another HOT_TIER_POINTS and swapped the file
+        try:
+            return os.stat(self.path).st_ino != os.fstat(self._f.fileno()).st_ino
+        except FileNotFoundError:
+            return False
+
+    def _remap(self):
+        size = os.fstat(self._f.fileno()).st_size
+        if self._mm is not None and size == self._size:
+            return
+        # the old map is dropped, not closed: a reader thread may still be copying from it
+        access = mmap.ACCESS_WRITE if self.writable else mmap.ACCESS_READ
+        self._mm = mmap.mmap(self._f.fileno(), size, access=access)
+        self._size = size
+
+    def _grow(self, device_id):
+        # room for this device (and some more): extend the file, never shrink it
+        need = self._slot(device_id + 1)
+        with _flocked(self._f):
+            if os.fstat(self._f.fileno()).st_size < need:
+                self._f.truncate(self._slot(max(device_id + 1, (device_id + 1) * 5 // 4)))
+        self._remap()
+
+    def close(self):
+        with self._lock:
+            if self._mm is not None:
+                self._mm.close()
+            if self._f is not None:
+                self._f.close()
+            self._mm = self._f = None
+
+    # ---- writer (monitor)
+    def track(self, generations, restart_new=False):
+        """Set the devices this writer appends for ({id: generation}); rows for others are
+        skipped. With restart_new, a device not tracked before starts its ring over: another
+        worker may have checked it meanwhile and the ring would miss those checks."""
+        with self._lock:
+            if restart_new:
+                self._restart.update(i for i in generations if i not in self.generations)
+            self._restart.intersection_update(generations)
+            self.generations = dict(generations)
+
+    def append(self, rows):
+        """Add committed check_results rows (dicts from the ResultWriter) to their rings."""
+        with self._lock:
+            by_device = {}
+            for r in rows:
+                if r["device_id"] in self.generations:   # not a device deleted while its rows were buffered
+                    by_device.setdefault(r["device_id"], []).append(r)
+            if not by_device:
+                return
+            top = max(by_device)
+            if self._slot(top + 1) > self._size:
+                self._grow(top)
+            mm, cap = self._mm, self.capacity
+            for device_id, dev_rows in by_device.items():
+                dev_rows = dev_rows[-cap:]
+                n = len(dev_rows)
+                packed = b"".join(RECORD.pack(to_us(r["created_at"]),
+                                              _NAN if r.get("latency_ms") is None else r["latency_ms"],
+                                              STATUS_CODES.get(r.get("status"), UNKNOWN))
+                                  for r in dev_rows)
+                base = self._slot(device_id)
+                data = base + _SLOT_HDR_SIZE
+                gen = self.generations[device_id]
+                seq, head, count, owner, slot_gen = _SLOT_HDR.unpack_from(mm, base)
+                if owner != device_id or slot_gen != gen or seq & 1 or device_id in self._restart:
+                    # never written, a reused id, a writer that died mid-batch, or taken over
+                    head = count = 0
+                    seq += seq & 1
+                    self._restart.discard(device_id)
+                # odd sequence while the slot changes: two memcpys at most (the ring may wrap)
+                _SEQ.pack_into(mm, base, seq + 1)
+                first = min(n, cap - head) * RECORD.size
+                mm[data + head * RECORD.size:data + head * RECORD.size + first] = packed[:first]
+                if first < len(packed):
+                    mm[data:data + len(packed) - first] = packed[first:]
+                _SLOT_HDR.pack_into(mm, base, seq + 2, (head + n) % cap, min(count + n, cap), device_id, gen)
+
+    def clear(self, device_id):
+        with self._lock:
+            if self._f is None and not self._attach():
+                return
+            if self._slot(device_id + 1) > self._size:
+                return
+            base = self._slot(device_id)
+            seq = _SEQ.unpack_from(self._mm, base)[0]
+            seq += seq & 1
+            _SEQ.pack_into(self._mm, base, seq + 1)
+            _SLOT_HDR.pack_into(self._mm, base, seq + 2, 0, 0, 0, 0)
+
+    # ---- readers (web)
+    def read(self, device_id, generation=None):
+        """Consistent copy of a device's ring, oldest first: [(epoch µs, status code, latency or None)].
+        With generation given, a ring filled for another row with this id reads as empty."""
+        with self._lock:
+            if self._f is not None and time.monotonic() - self._checked > 1.0:
+                self._checked = time.monotonic()
+                if self._replaced():
+                    self._f, self._mm, self._size = None, None, 0   # old map left to in-flight reads
+            if self._f is None and not self._attach():
+                return []
+            if self._slot(device_id + 1) > self._size:
+                self._remap()   # the monitor may have grown the file
+                if self._slot(device_id + 1) > self._size:
+                    return []
+            mm, cap = self._mm, self.capacity
+        base = self._slot(device_id)
+        data = base + _SLOT_HDR_SIZE
+        deadline = time.monotonic() + READ_RETRY_S
+        while True:
+            seq, head, count, owner, slot_gen = _SLOT_HDR.unpack_from(mm, base)
+            if not seq & 1:
+                if owner != device_id or not count or generation not in (None, slot_gen):
+                    return []
+                if count < cap:
+                    buf = mm[data:data + count * RECORD.size]
+                else:   # full ring: oldest record is at head
+                    split = data + head * RECORD.size
+                    buf = mm[split:data + cap * RECORD.size] + mm[data:split]
+                if _SEQ.unpack_from(mm, base)[0] == seq:
+                    break
+            if time.monotonic() > deadline:
+                return []   # writer stuck mid-batch (or died there): let the database answer
+            time.sleep(0)   # the writer may be a thread of this process waiting for the GIL
+        # float32 holds the probes' 3-decimal milliseconds exactly once rounded back
+        return [(us, code, None if math.isnan(lat) else round(lat, 3)) for us, lat, code in RECORD.iter_unpack(buf)]
+
+    def window(self, device_id, generation, start=None, end=None, limit=None, newest=False, latest=None):
+        """Checks in [start, end] if the ring covers that range, else None (ask the database).
+
+        generation is the device row's generation(); latest the created_at of its
+        device_latest_status row: a ring without that check has stopped being
+        written (the device moved to another shard worker) and is not used.
+        With start given, the ring must reach back to it; without, it must hold
+        `limit` checks up to `end` (the newest `limit`, oldest first, when newest=True).
+        """
+        recs = self.read(device_id, generation)
+        s = None if start is None else to_us(start)
+        e = None if end is None else to_us(end)
+        if not recs or (s is not None and recs[0][0] > s) or (latest is not None and recs[-1][0] < to_us(latest)):
+            HOT_READS.labels("database").inc()
+            return None
+        hit = [r for r in recs if (s is None or r[0] >= s) and (e is None or r[0] <= e)]
+        if s is None:
+            if limit is None or len(hit) < limit:
+                HOT_READS.labels("database").inc()
+                return None
+        if limit is not None:
+            hit = hit[-limit:] if newest else hit[:limit]
+        HOT_READS.labels("hot").inc()
+        return hit
+
+
+def open_reader(app):
+    """This web process's read-only view of the hot tier, or None when it is off."""
+    hot = app.extensions.get("hot_tier", False)
+    if hot is False:
+        path = default_path(app)
+        hot = app.extensions["hot_tier"] = HotTier(path) if path and HOT_TIER_POINTS > 0 else None
+    return hot
+
+def forget(app, device_id):
+    """Empty a deleted device's ring: SQLite hands the highest rowid out again."""
+    path = default_path(app)
+    if not path:
+        return
+    hot = HotTier(path, writable=True)
+    hot.clear(device_id)
+    hot.close()
+
+def open_writer(app):
+    path = default_path(app)
+    if not path or HOT_TIER_POINTS <= 0:
+        return None
+    return HotTier(path, capacity=HOT_TIER_POINTS)
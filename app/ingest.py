@@ -0,0 +1,204 @@
+import os, sys, json, math, time, zlib, hmac, atexit, hashlib, secrets
+from datetime import timedelta
+
+from flask import abort, current_app
+from sqlalchemy import asc, desc, func
+
+import metrics
+from app.models import db, Device, HostSample
+from app.rollups import EPOCH, epoch_ms
+from result_writer import ResultWriter
+
+# ---- Push ingestion (env)
+INGEST_MAX_BYTES   = int(os.getenv("INGEST_MAX_BYTES", str(8 << 20)))  # request body, after decompression
+INGEST_MAX_SAMPLES = int(os.getenv("INGEST_MAX_SAMPLES", "20000"))     # per request
+INGEST_QUEUE_MAX   = int(os.getenv("INGEST_QUEUE_MAX", "100000"))      # samples waiting for the writer
+INGEST_QUEUE_WAIT_S = float(os.getenv("INGEST_QUEUE_WAIT_S", "2"))     # queue still full after this -> 503
+INGEST_MAX_AGE_S   = float(os.getenv("INGEST_MAX_AGE_S", "86400"))     # older samples are rejected...
+INGEST_MAX_SKEW_S  = float(os.getenv("INGEST_MAX_SKEW_S", "300"))      # ...and ones further in the future
+
+INGEST_SAMPLES = metrics.counter("ingest_samples_total", "Pushed host samples", ("result",))
+INGEST_DEVICES_REJECTED = metrics.counter("ingest_devices_rejected_total",
+                                          "Device groups in a push refused (unknown device or bad token)")
+
+
+def hash_token(token):
+    # tokens are random 192-bit strings, so a plain digest is enough (no slow KDF needed)
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def issue_token(device):
+    """Give device a new push token; only its hash is stored. Caller commits."""
+    token = secrets.token_urlsafe(24)
+    device.ingest_token_hash = hash_token(token)
+    return token
+
+def sample_writer(app=None):
+    # one writer thread per web process, started on the first push
+    app = app or current_app._get_current_object()
+    w = app.extensions.get("sample_writer")
+    if w is None:
+        w = app.extensions["sample_writer"] = ResultWriter(app, max_queue=INGEST_QUEUE_MAX,
+                                                           table=HostSample.__table__)
+        atexit.register(w.close)
+    return w
+
+
+# ------------------------------
+# Request body: JSON, optionally Content-Encoding: gzip
+#   {"devices": [{"id": 12, "token": "...", "samples": [[ts, cpu, mem], ...]}, ...]}
+# ts is epoch seconds (UTC), cpu/mem are percentages or null. One request may carry
+# many devices; each group is authenticated with its own device's token.
+# ------------------------------
+def decode_body(raw, encoding):
+    if len(raw) > INGEST_MAX_BYTES:
+        abort(413, description=f"body larger than {INGEST_MAX_BYTES} bytes")
+    encoding = (encoding or "identity").strip().lower()
+    if encoding == "gzip":
+        d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            # bounded: a few KB of gzip can expand to gigabytes
+            raw = d.decompress(raw, INGEST_MAX_BYTES + 1)
+        except zlib.error:
+            abort(400, description="invalid gzip body")
+        if len(raw) > INGEST_MAX_BYTES:
+            abort(413, description=f"body larger than {INGEST_MAX_BYTES} bytes uncompressed")
+    elif encoding != "identity":
+        abort(415, description=f"unsupported Content-Encoding {encoding}")
+    try:
+        payload = json.loads(raw)
+    except ValueError:
+        abort(400, description="body is not JSON")
+    groups = payload.get("devices") if isinstance(payload, dict) else None
+    if not isinstance(groups, list):
+        abort(400, description='expected {"devices": [...]}')
+    return groups
+
+def _percent(v):
+    if v is None:
+        return None
+    if isinstance(v, bool) or not isinstance(v, (int, float)) or not 0 <= v <= 100:
+        raise ValueError(v)
+    return float(v)
+
+def _token_hashes(ids):
+    out = {}
+    ids = list(ids)
+    for i in range(0, len(ids), 500):
+        out.update(db.session.query(Device.id, Device.ingest_token_hash).filter(Device.id.in_(ids[i:i + 500])))
+    return out
+
+def parse_groups(groups, now=None):
+    """Authenticate and validate a decoded batch.
+
+    Returns (rows for host_samples, rejected sample count, [{"id", "error"}] for refused groups).
+    """
+    now = now or time.time()
+    lo, hi = now - INGEST_MAX_AGE_S, now + INGEST_MAX_SKEW_S
+    ids = {g.get("id") for g in groups if isinstance(g, dict) and isinstance(g.get("id"), int)}
+    hashes = _token_hashes(ids) if ids else {}
+
+    rows, rejected, errors = [], 0, []
+    for g in groups:
+        device_id = g.get("id") if isinstance(g, dict) else None
+        token = g.get("token") if isinstance(g, dict) else None
+        samples = g.get("samples") if isinstance(g, dict) else None
+        stored = hashes.get(device_id) if isinstance(device_id, int) else None
+        if not isinstance(samples, list):
+            errors.append({"id": device_id, "error": "samples must be a list"})
+            continue
+        if not stored or not isinstance(token, str) or not hmac.compare_digest(stored, hash_token(token)):
+            # same answer for unknown devices and bad tokens
+            errors.append({"id": device_id, "error": "unknown device or bad token"})
+            rejected += len(samples)
+            continue
+        for s in samples:
+            try:
+                ts, cpu, mem = s
+                ts = float(ts)
+                if not lo <= ts <= hi:
+                    raise ValueError(ts)
+                rows.append({"device_id": device_id, "created_at": EPOCH + timedelta(seconds=ts),
+                             "cpu_percent": _percent(cpu), "mem_percent": _percent(mem)})
+            except (TypeError, ValueError, OverflowError):   # float() of an integer beyond double range
+                rejected += 1
+    return rows, rejected, errors
+
+def enqueue(rows, app=None):
+    """Hand rows to the sample writer; False if it stayed full for INGEST_QUEUE_WAIT_S."""
+    w = sample_writer(app)
+    deadline = time.monotonic() + INGEST_QUEUE_WAIT_S
+    # all or nothing: an agent that gets a 503 resends the whole batch
+    while w.qsize() + len(rows) > w.max_queue:
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.02)
+    for r in rows:
+        w.put(r)
+    return True
+
+def ingest(raw, encoding):
+    """POST /api/ingest: returns (response dict, HTTP status)."""
+    groups = decode_body(raw, encoding)
+    rows, rejected, errors = parse_groups(groups)
+    if len(rows) > min(INGEST_MAX_SAMPLES, INGEST_QUEUE_MAX):
+        abort(413, description=f"more than {INGEST_MAX_SAMPLES} samples in one request")
+    if errors:
+        INGEST_DEVICES_REJECTED.inc(len(errors))
+    if groups and len(errors) == len(groups):
+        INGEST_SAMPLES.labels("rejected").inc(rejected)
+        return {"accepted": 0, "rejected": rejected, "errors": errors}, 401
+    if rows and not enqueue(rows):
+        abort(503, description="ingest queue full, retry later")
+    INGEST_SAMPLES.labels("accepted").inc(len(rows))
+    if rejected:
+        INGEST_SAMPLES.labels("rejected").inc(rejected)
+    return {"accepted": len(rows), "rejected": rejected, "errors": errors}, 202
+
+
+# ------------------------------
+# Chart data: samples in [start, end] averaged into at most `limit` buckets
+# (all in SQL), or the newest `limit` samples when no range is known
+# ------------------------------
+def chart_points(device_id, start=None, end=None, limit=200):
+    ms = epoch_ms(HostSample.created_at)
+    q = db.session.query(HostSample.created_at, HostSample.cpu_percent, HostSample.mem_percent) \
+        .filter(HostSample.device_id == device_id)
+    if start is None or end is None or ms is None or end <= start:
+        if start is not None:
+            q = q.filter(HostSample.created_at >= start)
+        if end is not None:
+            q = q.filter(HostSample.created_at <= end)
+        return list(reversed(q.order_by(desc(HostSample.created_at)).limit(limit).all()))
+
+    width = max(1000, math.ceil((end - start).total_seconds() * 1000 / limit))
+    bucket = ms / width
+    rows = (
+        db.session.query(func.min(ms), func.avg(HostSample.cpu_percent), func.avg(HostSample.mem_percent))
+        .filter(HostSample.device_id == device_id,
+                HostSample.created_at >= start, HostSample.created_at <= end)
+        .group_by(bucket)
+        .order_by(asc(bucket))
+        .all()
+    )
+    return [(EPOCH + timedelta(milliseconds=t), cpu, mem) for t, cpu, mem in rows]
+
+
+if __name__ == "__main__":
+    # python -m app.ingest --token DEVICE_ID [DEVICE_ID ...]    new push token(s), printed once
+    # python -m app.ingest --revoke DEVICE_ID [DEVICE_ID ...]
+    from app import create_app
+    if len(sys.argv) < 3 or sys.argv[1] not in ("--token", "--revoke"):
+        sys.exit("usage: python -m app.ingest --token|--revoke DEVICE_ID [DEVICE_ID ...]")
+    app = create_app()
+    with app.app_context():
+        for arg in sys.argv[2:]:
+            device = Device.query.get(int(arg))
+            if device is None:
+                print(f"{arg}: no such device", file=sys.stderr)
+                continue
+            if sys.argv[1] == "--token":
+                print(f"{device.id}\t{issue_token(device)}")
+            else:
+                device.ingest_token_hash = None
+                print(f"{device.id}\trevoked", file=sys.stderr)
+        db.session.commit()
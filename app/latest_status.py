@@ -0,0 +1,59 @@
+from datetime import datetime, timezone
+
+from sqlalchemy import func, and_, exists
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.models import db, CheckResult, DeviceLatestStatus
+
+_COLS = ("status", "latency_ms", "message", "created_at",
+         "confirmed_status", "flapping", "flap_pct", "suppressed")
+_UPSERT = {"sqlite": sqlite_insert, "postgresql": pg_insert}
+
+
+# Upsert the newest of `rows` (CheckResult dicts, in write order) per device.
+# Runs inside the caller's transaction; commit is left to the caller.
+def upsert_latest(rows):
+    last = {}
+    for r in rows:
+        last[r["device_id"]] = r
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    values = [{"device_id": i, "updated_at": now, **{c: r.get(c) for c in _COLS}} for i, r in last.items()]
+    if not values:
+        return
+
+    table = DeviceLatestStatus.__table__
+    insert = _UPSERT.get(db.engine.dialect.name)
+    if insert is None:
+        for v in values:
+            db.session.merge(DeviceLatestStatus(**v))
+        return
+    stmt = insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.device_id],
+        set_={c: stmt.excluded[c] for c in _COLS + ("updated_at",)},
+        # never let a late/out-of-order batch move a device back in time
+        where=stmt.excluded.created_at >= table.c.created_at,
+    )
+    db.session.execute(stmt, values)
+
+# One-off fill for databases that predate the table: newest check_results row per device.
+def backfill_latest_status():
+    if db.session.query(exists().where(DeviceLatestStatus.device_id.isnot(None))).scalar():
+        return 0
+    latest = (
+        db.session.query(CheckResult.device_id, func.max(CheckResult.created_at).label("ts"))
+        .group_by(CheckResult.device_id)
+        .subquery()
+    )
+    rows = (
+        db.session.query(CheckResult.device_id, CheckResult.status, CheckResult.latency_ms,
+                         CheckResult.message, CheckResult.created_at)
+        .join(latest, and_(CheckResult.device_id == latest.c.device_id,
+                           CheckResult.created_at == latest.c.ts))
+        .order_by(CheckResult.id.asc())
+        .all()
+    )
+    upsert_latest([r._asdict() for r in rows])
+    db.session.commit()
+    return len(rows)
@@ -0,0 +1,176 @@
+import os, json, time, queue, threading
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func
+
+import metrics
+from app.models import db, Device, DeviceLatestStatus
+
+# ---- Live stream tuning (env)
+STREAM_POLL_MS     = int(os.getenv("STREAM_POLL_MS", "1000"))      # how often the hub looks for new results
+STREAM_KEEPALIVE_S = float(os.getenv("STREAM_KEEPALIVE_S", "15"))  # comment line so proxies keep the stream open
+STREAM_QUEUE_MAX   = int(os.getenv("STREAM_QUEUE_MAX", "64"))      # undelivered events per client before it is dropped
+STREAM_MAX_CLIENTS = int(os.getenv("STREAM_MAX_CLIENTS", "1000"))
+STREAM_RESYNC_S    = float(os.getenv("STREAM_RESYNC_S", "60"))     # full re-read, for rows committed after the overlap window
+STREAM_OVERLAP_S   = 5.0   # re-read this far behind the watermark: writers commit a little after they stamp
+
+STREAM_DROPPED = metrics.counter("stream_clients_dropped_total", "Stream clients cut off for falling behind")
+STREAM_EVENTS = metrics.counter("stream_events_total", "Events broadcast by the change hub", ("event",))
+
+def _now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def last_check_str(dt):
+    return dt.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC") if dt else None
+
+# Cheap fingerprint of everything /api/devices returns: the device set, its last
+# edit and the newest write to device_latest_status (all served from indexes)
+def _devices_marker():
+    n, max_id, edited = db.session.query(func.count(Device.id), func.max(Device.id),
+                                         func.max(Device.updated_at)).one()
+    return n, max_id or 0, edited.isoformat() if edited else 0
+
+def devices_etag():
+    n, max_id, edited = _devices_marker()
+    n_latest, newest = db.session.query(func.count(DeviceLatestStatus.device_id),
+                                        func.max(DeviceLatestStatus.updated_at)).one()
+    return f"d{n}-{max_id}-{edited}-{n_latest}-{newest.isoformat() if newest else 0}"
+
+
+class _Client:
+    def __init__(self):
+        self.q = queue.Queue(maxsize=STREAM_QUEUE_MAX)
+        self.closed = False
+
+
+# ------------------------------
+# One change feed per web process, shared by every open /api/stream.
+# A single thread polls device_latest_status for rows the monitor wrote since
+# the last look (index on updated_at), diffs them against the last state it
+# sent and fans the changed devices out to each client's queue. Clients that
+# fall STREAM_QUEUE_MAX events behind are disconnected; EventSource reconnects
+# and the page re-reads the snapshot. The thread idles while nobody listens.
+# A row committed more than STREAM_OVERLAP_S after its updated_at stamp is
+# behind the window by the time it is visible, so every STREAM_RESYNC_S (and
+# whenever the device set changes) the whole table is read and diffed instead;
+# that pass also forgets deleted devices.
+# ------------------------------
+class ChangeHub:
+    def __init__(self, app):
+        self.app = app
+        self.seq = 0                 # id of the last event broadcast
+        self._clients = set()
+        self._lock = threading.Lock()
+        self._listeners = threading.Event()
+        self._thread = None
+        self._state = {}             # device_id -> (status, latency_ms, flapping) last broadcast
+        self._devices = None         # (count, max id, last edit) of the devices table
+        self._watermark = None
+        self._resynced = 0.0         # monotonic time of the last full read
+        self.polls = 0
+        self.dropped = 0
+        metrics.gauge("stream_clients", "Open /api/stream connections", lambda: self.clients)
+
+    def subscribe(self):
+        with self._lock:
+            if len(self._clients) >= STREAM_MAX_CLIENTS:
+                return None
+            c = _Client()
+            self._clients.add(c)
+            self._listeners.set()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="stream-hub", daemon=True)
+                self._thread.start()
+        return c
+
+    def unsubscribe(self, c):
+        with self._lock:
+            c.closed = True
+            self._clients.discard(c)
+            if not self._clients:
+                self._listeners.clear()
+
+    @property
+    def clients(self):
+        return len(self._clients)
+
+    def _broadcast(self, event, data):
+        with self._lock:
+            self.seq += 1
+            STREAM_EVENTS.labels(event).inc()
+            # serialised once, every client gets the same string
+            msg = f"id: {self.seq}\nevent: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+            for c in list(self._clients):
+                try:
+                    c.q.put_nowait(msg)
+                except queue.Full:
+                    # too slow: cut it loose rather than buffer without bound
+                    c.closed = True
+                    self._clients.discard(c)
+                    self.dropped += 1
+                    STREAM_DROPPED.inc()
+            if not self._clients:
+                self._listeners.clear()
+
+    def _run(self):
+        while True:
+            self._listeners.wait()
+            t0 = time.monotonic()
+            try:
+                with self.app.app_context():
+                    self.poll()
+            except Exception as e:
+                print(f"[stream] poll failed: {e}", flush=True)
+            time.sleep(max(0.0, STREAM_POLL_MS / 1000.0 - (time.monotonic() - t0)))
+
+    # One look at the tables; broadcasts what changed. Needs an app context.
+    def poll(self):
+        self.polls += 1
+        devices = _devices_marker()
+        if self._watermark is None:
+            # first poll: remember the current state, clients read it from /api/devices
+            self._devices = devices
+            self._watermark = db.session.query(func.max(DeviceLatestStatus.updated_at)).scalar() or _now()
+            self._state = {
+                i: (s, lat, bool(f)) for i, s, lat, f in db.session.query(
+                    DeviceLatestStatus.device_id, DeviceLatestStatus.status,
+                    DeviceLatestStatus.latency_ms, DeviceLatestStatus.flapping)
+            }
+            self._resynced = time.monotonic()
+            db.session.rollback()
+            return
+        full = time.monotonic() - self._resynced >= STREAM_RESYNC_S
+        if devices != self._devices:
+            self._devices = devices
+            self._broadcast("devices", {"count": devices[0]})
+            full = True
+
+        q = db.session.query(DeviceLatestStatus.device_id, DeviceLatestStatus.status,
+                             DeviceLatestStatus.latency_ms, DeviceLatestStatus.flapping,
+                             DeviceLatestStatus.suppressed, DeviceLatestStatus.created_at,
+                             DeviceLatestStatus.updated_at)
+        if full:
+            self._resynced = time.monotonic()
+        else:
+            q = q.filter(DeviceLatestStatus.updated_at > self._watermark - timedelta(seconds=STREAM_OVERLAP_S))
+        rows = q.all()
+        db.session.rollback()
+        if full:
+            # deleted devices have no row left: drop them so the map tracks the live set
+            present = {r[0] for r in rows}
+            for i in [i for i in self._state if i not in present]:
+                del self._state[i]
+        changes = []
+        for device_id, status, latency, flapping, suppressed, created_at, updated_at in rows:
+            if updated_at is not None and updated_at > self._watermark:
+                self._watermark = updated_at
+            # only status/latency/flapping changes are pushed; a re-read of the overlap window sends nothing
+            cur = (status, latency, bool(flapping))
+            if self._state.get(device_id) == cur:
+                continue
+            self._state[device_id] = cur
+            changes.append({"id": device_id, "status": status, "latency_ms": latency,
+                            "flapping": bool(flapping), "suppressed_alerts": suppressed or 0,
+                            "last_check": last_check_str(created_at)})
+        if changes:
+            self._broadcast("delta", changes)
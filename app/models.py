@@ -1,6 +1,9 @@
-from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import inspect, text
 from datetime import datetime, timezone
-db = SQLAlchemy()
+from .db_profile import ProfiledSQLAlchemy
+
+# WAL/pool profile and read-only routing for web GETs: see db_profile.py
+db = ProfiledSQLAlchemy()
 
 
 # -- Simple app-wide settings store
@@ -11,24 +14,171 @@ class Config(db.Model):
 # -- Devices to monitor
 class Device(db.Model):
     __tablename__ = "devices"
+    __table_args__ = (
+        db.Index("ix_devices_updated_at", "updated_at"),   # max() = last edit, for ETags and /api/stream
+    )
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(120), nullable=False)
     host = db.Column(db.String(255), nullable=False)
     kind = db.Column(db.String(50), default="generic")
     enabled = db.Column(db.Boolean, default=True)
+    interval_s = db.Column(db.Integer)  # per-device check interval; NULL = INTERVAL_SECONDS
+    ingest_token_hash = db.Column(db.String(64))  # sha256 of the host agent's push token (app/ingest.py)
+    # upstream device (switch, uplink) it is reached through; NULL = none. Kept acyclic by
+    # app/topology.py: while the parent is down this device is not probed but marked unreachable
+    parent_id = db.Column(db.Integer, db.ForeignKey("devices.id"))
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
+    # UTC time of the last insert/UPDATE through SQLAlchemy (ORM or Core), so edits show up in
+    # devices_etag() and the stream's device poll; NULL for rows older than the column
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc),
+                           onupdate=lambda: datetime.now(timezone.utc))
 
 class CheckResult(db.Model):
     __tablename__ = "check_results"
+    __table_args__ = (
+        # every history read filters on a device and orders by time
+        db.Index("ix_check_results_device_created", "device_id", "created_at"),
+        # time-window scans across all devices (rollups)
+        db.Index("ix_check_results_created", "created_at"),
+    )
     id = db.Column(db.Integer, primary_key=True)
     device_id = db.Column(db.Integer, db.ForeignKey("devices.id"), nullable=False)
-    status = db.Column(db.String(20), nullable=False)  # up|down|degraded
-    latency_ms = db.Column(db.Integer)
+    status = db.Column(db.String(20), nullable=False)  # up|down|degraded|unreachable (behind a down parent)
+    latency_ms = db.Column(db.Float)  # ICMP RTTs are sub-millisecond
+    # HTTP phase timings in ms (see http_pool.py); latency_ms is the total
+    dns_ms = db.Column(db.Float)
+    connect_ms = db.Column(db.Float)
+    tls_ms = db.Column(db.Float)
+    ttfb_ms = db.Column(db.Float)
     cpu_percent = db.Column(db.Float)  # (optional for now)
     mem_percent = db.Column(db.Float)
     message = db.Column(db.String(500))
     created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc))
     device = db.relationship("Device", backref="checks")
 
+# -- CPU/memory samples pushed by host agents (POST /api/ingest, app/ingest.py);
+#    a table of their own so they never count as checks (uptime, rollups, alerts)
+class HostSample(db.Model):
+    __tablename__ = "host_samples"
+    __table_args__ = (
+        db.Index("ix_host_samples_device_created", "device_id", "created_at"),
+        db.Index("ix_host_samples_created", "created_at"),   # retention
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    device_id = db.Column(db.Integer, db.ForeignKey("devices.id"), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)  # UTC, taken on the host
+    cpu_percent = db.Column(db.Float)
+    mem_percent = db.Column(db.Float)
+
+# -- Latest result per device, maintained by the monitor on every write so the
+#    dashboard and /api/devices need one join instead of a query per device
+class DeviceLatestStatus(db.Model):
+    __tablename__ = "device_latest_status"
+    __table_args__ = (
+        db.Index("ix_device_latest_status_updated_at", "updated_at"),
+    )
+    device_id = db.Column(db.Integer, db.ForeignKey("devices.id"), primary_key=True)
+    status = db.Column(db.String(20), nullable=False)
+    latency_ms = db.Column(db.Float)
+    message = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime)  # time of the check this row mirrors
+    updated_at = db.Column(db.DateTime)  # UTC time the monitor wrote it (change feed for /api/stream)
+    # status state machine (last_state.py): status is the newest check, confirmed_status the
+    # one alerted on; suppressed = changes not alerted while flapping (current/last episode)
+    confirmed_status = db.Column(db.String(20))
+    flapping = db.Column(db.Boolean, default=False)
+    flap_pct = db.Column(db.Float)
+    suppressed = db.Column(db.Integer, default=0)
+
+# -- Pre-aggregated history: one row per device per bucket (1m / 1h / 1d),
+#    filled incrementally by app/rollups.py
+class CheckRollup(db.Model):
+    __tablename__ = "check_rollups"
+    __table_args__ = (
+        db.Index("ix_check_rollups_resolution_bucket", "resolution", "bucket_start"),
+        # buckets with failed checks only, covering: outage runs for uptime reports (app/reports.py)
+        db.Index("ix_check_rollups_down", "resolution", "bucket_start", "device_id", "down_count",
+                 sqlite_where=db.text("down_count > 0"), postgresql_where=db.text("down_count > 0")),
+    )
+    resolution = db.Column(db.Integer, primary_key=True)  # bucket width in seconds
+    device_id = db.Column(db.Integer, db.ForeignKey("devices.id"), primary_key=True)
+    bucket_start = db.Column(db.DateTime, primary_key=True)  # UTC
+    count = db.Column(db.Integer, nullable=False)
+    up_count = db.Column(db.Integer, nullable=False, default=0)
+    down_count = db.Column(db.Integer, nullable=False, default=0)
+    degraded_count = db.Column(db.Integer, nullable=False, default=0)
+    latency_count = db.Column(db.Integer, nullable=False, default=0)  # checks that had a latency
+    latency_min = db.Column(db.Float)
+    latency_max = db.Column(db.Float)
+    latency_avg = db.Column(db.Float)
+    latency_p95 = db.Column(db.Float)
+
+# -- Sharded monitor workers (see sharding.py): one row per live worker process,
+#    kept fresh by its heartbeat; workers whose lease ran out own no devices
+class MonitorWorker(db.Model):
+    __tablename__ = "monitor_workers"
+    worker_id = db.Column(db.String(120), primary_key=True)
+    hostname = db.Column(db.String(255))
+    pid = db.Column(db.Integer)
+    started_at = db.Column(db.DateTime)
+    active_from = db.Column(db.DateTime)   # owns devices from here (started_at + settle delay)
+    active_until = db.Column(db.DateTime)  # set on a clean shutdown; owns nothing after it
+    heartbeat_at = db.Column(db.DateTime, nullable=False)  # UTC
+    devices = db.Column(db.Integer)  # devices owned at the last heartbeat (for display)
+
+# -- Alerts waiting for (or done with) delivery, one row per channel per state change;
+#    written and drained by the monitor's AlertDispatcher (alert_dispatch.py)
+class AlertOutbox(db.Model):
+    __tablename__ = "alert_outbox"
+    __table_args__ = (
+        db.Index("ix_alert_outbox_pending", "owner", "channel", "state", "next_attempt_at"),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    owner = db.Column(db.String(120), nullable=False)    # monitor worker that delivers it
+    channel = db.Column(db.String(20), nullable=False)   # telegram|email
+    device_id = db.Column(db.Integer)                    # no FK: the device may be deleted meanwhile
+    subject = db.Column(db.String(255))
+    body = db.Column(db.Text, nullable=False)
+    state = db.Column(db.String(10), nullable=False, default="pending")  # pending|sent|failed|skipped
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.String(500))
+    created_at = db.Column(db.DateTime, nullable=False)  # UTC
+    next_attempt_at = db.Column(db.DateTime, nullable=False)
+    sent_at = db.Column(db.DateTime)
+
+def _add_missing_columns():
+    # create_all() never alters existing tables, so add new nullable columns by hand
+    insp = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if not insp.has_table(table.name):
+            continue
+        have = {c["name"] for c in insp.get_columns(table.name)}
+        for col in table.columns:
+            if col.name not in have:
+                col_type = col.type.compile(dialect=db.engine.dialect)
+                db.session.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {col.name} {col_type}"))
+    db.session.commit()
+
+def _create_missing_indexes():
+    # same story for indexes declared after a table already exists
+    insp = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if not insp.has_table(table.name):
+            continue
+        have = {ix["name"] for ix in insp.get_indexes(table.name)}
+        for ix in table.indexes:
+            if ix.name not in have:
+                print(f"[db] creating index {ix.name} on {table.name} (may take a while on big tables)", flush=True)
+                ix.create(bind=db.engine)
+
 def migrate_db_if_needed():
+    if db.engine.dialect.name == "sqlite":
+        with db.engine.begin() as conn:
+            if not inspect(conn).get_table_names():
+                # brand-new file: let retention hand freed pages back (PRAGMA incremental_vacuum);
+                # only possible before the first table exists, hence the same connection
+                conn.exec_driver_sql("PRAGMA auto_vacuum=INCREMENTAL")
+                db.metadata.create_all(bind=conn)
     db.create_all()
+    _add_missing_columns()
+    _create_missing_indexes()
@@ -0,0 +1,198 @@
+import os, sys, time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import tuple_
+
+from app.models import db, CheckResult, CheckRollup, DeviceLatestStatus, AlertOutbox, HostSample
+from app.rollups import TIERS, get_watermark
+
+# ---- Retention policy (env); 0 = keep forever
+RETAIN_RAW_DAYS = float(os.getenv("RETAIN_RAW_DAYS", "7"))
+RETAIN_1M_DAYS  = float(os.getenv("RETAIN_1M_DAYS", "30"))
+RETAIN_1H_DAYS  = float(os.getenv("RETAIN_1H_DAYS", "365"))
+RETAIN_1D_DAYS  = float(os.getenv("RETAIN_1D_DAYS", "0"))
+RETAIN_ALERTS_DAYS = float(os.getenv("RETAIN_ALERTS_DAYS", "30"))   # delivered/failed alert_outbox rows
+RETAIN_SAMPLES_DAYS = float(os.getenv("RETAIN_SAMPLES_DAYS", "7"))   # pushed host CPU/memory samples
+
+# ---- Compaction tuning (env)
+RETENTION_BATCH_ROWS   = int(os.getenv("RETENTION_BATCH_ROWS", "5000"))   # rows per DELETE transaction
+RETENTION_PAUSE_MS     = int(os.getenv("RETENTION_PAUSE_MS", "50"))       # yield the write lock between batches
+RETENTION_BUDGET_S     = float(os.getenv("RETENTION_BUDGET_S", "10"))     # per run; the rest waits for the next run
+RETENTION_VACUUM_PAGES = int(os.getenv("RETENTION_VACUUM_PAGES", "2000")) # pages freed per incremental vacuum
+
+ROLLUP_RETENTION = {"1m": RETAIN_1M_DAYS, "1h": RETAIN_1H_DAYS, "1d": RETAIN_1D_DAYS}
+
+
+def _now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def _pause():
+    if RETENTION_PAUSE_MS:
+        time.sleep(RETENTION_PAUSE_MS / 1000.0)
+
+# ------------------------------
+# Batched deletes: select a small set of keys, delete them, commit, pause.
+# Each transaction touches at most RETENTION_BATCH_ROWS rows, so the monitor's
+# writer and the web readers never wait long for the lock.
+# ------------------------------
+def _delete_in_batches(select_keys, delete_keys, deadline=None):
+    deleted = 0
+    while deadline is None or time.monotonic() < deadline:
+        keys = select_keys(RETENTION_BATCH_ROWS)
+        if not keys:
+            break
+        delete_keys(keys)
+        db.session.commit()
+        deleted += len(keys)
+        if len(keys) < RETENTION_BATCH_ROWS:
+            break
+        _pause()
+    return deleted
+
+def delete_raw_before(cutoff, deadline=None):
+    return _delete_in_batches(
+        lambda n: [i for (i,) in db.session.query(CheckResult.id)
+                   .filter(CheckResult.created_at < cutoff)
+                   .order_by(CheckResult.created_at.asc()).limit(n)],
+        lambda ids: CheckResult.query.filter(CheckResult.id.in_(ids)).delete(synchronize_session=False),
+        deadline,
+    )
+
+def delete_rollups_before(resolution, cutoff, deadline=None):
+    pk = (CheckRollup.resolution, CheckRollup.device_id, CheckRollup.bucket_start)
+    return _delete_in_batches(
+        lambda n: [tuple(k) for k in db.session.query(*pk)
+                   .filter(CheckRollup.resolution == resolution, CheckRollup.bucket_start < cutoff)
+                   .limit(n)],
+        lambda keys: CheckRollup.query.filter(tuple_(*pk).in_(keys)).delete(synchronize_session=False),
+        deadline,
+    )
+
+def delete_alerts_before(cutoff, deadline=None):
+    return _delete_in_batches(
+        lambda n: [i for (i,) in db.session.query(AlertOutbox.id)
+                   .filter(AlertOutbox.state != "pending", AlertOutbox.created_at < cutoff).limit(n)],
+        lambda ids: AlertOutbox.query.filter(AlertOutbox.id.in_(ids)).delete(synchronize_session=False),
+        deadline,
+    )
+
+def delete_samples_before(cutoff, deadline=None):
+    return _delete_in_batches(
+        lambda n: [i for (i,) in db.session.query(HostSample.id)
+                   .filter(HostSample.created_at < cutoff)
+                   .order_by(HostSample.created_at.asc()).limit(n)],
+        lambda ids: HostSample.query.filter(HostSample.id.in_(ids)).delete(synchronize_session=False),
+        deadline,
+    )
+
+# All history of one device (used by delete_device); same batched path, no time budget
+def delete_device_history(device_id):
+    n = _delete_in_batches(
+        lambda k: [i for (i,) in db.session.query(CheckResult.id)
+                   .filter(CheckResult.device_id == device_id).limit(k)],
+        lambda ids: CheckResult.query.filter(CheckResult.id.in_(ids)).delete(synchronize_session=False),
+    )
+    n += _delete_in_batches(
+        lambda k: [i for (i,) in db.session.query(HostSample.id)
+                   .filter(HostSample.device_id == device_id).limit(k)],
+        lambda ids: HostSample.query.filter(HostSample.id.in_(ids)).delete(synchronize_session=False),
+    )
+    CheckRollup.query.filter_by(device_id=device_id).delete(synchronize_session=False)
+    DeviceLatestStatus.query.filter_by(device_id=device_id).delete(synchronize_session=False)
+    db.session.commit()
+    return n
+
+# ------------------------------
+# Space reclamation (SQLite)
+# ------------------------------
+def _pragma(name):
+    return db.session.execute(db.text(f"PRAGMA {name}")).scalar()
+
+def db_size():
+    if db.engine.dialect.name != "sqlite":
+        return None
+    return {
+        "bytes": _pragma("page_count") * _pragma("page_size"),
+        "free_bytes": _pragma("freelist_count") * _pragma("page_size"),
+        "auto_vacuum": {0: "none", 1: "full", 2: "incremental"}.get(_pragma("auto_vacuum")),
+    }
+
+def incremental_vacuum(pages=RETENTION_VACUUM_PAGES):
+    # only frees pages when the file was created with auto_vacuum=INCREMENTAL
+    # (new databases are; convert old ones once with `python -m app.retention --vacuum`)
+    if db.engine.dialect.name != "sqlite" or _pragma("auto_vacuum") != 2:
+        return 0
+    before = _pragma("page_count")
+    # sqlite3's execute() stops after one step (= one page); executescript runs it to the end
+    db.session.commit()
+    db.session.connection().connection.executescript(f"PRAGMA incremental_vacuum({int(pages)});")
+    return (before - _pragma("page_count")) * _pragma("page_size")
+
+def full_vacuum():
+    # rewrites the whole file (blocks writers while it runs) and switches it to incremental mode
+    conn = db.engine.raw_connection()
+    try:
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+# ------------------------------
+# One retention pass; needs an app context. Never deletes data the next
+# rollup tier has not consumed yet. Returns a progress report.
+# ------------------------------
+def run_retention(budget_s=RETENTION_BUDGET_S, now=None):
+    t0 = time.monotonic()
+    deadline = None if budget_s is None else t0 + budget_s
+    now = now or _now()
+    size_before = db_size()
+    report = {"raw_deleted": 0, "rollups_deleted": {}}
+
+    if RETAIN_RAW_DAYS > 0:
+        cutoff = now - timedelta(days=RETAIN_RAW_DAYS)
+        wm = get_watermark(TIERS[0][0])
+        cutoff = min(cutoff, wm) if wm else None   # raw not rolled up yet stays
+        if cutoff:
+            report["raw_deleted"] = delete_raw_before(cutoff, deadline)
+
+    for i, (name, width, _, _) in enumerate(TIERS):
+        days = ROLLUP_RETENTION.get(name, 0)
+        if days <= 0:
+            continue
+        cutoff = now - timedelta(days=days)
+        if i + 1 < len(TIERS):
+            wm = get_watermark(TIERS[i + 1][0])
+            cutoff = min(cutoff, wm) if wm else None
+        if cutoff:
+            report["rollups_deleted"][name] = delete_rollups_before(width, cutoff, deadline)
+
+    if RETAIN_ALERTS_DAYS > 0:
+        report["alerts_deleted"] = delete_alerts_before(now - timedelta(days=RETAIN_ALERTS_DAYS), deadline)
+
+    if RETAIN_SAMPLES_DAYS > 0:
+        report["samples_deleted"] = delete_samples_before(now - timedelta(days=RETAIN_SAMPLES_DAYS), deadline)
+
+    report["reclaimed_bytes"] = incremental_vacuum()
+    size_after = db_size()
+    if size_after:
+        report["db_bytes"] = size_after["bytes"]
+        report["free_bytes"] = size_after["free_bytes"]
+        report["auto_vacuum"] = size_after["auto_vacuum"]
+        report["shrunk_bytes"] = size_before["bytes"] - size_after["bytes"]
+    report["seconds"] = round(time.monotonic() - t0, 2)
+    report["done"] = deadline is None or time.monotonic() < deadline
+    return report
+
+
+if __name__ == "__main__":
+    # python -m app.retention [--vacuum]
+    from app import create_app
+    app = create_app()
+    with app.app_context():
+        if "--vacuum" in sys.argv:
+            before = db_size()
+            full_vacuum()
+            after = db_size()
+            print(f"vacuum: {before['bytes']} -> {after['bytes']} bytes, auto_vacuum={after['auto_vacuum']}",
+                  file=sys.stderr)
+        print(run_retention(budget_s=None), file=sys.stderr)
@@ -0,0 +1,236 @@
+import os, sys, time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, cast, Integer, BigInteger
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.models import db, Config, CheckResult, CheckRollup
+
+# ---- Rollup tuning (env)
+ROLLUP_LAG_S      = int(os.getenv("ROLLUP_LAG_S", "120"))      # leave buckets open this long for late writes
+ROLLUP_MAX_CHUNKS = int(os.getenv("ROLLUP_MAX_CHUNKS", "24"))   # per tier per call, bounds one catch-up pass
+
+# name, bucket width (s), source, span of one incremental chunk (s)
+TIERS = (
+    ("1m", 60, None, 3600),          # from raw check_results (exact p95)
+    ("1h", 3600, 60, 86400),         # from 1m buckets
+    ("1d", 86400, 3600, 7 * 86400),  # from 1h buckets
+)
+RESOLUTIONS = {name: width for name, width, _, _ in TIERS}
+
+EPOCH = datetime(1970, 1, 1)
+_UPSERT = {"sqlite": sqlite_insert, "postgresql": pg_insert}
+_AGG_COLS = ("count", "up_count", "down_count", "degraded_count", "latency_count",
+             "latency_min", "latency_max", "latency_avg", "latency_p95")
+
+
+def _epoch(dt):
+    return int((dt.replace(tzinfo=None) - EPOCH).total_seconds())
+
+def epoch_ms(col):
+    # epoch milliseconds computed in SQL where the dialect allows it (else None)
+    dialect = db.engine.dialect.name
+    if dialect == "sqlite":
+        return cast(func.round((func.julianday(col) - 2440587.5) * 86400000.0), Integer)
+    if dialect == "postgresql":
+        return cast(func.extract("epoch", col) * 1000, BigInteger)
+    return None
+
+def _floor(dt, width):
+    return EPOCH + timedelta(seconds=_epoch(dt) // width * width)
+
+def _pct(sorted_vals, p):
+    # nearest-rank percentile
+    return sorted_vals[max(0, min(len(sorted_vals) - 1, int(round(p * len(sorted_vals) + 0.5)) - 1))]
+
+def _weighted_pct(pairs, p):
+    # pairs of (value, weight); used to approximate p95 of a bucket from its children's p95
+    pairs = sorted(pairs)
+    total = sum(w for _, w in pairs)
+    acc = 0
+    for v, w in pairs:
+        acc += w
+        if acc >= p * total:
+            return v
+    return pairs[-1][0] if pairs else None
+
+# ------------------------------
+# Watermarks (kept in the config table, written in the same transaction as the buckets)
+# ------------------------------
+def _wm_key(name):
+    return f"ROLLUP_WM_{name}"
+
+def get_watermark(name):
+    row = Config.query.get(_wm_key(name))
+    return datetime.fromisoformat(row.value) if row and row.value else None
+
+def _set_watermark(name, dt):
+    db.session.merge(Config(key=_wm_key(name), value=dt.isoformat()))
+
+# ------------------------------
+# Aggregation
+# ------------------------------
+def _from_raw(width, start, end):
+    rows = (
+        db.session.query(CheckResult.device_id, CheckResult.created_at, CheckResult.status, CheckResult.latency_ms)
+        .filter(CheckResult.created_at >= start, CheckResult.created_at < end)
+        .all()
+    )
+    groups = {}
+    for device_id, created_at, status, latency in rows:
+        key = (device_id, _epoch(created_at) // width * width)
+        g = groups.get(key)
+        if g is None:
+            g = groups[key] = {"count": 0, "up": 0, "down": 0, "degraded": 0, "lat": []}
+        g["count"] += 1
+        if status in ("up", "degraded"):
+            g[status] += 1
+        else:
+            g["down"] += 1
+        if latency is not None:
+            g["lat"].append(latency)
+
+    out = []
+    for (device_id, bucket), g in groups.items():
+        lat = sorted(g["lat"])
+        out.append({
+            "device_id": device_id,
+            "bucket_start": EPOCH + timedelta(seconds=bucket),
+            "count": g["count"],
+            "up_count": g["up"],
+            "down_count": g["down"],
+            "degraded_count": g["degraded"],
+            "latency_count": len(lat),
+            "latency_min": lat[0] if lat else None,
+            "latency_max": lat[-1] if lat else None,
+            "latency_avg": (sum(lat) / len(lat)) if lat else None,
+            "latency_p95": _pct(lat, 0.95) if lat else None,
+        })
+    return out
+
+def _from_tier(width, source, start, end):
+    rows = (
+        CheckRollup.query
+        .filter(CheckRollup.resolution == source,
+                CheckRollup.bucket_start >= start, CheckRollup.bucket_start < end)
+        .all()
+    )
+    groups = {}
+    for r in rows:
+        groups.setdefault((r.device_id, _epoch(r.bucket_start) // width * width), []).append(r)
+
+    out = []
+    for (device_id, bucket), children in groups.items():
+        with_lat = [c for c in children if c.latency_count]
+        n_lat = sum(c.latency_count for c in with_lat)
+        out.append({
+            "device_id": device_id,
+            "bucket_start": EPOCH + timedelta(seconds=bucket),
+            "count": sum(c.count for c in children),
+            "up_count": sum(c.up_count for c in children),
+            "down_count": sum(c.down_count for c in children),
+            "degraded_count": sum(c.degraded_count for c in children),
+            "latency_count": n_lat,
+            "latency_min": min((c.latency_min for c in with_lat), default=None),
+            "latency_max": max((c.latency_max for c in with_lat), default=None),
+            "latency_avg": (sum(c.latency_avg * c.latency_count for c in with_lat) / n_lat) if n_lat else None,
+            # approximate above 1m: latency-weighted p95 of the children's p95
+            "latency_p95": _weighted_pct([(c.latency_p95, c.latency_count) for c in with_lat], 0.95),
+        })
+    return out
+
+def _upsert(resolution, buckets):
+    if not buckets:
+        return
+    values = [{"resolution": resolution, **b} for b in buckets]
+    table = CheckRollup.__table__
+    insert = _UPSERT.get(db.engine.dialect.name)
+    if insert is None:
+        for v in values:
+            db.session.merge(CheckRollup(**v))
+        return
+    stmt = insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.resolution, table.c.device_id, table.c.bucket_start],
+        set_={c: stmt.excluded[c] for c in _AGG_COLS},
+    )
+    db.session.execute(stmt, values)
+
+def _oldest_raw():
+    return db.session.query(db.func.min(CheckResult.created_at)).scalar()
+
+# Advance every tier up to its closed buckets; needs an app context.
+# Returns {tier: buckets written}. Bounded by ROLLUP_MAX_CHUNKS per tier.
+def run_rollups(now=None, max_chunks=ROLLUP_MAX_CHUNKS):
+    now = (now or datetime.now(timezone.utc)).replace(tzinfo=None)
+    written = {}
+    source_wm = now - timedelta(seconds=ROLLUP_LAG_S)
+    for name, width, source, chunk_s in TIERS:
+        end = _floor(source_wm, width)
+        wm = get_watermark(name)
+        if wm is None:
+            oldest = _oldest_raw()
+            if oldest is None:
+                written[name] = 0
+                source_wm = end
+                continue
+            wm = _floor(oldest, width)
+
+        n = chunks = 0
+        while wm < end and (max_chunks is None or chunks < max_chunks):
+            chunk_end = min(end, _floor(wm + timedelta(seconds=chunk_s), width))
+            if chunk_end <= wm:
+                chunk_end = wm + timedelta(seconds=width)
+            buckets = _from_raw(width, wm, chunk_end) if source is None else _from_tier(width, source, wm, chunk_end)
+            _upsert(width, buckets)
+            _set_watermark(name, chunk_end)
+            db.session.commit()
+            n += len(buckets)
+            chunks += 1
+            wm = chunk_end
+        written[name] = n
+        source_wm = wm   # the next tier may only roll up buckets this tier has closed
+    return written
+
+# ------------------------------
+# Reads
+# ------------------------------
+# Pick the finest resolution that covers [q_from, q_to] in at most max_points points.
+# raw_interval_s is the device's check interval (density of raw rows).
+def pick_resolution(q_from, q_to, max_points, raw_interval_s):
+    if q_from is None:
+        return "raw"      # "latest N rows" view
+    span = ((q_to or datetime.now(timezone.utc).replace(tzinfo=None)) - q_from).total_seconds()
+    if span / max(raw_interval_s, 1) <= max_points:
+        return "raw"
+    for name, width, _, _ in TIERS:
+        if span / width <= max_points:
+            return name
+    return TIERS[-1][0]
+
+def rollup_query(device_id, resolution, q_from=None, q_to=None):
+    q = CheckRollup.query.filter(CheckRollup.resolution == RESOLUTIONS[resolution],
+                                 CheckRollup.device_id == device_id)
+    if q_from:
+        q = q.filter(CheckRollup.bucket_start >= _floor(q_from, RESOLUTIONS[resolution]))
+    if q_to:
+        q = q.filter(CheckRollup.bucket_start <= q_to)
+    return q
+
+def worst_status(r):
+    if r.down_count:
+        return "down"
+    if r.degraded_count:
+        return "degraded"
+    return "up"
+
+
+if __name__ == "__main__":
+    # full catch-up in one go: python -m app.rollups
+    from app import create_app
+    app = create_app()
+    with app.app_context():
+        t0 = time.monotonic()
+        done = run_rollups(max_chunks=None)
+        print(f"rollups written {done} in {time.monotonic() - t0:.1f}s", file=sys.stderr)
@@ -1,24 +1,44 @@
 from flask import (
     Response, Blueprint, render_template, request, redirect,
-    url_for, jsonify, session, flash, abort, request as flask_request
+    url_for, jsonify, session, flash, abort, request as flask_request,
+    stream_with_context, current_app, g
 )
+import metrics
 from alerts import send_email
 from app import db
-from app.models import Device, CheckResult
-from sqlalchemy import desc, asc
+from app.models import Device, CheckResult, CheckRollup, DeviceLatestStatus
+from app.retention import delete_device_history
+from app.rollups import EPOCH, RESOLUTIONS, epoch_ms, pick_resolution, rollup_query, worst_status
+from sqlalchemy import desc, asc, tuple_, type_coerce, String
 from functools import wraps
 import os
 import re
+import time
+import base64
 from datetime import datetime, timezone
+from collections import namedtuple
 import csv
 import io
-from app.config_store import get_config, set_config
+import json
+import zlib
+import queue
+from app.config_store import get_many, set_many
+from app.live import devices_etag, last_check_str, STREAM_KEEPALIVE_S
+from app.ingest import INGEST_MAX_BYTES, ingest, issue_token, chart_points
+from app import hot_tier
+from app.reports import cached_report, parse_window
+from app.topology import check_parent
 
 bp = Blueprint("routes", __name__)
 
 # ---- Auth config from environment
 ADMIN_USER = os.getenv("ADMIN_USER", "admin")
 ADMIN_PASS = os.getenv("ADMIN_PASS", "password")
+# Default check interval (same env as the monitor); tells how dense raw history is
+INTERVAL_SECONDS = int(os.getenv("INTERVAL_SECONDS", "30"))
+# HTTP degraded threshold defaults (same env as probes.py); the basis can be changed in settings
+DEGRADED_MS    = int(os.getenv("DEGRADED_MS", "800"))
+DEGRADED_BASIS = os.getenv("DEGRADED_BASIS", "total").lower()
 
 
 
@@ -32,10 +52,57 @@ def _parse_dt(s):
     if not s:
         return None
     try:
-        # accepts '2025-08-24' or '2025-08-24 15:20:00'
-        return datetime.fromisoformat(s)
+        # accepts '2025-08-24' or '2025-08-24 15:20:00'; an offset is converted to naive UTC
+        dt = datetime.fromisoformat(s)
     except ValueError:
         return None
+    return dt.astimezone(timezone.utc).replace(tzinfo=None) if dt.tzinfo else dt
+
+# Raw history of one device within an optional [from, to] window;
+# served by ix_check_results_device_created (see bench/check_query_plans.py)
+def _history_query(device_id, q_from=None, q_to=None):
+    q = CheckResult.query.filter_by(device_id=device_id)
+    if q_from:
+        q = q.filter(CheckResult.created_at >= q_from)
+    if q_to:
+        q = q.filter(CheckResult.created_at <= q_to)
+    return q
+
+# ?resolution=raw|1m|1h|1d; anything else (default "auto") picks the finest
+# tier that fits the requested range into `limit` points
+def _resolution(device, q_from, q_to, limit):
+    res = request.args.get("resolution", "auto")
+    if res == "raw" or res in RESOLUTIONS:
+        return res
+    return pick_resolution(q_from, q_to, limit, device.interval_s or INTERVAL_SECONDS)
+
+# Rollup bucket shaped like a CheckResult row for the detail template/chart
+Point = namedtuple("Point", "created_at status latency_ms message")
+
+# Raw rows listed under the detail chart; the chart itself shows up to `limit`
+DETAIL_TABLE_ROWS = int(os.getenv("DETAIL_TABLE_ROWS", "50"))
+
+def _hot_window(device, start, end, limit=None, newest=False):
+    # the device's checks in [start, end] from the hot tier (app/hot_tier.py), None
+    # when the ring doesn't cover them or lags behind the latest stored check
+    hot = hot_tier.open_reader(current_app)
+    if hot is None:
+        return None
+    latest = (db.session.query(DeviceLatestStatus.created_at)
+              .filter(DeviceLatestStatus.device_id == device.id).scalar())
+    return hot.window(device.id, hot_tier.generation(device.created_at), start, end, limit,
+                      newest=newest, latest=latest)
+
+def _hot_points(recs):
+    return [Point(hot_tier.from_us(us), hot_tier.STATUSES.get(code, "unknown"), lat, None)
+            for us, code, lat in recs]
+
+def _rollup_point(r):
+    msg = f"{r.count} checks: {r.up_count} up, {r.degraded_count} degraded, {r.down_count} down"
+    if r.latency_p95 is not None:
+        msg += f"; latency min/p95/max {r.latency_min}/{r.latency_p95}/{r.latency_max} ms"
+    avg = None if r.latency_avg is None else int(round(r.latency_avg))
+    return Point(r.bucket_start, worst_status(r), avg, msg)
 
 @bp.get("/devices/<int:device_id>")
 def device_detail(device_id):
@@ -47,88 +114,291 @@ def device_detail(device_id):
     limit  = int(request.args.get("limit", "200"))  # cap on points shown
     limit  = max(10, min(limit, 2000))
 
-    q = CheckResult.query.filter_by(device_id=device.id)
-    if q_from:
-        q = q.filter(CheckResult.created_at >= q_from)
-    if q_to:
-        q = q.filter(CheckResult.created_at <= q_to)
-
-    results = (
-        q.order_by(desc(CheckResult.created_at))
-         .limit(limit)
-         .all()
-    )
+    resolution = _resolution(device, q_from, q_to, limit)
+    recs = _hot_window(device, q_from, q_to, limit, newest=True) if resolution == "raw" else None
+    if resolution == "raw":
+        # with the chart served by the hot tier, SQL only fetches the table's rows
+        results = (
+            _history_query(device.id, q_from, q_to)
+             .order_by(desc(CheckResult.created_at))
+             .limit(limit if recs is None else min(limit, DETAIL_TABLE_ROWS))
+             .all()
+        )
+    else:
+        results = [
+            _rollup_point(r) for r in
+            rollup_query(device.id, resolution, q_from, q_to)
+            .order_by(desc(CheckRollup.bucket_start))
+            .limit(limit)
+        ]
     # for charts it’s nice to have chronological order
-    results_chrono = list(reversed(results))
+    results_chrono = _hot_points(recs) if recs is not None else list(reversed(results))
+    if resolution == "raw":
+        results = results[:DETAIL_TABLE_ROWS]
+
+    # pushed CPU/memory over the same span as the latency chart
+    if results_chrono:
+        span = (results_chrono[0].created_at, results_chrono[-1].created_at)
+    else:
+        span = (q_from, q_to)
+    samples = chart_points(device.id, *span, limit=limit)
+
+    # upstream device, and the choices for changing it (logged-in users only)
+    parent = Device.query.get(device.parent_id) if device.parent_id else None
+    parents = (db.session.query(Device.id, Device.name).filter(Device.id != device.id)
+               .order_by(Device.name).all() if session.get("logged_in") else [])
 
     return render_template(
         "device_detail.html",
         device=device,
-        results=results,               # newest → oldest (for table)
-        results_chrono=results_chrono  # oldest → newest (for chart)
+        resolution=resolution,
+        results=results,                # newest → oldest (for table)
+        results_chrono=results_chrono,  # oldest → newest (for chart)
+        samples=samples,                # (time, cpu %, mem %), oldest → newest
+        parent=parent,
+        parents=parents,
     )
 
+# ---- History API paging
+# Pages are keyset-paginated on (created_at, id): `next_cursor` is an opaque
+# token for the last row returned, pass it back as ?cursor= for the next page.
+# Only the needed columns are selected and timestamps are formatted by the
+# database, so no ORM objects or per-row datetime parsing are involved.
+API_MAX_ROWS     = int(os.getenv("API_MAX_ROWS", "5000"))
+API_MAX_COLUMNAR = int(os.getenv("API_MAX_COLUMNAR", "100000"))
+
+# compact status codes for ?format=columnar
+STATUS_CODES = {"up": 0, "degraded": 1, "down": 2, "unreachable": 3}
+
+def _encode_cursor(ts, row_id=0):
+    raw = f"{ts.isoformat(sep=' ')}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _decode_cursor(s):
+    if not s:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(s + "=" * (-len(s) % 4)).decode()
+        ts, row_id = raw.rsplit("|", 1)
+        return datetime.fromisoformat(ts), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        abort(400, description="invalid cursor")
+
+def _as_dt(v):
+    # raw column values come back as text on SQLite, as datetimes elsewhere
+    return v if isinstance(v, datetime) else datetime.fromisoformat(v)
+
+def _ts_seconds(v):
+    # "YYYY-MM-DD HH:MM:SS", same as isoformat(sep=" ", timespec="seconds")
+    return v[:19] if isinstance(v, str) else v.isoformat(sep=" ", timespec="seconds")
+
+def _history_page(device_id, q_from, q_to, after, limit, columnar=False):
+    ts = type_coerce(CheckResult.created_at, String)   # skip the DateTime result processor
+    cols = [CheckResult.id, ts.label("ts"), CheckResult.status, CheckResult.latency_ms]
+    if columnar:
+        ms = epoch_ms(CheckResult.created_at)
+        if ms is not None:
+            cols.append(ms.label("ms"))
+    else:
+        cols += [CheckResult.message, CheckResult.dns_ms, CheckResult.connect_ms,
+                 CheckResult.tls_ms, CheckResult.ttfb_ms]
+    q = db.session.query(*cols).filter(CheckResult.device_id == device_id)
+    if q_from:
+        q = q.filter(CheckResult.created_at >= q_from)
+    if q_to:
+        q = q.filter(CheckResult.created_at <= q_to)
+    if after:
+        q = q.filter(tuple_(CheckResult.created_at, CheckResult.id) > after)
+    return q.order_by(asc(CheckResult.created_at), asc(CheckResult.id)).limit(limit).all()
+
+def _rollup_page(device_id, resolution, q_from, q_to, after, limit):
+    q = rollup_query(device_id, resolution, q_from, q_to)
+    if after:
+        q = q.filter(CheckRollup.bucket_start > after[0])
+    return q.order_by(asc(CheckRollup.bucket_start)).limit(limit).all()
+
+def _ms(dt):
+    return int((dt - EPOCH).total_seconds() * 1000)
+
+HOT_CURSOR_ID = 2 ** 53
+
+def _hot_page(device, q_from, q_to, after, limit):
+    # a raw columnar page from the hot tier, None when the ring doesn't reach
+    # back to where the page starts
+    start = max(q_from, after[0]) if q_from and after else (after[0] if after else q_from)
+    recs = _hot_window(device, start, q_to)
+    if recs is None:
+        return None
+    if after:
+        cut = hot_tier.to_us(after[0])
+        recs = [r for r in recs if r[0] > cut]
+    return recs[:limit]
+
 @bp.get("/api/devices/<int:device_id>/history")
 def api_device_history(device_id):
     device = Device.query.get_or_404(device_id)
     q_from = _parse_dt(request.args.get("from"))
     q_to   = _parse_dt(request.args.get("to"))
+    columnar = request.args.get("format") == "columnar"
     limit  = int(request.args.get("limit", "500"))
-    limit  = max(10, min(limit, 5000))
-
-    q = CheckResult.query.filter_by(device_id=device.id)
-    if q_from:
-        q = q.filter(CheckResult.created_at >= q_from)
-    if q_to:
-        q = q.filter(CheckResult.created_at <= q_to)
+    limit  = max(10, min(limit, API_MAX_COLUMNAR if columnar else API_MAX_ROWS))
+    after  = _decode_cursor(request.args.get("cursor"))
+    resolution = _resolution(device, q_from, q_to, limit)
 
-    rows = (
-        q.order_by(asc(CheckResult.created_at))
-         .limit(limit)
-         .all()
-    )
-    def to_dict(r):
-        return {
-            "id": r.id,
-            "status": r.status,
-            "latency_ms": r.latency_ms,
-            "message": r.message,
-            "created_at": r.created_at.isoformat(sep=" ", timespec="seconds"),
-        }
-    return jsonify({
+    out = {
         "device": {"id": device.id, "name": device.name, "host": device.host, "kind": device.kind},
-        "count": len(rows),
-        "items": [to_dict(r) for r in rows]
-    })
+        "resolution": resolution,
+    }
+
+    if resolution != "raw":
+        buckets = _rollup_page(device.id, resolution, q_from, q_to, after, limit)
+        out["count"] = len(buckets)
+        out["next_cursor"] = _encode_cursor(buckets[-1].bucket_start) if len(buckets) == limit else None
+        if columnar:
+            out["status_codes"] = STATUS_CODES
+            out["t"] = [_ms(b.bucket_start) for b in buckets]
+            out["latency_ms"] = [None if b.latency_avg is None else int(round(b.latency_avg)) for b in buckets]
+            out["status"] = [STATUS_CODES[worst_status(b)] for b in buckets]
+            return jsonify(out)
+        out["items"] = [{
+            "status": worst_status(b),
+            "latency_ms": None if b.latency_avg is None else int(round(b.latency_avg)),
+            "created_at": b.bucket_start.isoformat(sep=" ", timespec="seconds"),
+            "checks": b.count,
+            "up": b.up_count,
+            "degraded": b.degraded_count,
+            "down": b.down_count,
+            "latency_min": b.latency_min,
+            "latency_max": b.latency_max,
+            "latency_avg": b.latency_avg,
+            "latency_p95": b.latency_p95,
+        } for b in buckets]
+        return jsonify(out)
+
+    if columnar and (after or q_from):
+        page = _hot_page(device, q_from, q_to, after, limit)
+        if page is not None:
+            out["count"] = len(page)
+            # ring rows carry no id: a cursor past every row at that instant
+            out["next_cursor"] = (_encode_cursor(hot_tier.from_us(page[-1][0]), HOT_CURSOR_ID)
+                                  if len(page) == limit else None)
+            out["status_codes"] = STATUS_CODES
+            out["t"] = [(us + 500) // 1000 for us, _, _ in page]   # rounded, like epoch_ms()
+            out["latency_ms"] = [lat for _, _, lat in page]
+            out["status"] = [-1 if code == hot_tier.UNKNOWN else code for _, code, _ in page]
+            return jsonify(out)
+
+    rows = _history_page(device.id, q_from, q_to, after, limit, columnar)
+    out["count"] = len(rows)
+    out["next_cursor"] = _encode_cursor(_as_dt(rows[-1].ts), rows[-1].id) if len(rows) == limit else None
+    if columnar:
+        out["status_codes"] = STATUS_CODES
+        if rows and "ms" in rows[0]._fields:
+            out["t"] = [r.ms for r in rows]
+        else:
+            out["t"] = [_ms(_as_dt(r.ts)) for r in rows]
+        out["latency_ms"] = [r.latency_ms for r in rows]
+        out["status"] = [STATUS_CODES.get(r.status, -1) for r in rows]
+        return jsonify(out)
+    out["items"] = [{
+        "id": r.id,
+        "status": r.status,
+        "latency_ms": r.latency_ms,
+        "message": r.message,
+        "created_at": _ts_seconds(r.ts),
+        "timings": None if r.ttfb_ms is None else {
+            "dns": r.dns_ms, "connect": r.connect_ms, "tls": r.tls_ms, "ttfb": r.ttfb_ms,
+        },
+    } for r in rows]
+    return jsonify(out)
+
+# ---- Streaming export
+# Rows are read in keyset-paginated chunks of (created_at, id) and written out
+# as they arrive, so memory stays flat however long the range is.
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "2000"))
+
+def _iter_history(device_id, q_from=None, q_to=None, chunk=EXPORT_CHUNK_ROWS):
+    after = None
+    while True:
+        q = db.session.query(
+            CheckResult.created_at, CheckResult.id, CheckResult.status,
+            CheckResult.latency_ms, CheckResult.message,
+        ).filter(CheckResult.device_id == device_id)
+        if q_from:
+            q = q.filter(CheckResult.created_at >= q_from)
+        if q_to:
+            q = q.filter(CheckResult.created_at <= q_to)
+        if after:
+            q = q.filter(tuple_(CheckResult.created_at, CheckResult.id) > after)
+        rows = q.order_by(asc(CheckResult.created_at), asc(CheckResult.id)).limit(chunk).all()
+        # end the read transaction between chunks so a long export never pins a snapshot
+        db.session.rollback()
+        if not rows:
+            return
+        yield rows
+        if len(rows) < chunk:
+            return
+        after = (rows[-1].created_at, rows[-1].id)
+
+def _csv_chunks(chunks):
+    buf = io.StringIO()
+    w = csv.writer(buf)
+    w.writerow(["timestamp", "status", "latency_ms", "message"])
+    for rows in chunks:
+        for r in rows:
+            w.writerow([
+                r.created_at.isoformat(sep=" ", timespec="seconds"),
+                r.status,
+                (r.latency_ms if r.latency_ms is not None else ""),
+                r.message or ""
+            ])
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue()
+
+def _ndjson_chunks(chunks):
+    for rows in chunks:
+        yield "".join(
+            json.dumps({
+                "timestamp": r.created_at.isoformat(sep=" ", timespec="seconds"),
+                "status": r.status,
+                "latency_ms": r.latency_ms,
+                "message": r.message,
+            }, separators=(",", ":")) + "\n"
+            for r in rows
+        )
+
+def _gzip_chunks(parts):
+    z = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)   # gzip container
+    for part in parts:
+        out = z.compress(part.encode("utf-8"))
+        if out:
+            yield out
+    yield z.flush()
 
 @bp.get("/devices/<int:device_id>/history.csv")
+@bp.get("/devices/<int:device_id>/history.ndjson", endpoint="device_history_ndjson")
 def device_history_csv(device_id):
     device = Device.query.get_or_404(device_id)
     q_from = _parse_dt(request.args.get("from"))
     q_to   = _parse_dt(request.args.get("to"))
+    fmt = "ndjson" if request.path.endswith(".ndjson") else request.args.get("format", "csv")
+    gz = request.args.get("gzip", "").lower() in ("1", "true", "yes")
 
-    q = CheckResult.query.filter_by(device_id=device.id)
-    if q_from:
-        q = q.filter(CheckResult.created_at >= q_from)
-    if q_to:
-        q = q.filter(CheckResult.created_at <= q_to)
-    rows = q.order_by(asc(CheckResult.created_at)).all()
+    chunks = _iter_history(device.id, q_from, q_to)
+    if fmt == "ndjson":
+        body, mimetype, ext = _ndjson_chunks(chunks), "application/x-ndjson", "ndjson"
+    else:
+        body, mimetype, ext = _csv_chunks(chunks), "text/csv", "csv"
+    if gz:
+        body, mimetype, ext = _gzip_chunks(body), "application/gzip", ext + ".gz"
 
-    buf = io.StringIO()
-    w = csv.writer(buf)
-    w.writerow(["timestamp", "status", "latency_ms", "message"])
-    for r in rows:
-        w.writerow([
-            r.created_at.isoformat(sep=" ", timespec="seconds"),
-            r.status,
-            (r.latency_ms if r.latency_ms is not None else ""),
-            r.message or ""
-        ])
-    out = buf.getvalue()
     return Response(
-        out,
-        mimetype="text/csv",
-        headers={"Content-Disposition": f'attachment; filename="{device.name}-history.csv"'}
+        stream_with_context(body),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f'attachment; filename="{device.name}-history.{ext}"'}
     )
 
 
@@ -137,10 +407,30 @@ def device_history_csv(device_id):
 # =================================
 
 # ---- No-cache for auth-sensitive pages
+# ---- request latency per route (see /metrics)
+REQUEST_SECONDS = metrics.histogram("http_request_duration_seconds", "Time to build a response",
+                                    ("endpoint", "method", "status"))
+
+@bp.before_app_request
+def start_request_timer():
+    g.request_t0 = time.perf_counter()
+
+@bp.after_app_request
+def observe_request(resp):
+    t0 = g.get("request_t0")
+    if t0 is not None:
+        REQUEST_SECONDS.labels(flask_request.endpoint or "unmatched", flask_request.method,
+                               str(resp.status_code)).observe(time.perf_counter() - t0)
+    return resp
+
 @bp.after_app_request
 def add_no_cache_headers(resp):
     if flask_request.endpoint and flask_request.endpoint.startswith("routes."):
-        resp.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0, private"
+        if "ETag" in resp.headers:
+            # may be kept, but must be revalidated (If-None-Match -> 304) before every use
+            resp.headers["Cache-Control"] = "no-cache, private"
+        else:
+            resp.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0, private"
         resp.headers["Pragma"] = "no-cache"
         resp.headers["Expires"] = "0"
     return resp
@@ -182,6 +472,15 @@ def logout():
 # ------------------------------
 # Dashboard
 # ------------------------------
+# Every device with its latest status (or None) in one joined query
+def _devices_with_latest():
+    return (
+        db.session.query(Device, DeviceLatestStatus)
+        .outerjoin(DeviceLatestStatus, DeviceLatestStatus.device_id == Device.id)
+        .order_by(Device.id.asc())
+        .all()
+    )
+
 @bp.route("/", methods=["GET", "POST"])
 def index():
     if request.method == "POST":
@@ -193,6 +492,8 @@ def index():
         host = (request.form.get("host") or "").strip()
         kind = (request.form.get("kind") or "").strip().lower()
         port = (request.form.get("port") or "").strip()
+        interval = (request.form.get("interval") or "").strip()
+        parent = (request.form.get("parent") or "").strip()
 
         # Normalize kind (icmp/http/tcp). Heuristic if missing/unknown.
         if kind not in ("icmp", "http", "tcp"):
@@ -202,21 +503,27 @@ def index():
         if kind == "tcp" and port.isdigit():
             host = f"{host}:{int(port)}"
 
+        # Optional per-device check interval (seconds); blank = monitor default
+        interval_s = max(5, int(interval)) if interval.isdigit() else None
+
+        # Optional upstream device: not probed while that one is down
+        parent_id = int(parent) if parent.isdigit() else None
+        try:
+            check_parent(None, parent_id)
+        except ValueError as e:
+            flash(str(e), "danger")
+            return redirect(url_for("routes.index"))
+
         if name and host:
-            d = Device(name=name, host=host, kind=kind)
+            d = Device(name=name, host=host, kind=kind, interval_s=interval_s, parent_id=parent_id)
             db.session.add(d)
             db.session.commit()
             flash(f"Added {name} ({kind})", "success")
         return redirect(url_for("routes.index"))
 
-    devices = Device.query.order_by(Device.id.asc()).all()
-    latest = {}
-    for d in devices:
-        cr = (CheckResult.query
-              .filter_by(device_id=d.id)
-              .order_by(desc(CheckResult.created_at))
-              .first())
-        latest[d.id] = cr
+    rows = _devices_with_latest()
+    devices = [d for d, _ in rows]
+    latest = {d.id: cr for d, cr in rows}
 
     return render_template("index.html", devices=devices, latest=latest)
 
@@ -227,40 +534,86 @@ def index():
 @login_required
 def delete_device(device_id):
     device = Device.query.get_or_404(device_id)
-    # Clean up related check results first to avoid FK/NULL issues
-    CheckResult.query.filter_by(device_id=device.id).delete()
+    # Clean up related history first (in small batches) to avoid FK/NULL issues
+    delete_device_history(device.id)
+    # devices behind it now hang off its own parent
+    Device.query.filter_by(parent_id=device.id).update({"parent_id": device.parent_id}, synchronize_session=False)
     db.session.delete(device)
     db.session.commit()
+    hot_tier.forget(current_app, device.id)
     flash("Device deleted", "success")
     return redirect(url_for("routes.index"))
 
+# Which device this one is reached through (blank = none); refused when it would loop
+@bp.post("/devices/<int:device_id>/parent")
+@login_required
+def set_device_parent(device_id):
+    device = Device.query.get_or_404(device_id)
+    parent = (request.form.get("parent") or "").strip()
+    parent_id = int(parent) if parent.isdigit() else None
+    try:
+        check_parent(device.id, parent_id)
+    except ValueError as e:
+        flash(str(e), "danger")
+        return redirect(url_for("routes.device_detail", device_id=device.id))
+    device.parent_id = parent_id
+    db.session.commit()
+    flash(f"{device.name} depends on {Device.query.get(parent_id).name}" if parent_id
+          else f"{device.name} depends on no other device", "success")
+    return redirect(url_for("routes.device_detail", device_id=device.id))
+
+# New push token for the device's host agent, shown once
+@bp.post("/devices/<int:device_id>/ingest-token")
+@login_required
+def device_ingest_token(device_id):
+    device = Device.query.get_or_404(device_id)
+    token = issue_token(device)
+    db.session.commit()
+    flash(f"Agent token for {device.name} (device id {device.id}), shown only once: {token}", "warning")
+    return redirect(url_for("routes.device_detail", device_id=device.id))
+
 @bp.route("/settings", methods=["GET", "POST"])
 @login_required
 def settings():
     # Load current values (DB, fallback to env handled in alerts)
-    bot_token = get_config("TELEGRAM_BOT_TOKEN", "")
-    chat_id   = get_config("TELEGRAM_CHAT_ID", "")
+    cfg = get_many({
+        "TELEGRAM_BOT_TOKEN": "", "TELEGRAM_CHAT_ID": "",
+        "SMTP_HOST": "", "SMTP_PORT": "587", "SMTP_USER": "", "SMTP_PASS": "",
+        "SMTP_STARTTLS": "true",  # 'true'|'false'
+        "ALERT_EMAIL_FROM": None, "ALERT_EMAIL_TO": "",
+        "DEGRADED_BASIS": DEGRADED_BASIS,
+    })
+    bot_token = cfg["TELEGRAM_BOT_TOKEN"]
+    chat_id   = cfg["TELEGRAM_CHAT_ID"]
+
+    smtp_host = cfg["SMTP_HOST"]
+    smtp_port = cfg["SMTP_PORT"]
+    smtp_user = cfg["SMTP_USER"]
+    smtp_pass = cfg["SMTP_PASS"]
+    smtp_starttls = cfg["SMTP_STARTTLS"]
+    alert_email_from = cfg["ALERT_EMAIL_FROM"] if cfg["ALERT_EMAIL_FROM"] is not None else (smtp_user or "")
+    alert_email_to   = cfg["ALERT_EMAIL_TO"]
 
-    smtp_host = get_config("SMTP_HOST", "")
-    smtp_port = get_config("SMTP_PORT", "587")
-    smtp_user = get_config("SMTP_USER", "")
-    smtp_pass = get_config("SMTP_PASS", "")
-    smtp_starttls = get_config("SMTP_STARTTLS", "true")  # 'true'|'false'
-    alert_email_from = get_config("ALERT_EMAIL_FROM", smtp_user or "")
-    alert_email_to   = get_config("ALERT_EMAIL_TO", "")
+    degraded_basis = cfg["DEGRADED_BASIS"]
 
     if request.method == "POST":
-        # Save Telegram
-        set_config("TELEGRAM_BOT_TOKEN", (request.form.get("telegram_bot_token") or "").strip())
-        set_config("TELEGRAM_CHAT_ID",   (request.form.get("telegram_chat_id") or "").strip())
-        # Save Email/SMTP
-        set_config("SMTP_HOST", (request.form.get("smtp_host") or "").strip())
-        set_config("SMTP_PORT", (request.form.get("smtp_port") or "587").strip())
-        set_config("SMTP_USER", (request.form.get("smtp_user") or "").strip())
-        set_config("SMTP_PASS", (request.form.get("smtp_pass") or "").strip())
-        set_config("SMTP_STARTTLS", (request.form.get("smtp_starttls") or "true").strip().lower())
-        set_config("ALERT_EMAIL_FROM", (request.form.get("alert_email_from") or "").strip())
-        set_config("ALERT_EMAIL_TO",   (request.form.get("alert_email_to") or "").strip())
+        basis = (request.form.get("degraded_basis") or "total").strip().lower()
+        # one transaction + one version bump for the whole form
+        set_many({
+            # Telegram
+            "TELEGRAM_BOT_TOKEN": (request.form.get("telegram_bot_token") or "").strip(),
+            "TELEGRAM_CHAT_ID":   (request.form.get("telegram_chat_id") or "").strip(),
+            # Email/SMTP
+            "SMTP_HOST": (request.form.get("smtp_host") or "").strip(),
+            "SMTP_PORT": (request.form.get("smtp_port") or "587").strip(),
+            "SMTP_USER": (request.form.get("smtp_user") or "").strip(),
+            "SMTP_PASS": (request.form.get("smtp_pass") or "").strip(),
+            "SMTP_STARTTLS": (request.form.get("smtp_starttls") or "true").strip().lower(),
+            "ALERT_EMAIL_FROM": (request.form.get("alert_email_from") or "").strip(),
+            "ALERT_EMAIL_TO":   (request.form.get("alert_email_to") or "").strip(),
+            # Checks
+            "DEGRADED_BASIS": basis if basis in ("total", "ttfb") else "total",
+        })
 
         flash("Settings saved", "success")
         return redirect(url_for("routes.settings"))
@@ -271,7 +624,8 @@ def settings():
         smtp_host=smtp_host, smtp_port=smtp_port,
         smtp_user=smtp_user, smtp_pass=smtp_pass,
         smtp_starttls=smtp_starttls,
-        alert_email_from=alert_email_from, alert_email_to=alert_email_to
+        alert_email_from=alert_email_from, alert_email_to=alert_email_to,
+        degraded_basis=degraded_basis, degraded_ms=DEGRADED_MS
     )
     
     
@@ -289,24 +643,87 @@ def test_email():
         flash(f"❌ Could not send test email: {info}", "danger")
     return redirect(url_for("routes.settings"))
 # ------------------------------
+# Push ingestion for host agents (app/ingest.py); every device group in the
+# body carries its own device's token, so there is no session login here
+# ------------------------------
+@bp.post("/api/ingest")
+def api_ingest():
+    raw = request.stream.read(INGEST_MAX_BYTES + 1)
+    body, status = ingest(raw, request.headers.get("Content-Encoding"))
+    return jsonify(body), status
+
+# ------------------------------
 # JSON API for AJAX updates (read-only)
 # ------------------------------
 @bp.get("/api/devices")
 def api_devices():
-    devices = Device.query.order_by(Device.id.asc()).all()
+    # pollers that already hold the current list get a 304 without it being rebuilt
+    etag = devices_etag()
+    if etag in request.if_none_match:
+        resp = Response(status=304)
+        resp.set_etag(etag)
+        return resp
     out = []
-    for d in devices:
-        cr = (CheckResult.query
-              .filter_by(device_id=d.id)
-              .order_by(desc(CheckResult.created_at))
-              .first())
+    for d, cr in _devices_with_latest():
         out.append({
             "id": d.id,
             "name": d.name,
             "host": d.host,
             "kind": d.kind,
+            "interval_s": d.interval_s,
+            "parent_id": d.parent_id,
             "status": (cr.status if cr else "Unknown"),
             "latency_ms": (cr.latency_ms if cr and cr.latency_ms is not None else None),
-            "last_check": (cr.created_at.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC") if cr else None),
+            "last_check": (last_check_str(cr.created_at) if cr else None),
+            # confirmed = the status alerts went out for; see last_state.py
+            "confirmed_status": (cr.confirmed_status if cr else None),
+            "flapping": bool(cr and cr.flapping),
+            "flap_pct": (cr.flap_pct if cr else None),
+            "suppressed_alerts": (cr.suppressed or 0) if cr else 0,
         })
-    return jsonify(out)
+    resp = jsonify(out)
+    resp.set_etag(etag)
+    return resp
+
+# Uptime/SLA per device over ?from=&to= (default: the last ?days=30), optionally
+# for ?devices=1,2,3 only; computed in one batched pass (app/reports.py) and cached
+@bp.get("/api/reports/uptime")
+def api_uptime_report():
+    try:
+        days = float(request.args.get("days", "30"))
+        ids = request.args.get("devices")
+        ids = [int(i) for i in ids.split(",") if i.strip()] if ids else None
+        start, end = parse_window(_parse_dt(request.args.get("from")), _parse_dt(request.args.get("to")), days)
+    except (ValueError, OverflowError) as e:
+        abort(400, description=str(e))
+    return jsonify(cached_report(start, end, ids))
+
+# Prometheus text format: this web process's request latencies and stream hub
+@bp.get("/metrics")
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+# Server-Sent Events: "delta" events carry the devices whose status, latency or
+# flapping state changed ([{id, status, latency_ms, flapping, suppressed_alerts,
+# last_check}]), "devices" means devices were
+# added or removed (re-read /api/devices). All clients share one ChangeHub.
+@bp.get("/api/stream")
+def api_stream():
+    hub = current_app.extensions["change_hub"]
+    client = hub.subscribe()
+    if client is None:
+        return jsonify({"error": "too many stream clients"}), 503
+
+    def events():
+        try:
+            yield f"retry: 3000\nevent: hello\ndata: {json.dumps({'seq': hub.seq})}\n\n"
+            while not client.closed:
+                try:
+                    yield client.q.get(timeout=STREAM_KEEPALIVE_S)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+        finally:
+            hub.unsubscribe(client)
+
+    return Response(events(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
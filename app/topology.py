@@ -0,0 +1,112 @@
+from collections import deque
+
+from app.models import db, Device
+
+
+# ------------------------------
+# Device dependency graph: each device has at most one parent (the switch or
+# uplink it is reached through), so the graph is a forest as long as no chain
+# of parents loops back. Edits are checked with check_parent() before they are
+# stored; load() still drops the links of any cycle it finds (rows written by
+# hand), so a walk up the parents always ends.
+# ------------------------------
+def check_parent(device_id, parent_id):
+    """ValueError when device_id may not depend on parent_id (unknown device, or a cycle)."""
+    if parent_id is None:
+        return
+    if parent_id == device_id:
+        raise ValueError("a device cannot depend on itself")
+    parents = dict(db.session.query(Device.id, Device.parent_id))
+    if parent_id not in parents:
+        raise ValueError(f"no device {parent_id}")
+    seen = set()
+    i = parent_id
+    while i is not None and i not in seen:
+        if i == device_id:
+            raise ValueError("that parent depends on this device: the dependency would loop")
+        seen.add(i)
+        i = parents.get(i)
+
+
+class Topology:
+    def __init__(self, parents=None, enabled=None):
+        self.parents = {}     # device id -> parent id (devices with a parent only)
+        self.children = {}    # device id -> [child ids]
+        self.enabled = None   # ids of enabled devices (None = all); disabled ones never block their children
+        self.cycles = 0       # parent links dropped by the last build
+        self.names = {}       # device id -> name, for messages
+        if parents is not None:
+            self.build(parents, enabled)
+
+    def load(self):
+        # needs an app context
+        rows = db.session.query(Device.id, Device.parent_id, Device.enabled, Device.name).all()
+        self.build({i: p for i, p, _, _ in rows}, {i for i, _, e, _ in rows if e})
+        self.names = {i: name for i, _, _, name in rows}
+        if self.cycles:
+            print(f"[topology] ignoring {self.cycles} parent link(s) that form a cycle", flush=True)
+        return self
+
+    def build(self, parents, enabled=None):
+        parents = {i: p for i, p in parents.items() if p is not None and p != i and p in parents}
+        # follow each chain once; a chain that reaches a device on the current path loops
+        state = {}   # 1 = on the current path, 2 = done
+        cut = set()
+        for start in parents:
+            path = []
+            i = start
+            while i in parents and i not in state:
+                state[i] = 1
+                path.append(i)
+                i = parents[i]
+            if state.get(i) == 1:
+                # i is on this path: every link from i around to i again is the cycle
+                k = path.index(i)
+                cut.update(path[k:])
+            for j in path:
+                state[j] = 2
+        for i in cut:
+            del parents[i]
+        children = {}
+        for i, p in parents.items():
+            children.setdefault(p, []).append(i)
+        self.parents, self.children, self.cycles = parents, children, len(cut)
+        self.enabled = None if enabled is None else set(enabled)
+        return self
+
+    def parent(self, device_id):
+        return self.parents.get(device_id)
+
+    def name(self, device_id):
+        return self.names.get(device_id) or f"device {device_id}"
+
+    def ancestors(self, device_id):
+        """Parent, grandparent, ... up to the root."""
+        out = []
+        i = self.parents.get(device_id)
+        while i is not None:
+            out.append(i)
+            i = self.parents.get(i)
+        return out
+
+    def descendants(self, device_id):
+        """Every device behind device_id, nearest first."""
+        out = []
+        q = deque(self.children.get(device_id, ()))
+        while q:
+            i = q.popleft()
+            out.append(i)
+            q.extend(self.children.get(i, ()))
+        return out
+
+    def blocked_by(self, device_id, is_down):
+        """Nearest enabled ancestor for which is_down(id) holds, or None."""
+        i = self.parents.get(device_id)
+        while i is not None:
+            if (self.enabled is None or i in self.enabled) and is_down(i):
+                return i
+            i = self.parents.get(i)
+        return None
+
+    def __len__(self):
+        return len(self.parents)
@@ -0,0 +1,90 @@
+"""Alert delivery: inline sends vs the AlertDispatcher, against stub SMTP/Telegram servers.
+
+    python bench/bench_alerts.py --flips 200
+
+Simulates a burst of --flips state changes (a network blip). The inline path
+(what check_targets used to do) is timed on --inline of them and extrapolated;
+the dispatcher path times what the probe loop pays (enqueue) and how long the
+digests take to arrive. The Telegram stub fails its first request to exercise
+retries. Two bursts are sent so the reused SMTP connection shows up in the
+connection count.
+"""
+import os, sys, time, argparse
+
+os.environ.setdefault("ALERT_DIGEST_S", "1")
+os.environ.setdefault("ALERT_RETRY_BASE_S", "0.5")
+
+from stubs import use_temp_db, start_smtp_stub, start_telegram_stub
+
+ap = argparse.ArgumentParser()
+ap.add_argument("--flips", type=int, default=200)
+ap.add_argument("--inline", type=int, default=10)
+ap.add_argument("--delay", type=float, default=0.1, help="stub server response delay (s)")
+args = ap.parse_args()
+
+tg, tg_url = start_telegram_stub(delay_s=args.delay, fail_first=1)
+smtp, smtp_port = start_smtp_stub(delay_s=args.delay)
+os.environ["TELEGRAM_API_URL"] = tg_url
+use_temp_db("bench_alerts.db")
+
+from app import create_app, db
+from app.models import AlertOutbox
+from app.config_store import set_config
+from alerts import notify_telegram, send_email
+from alert_dispatch import AlertDispatcher
+
+app = create_app()
+with app.app_context():
+    for k, v in {"TELEGRAM_BOT_TOKEN": "123:stub", "TELEGRAM_CHAT_ID": "42", "SMTP_HOST": "127.0.0.1",
+                 "SMTP_PORT": str(smtp_port), "SMTP_STARTTLS": "false", "SMTP_USER": "",
+                 "ALERT_EMAIL_TO": "ops@example.com", "ALERT_EMAIL_FROM": "monitor@example.com"}.items():
+        set_config(k, v)
+
+
+def alert(i):
+    return dict(device_id=i, subject=f"[Monitor] dev-{i} is DOWN",
+                text=f"🔔 dev-{i} (10.0.0.{i % 250}) → DOWN  [icmp]  latency=-  note=no reply",
+                body=f"dev-{i}\nstatus: down\n")
+
+
+if __name__ == "__main__":
+    # inline: one Telegram request + one fresh SMTP session per alert, on the probe thread
+    tg.fail_first = 0
+    with app.app_context():
+        t0 = time.monotonic()
+        for i in range(args.inline):
+            a = alert(i)
+            notify_telegram(a["text"])
+            send_email(a["subject"], a["body"])
+        per = (time.monotonic() - t0) / args.inline
+    print(f"inline     : {per * 1000:7.1f} ms per alert -> probe loop blocked ~{per * args.flips:.1f}s "
+          f"for {args.flips} changes")
+    tg.messages.clear(); smtp.messages.clear()
+    tg.requests, tg.fail_first, smtp.connections = 0, 1, 0
+
+    d = AlertDispatcher(app).start()
+    took = []
+    for burst in range(2):
+        t0 = time.monotonic()
+        for i in range(args.flips):
+            d.enqueue(**alert(i))
+        took.append(time.monotonic() - t0)
+        t1 = time.monotonic()
+        want = (burst + 1) * args.flips
+        while min(d.delivered.values()) < want and time.monotonic() - t1 < 120:
+            time.sleep(0.05)
+        with app.app_context():
+            left = AlertOutbox.query.filter_by(state="pending").count()
+        print(f"burst {burst + 1}    : enqueue {took[-1] * 1000:6.1f} ms for {args.flips} changes, "
+              f"delivered in {time.monotonic() - t1:.1f}s (pending left {left})")
+    d.close()
+
+    with app.app_context():
+        states = dict(db.session.query(AlertOutbox.state, db.func.count()).group_by(AlertOutbox.state).all())
+    print(f"telegram   : {len(tg.messages)} messages for {d.delivered['telegram']} alerts "
+          f"({tg.requests} requests, {tg.fail_first} failed and retried)")
+    print(f"email      : {len(smtp.messages)} messages for {d.delivered['email']} alerts "
+          f"over {smtp.connections} SMTP connection(s)")
+    print(f"outbox     : {states}")
+    ok = left == 0 and d.delivered["telegram"] == d.delivered["email"] == 2 * args.flips
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,58 @@
+"""Latency of GET /api/devices (one joined query) vs the old per-device lookup.
+
+    python bench/bench_api_devices.py --devices 100 1000 10000 --history 10000000
+
+The N+1 baseline re-runs the previous implementation (one "latest CheckResult"
+query per device) and is only timed up to --baseline-max devices.
+"""
+import time, argparse, statistics
+
+from stubs import use_temp_db
+from seed import seed
+
+
+def n_plus_one(app):
+    from sqlalchemy import desc
+    from app.models import Device, CheckResult
+    with app.app_context():
+        for d in Device.query.order_by(Device.id.asc()).all():
+            (CheckResult.query.filter_by(device_id=d.id)
+             .order_by(desc(CheckResult.created_at)).first())
+
+
+def timed_ms(fn, repeat):
+    out = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        out.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(out)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--devices", type=int, nargs="+", default=[100, 1000, 10000])
+    ap.add_argument("--history", type=int, default=1_000_000, help="raw check_results rows")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--baseline-max", type=int, default=1000)
+    args = ap.parse_args()
+
+    for n in args.devices:
+        url = use_temp_db(f"bench_api_devices_{n}.db")
+        from app import create_app
+        from app.latest_status import backfill_latest_status
+        app = create_app()
+        t0 = time.monotonic()
+        seed(url, n, args.history)
+        with app.app_context():
+            backfill_latest_status()
+        print(f"[{n} devices] seeded {args.history} rows in {time.monotonic() - t0:.1f}s")
+
+        client = app.test_client()
+        assert client.get("/api/devices").status_code == 200
+        ms = timed_ms(lambda: client.get("/api/devices"), args.repeat)
+        line = f"[{n} devices] /api/devices median {ms:8.1f} ms"
+        if n <= args.baseline_max:
+            base = timed_ms(lambda: n_plus_one(app), max(1, args.repeat // 2))
+            line += f" | N+1 queries alone {base:9.1f} ms"
+        print(line)
@@ -0,0 +1,63 @@
+"""Peak memory of the streaming history export.
+
+    python bench/bench_export.py --rows 5000000 [--format ndjson] [--gzip]
+
+Seeds one device with --rows raw checks (in a child process so seeding does not
+count), streams the whole export through the Flask test client and reports the
+peak RSS growth. Fails (exit 1) if the export grows RSS by more than --max-mb.
+"""
+import sys, time, argparse, resource
+from multiprocessing import Process
+
+from stubs import use_temp_db
+from seed import seed
+
+
+def rss_mb():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=5_000_000)
+    ap.add_argument("--format", choices=("csv", "ndjson"), default="csv")
+    ap.add_argument("--gzip", action="store_true")
+    ap.add_argument("--max-mb", type=float, default=64)
+    args = ap.parse_args()
+
+    url = use_temp_db("bench_export.db")
+    from app import create_app
+    app = create_app()
+
+    t0 = time.monotonic()
+    p = Process(target=seed, args=(url, 1, args.rows))
+    p.start()
+    p.join()
+    print(f"seeded {args.rows} rows in {time.monotonic() - t0:.1f}s")
+
+    client = app.test_client()
+    qs = f"?format={args.format}" + ("&gzip=1" if args.gzip else "")
+    base = peak = rss_mb()
+    t0 = time.monotonic()
+    resp = client.get(f"/devices/1/history.csv{qs}", buffered=False)
+    size = 0
+    for i, part in enumerate(resp.response):
+        size += len(part)
+        if i % 50 == 0:
+            peak = max(peak, rss_mb())
+    resp.close()
+    peak = max(peak, rss_mb())
+    took = time.monotonic() - t0
+
+    growth = peak - base
+    print(f"exported {size / 1e6:.1f} MB {args.format}{' (gzip)' if args.gzip else ''} in {took:.1f}s "
+          f"({args.rows / took:.0f} rows/s)")
+    print(f"RSS before {base:.1f} MB, peak {peak:.1f} MB, growth {growth:.1f} MB (limit {args.max_mb} MB)")
+    sys.exit(0 if growth <= args.max_mb else 1)
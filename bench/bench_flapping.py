@@ -0,0 +1,79 @@
+"""Alert volume and cost of the status state machine (last_state.StatusTracker).
+
+    python bench/bench_flapping.py --devices 10000 --checks 200
+
+Replays synthetic check streams through the old rule (alert whenever the status
+differs from the previous check) and through StatusTracker. The device mix is
+stable hosts, hosts whose latency jitters around DEGRADED_MS, hosts that flap
+between up and down, and hosts that go down once and stay down.
+Exits 1 if a real outage was not alerted.
+"""
+import time, random, argparse
+
+from stubs import use_temp_db
+
+ap = argparse.ArgumentParser()
+ap.add_argument("--devices", type=int, default=10000)
+ap.add_argument("--checks", type=int, default=200, help="checks per device")
+ap.add_argument("--seed", type=int, default=1)
+args = ap.parse_args()
+
+use_temp_db("bench_flapping.db")   # last_state imports the app models
+
+from probes import DEGRADED_MS
+from last_state import StatusTracker
+
+rng = random.Random(args.seed)
+KINDS = ("stable", "jitter", "flap", "outage")
+
+
+def sample(kind, i):
+    if kind == "stable":
+        return "up", rng.uniform(5, 50)
+    if kind == "jitter":
+        ms = rng.gauss(DEGRADED_MS, DEGRADED_MS * 0.05)
+        return ("degraded" if ms >= DEGRADED_MS else "up"), ms
+    if kind == "flap":
+        return ("down", None) if rng.random() < 0.5 else ("up", rng.uniform(5, 50))
+    return ("down", None) if i >= args.checks // 2 else ("up", rng.uniform(5, 50))
+
+
+devices = [(d, KINDS[d % len(KINDS)]) for d in range(args.devices)]
+streams = {d: [sample(k, i) for i in range(args.checks)] for d, k in devices}
+
+old = {k: 0 for k in KINDS}
+for d, k in devices:
+    prev = None
+    for status, _ in streams[d]:
+        if prev is not None and status != prev:
+            old[k] += 1
+        prev = status
+
+tracker = StatusTracker()
+new = {k: 0 for k in KINDS}
+suppressed = {k: 0 for k in KINDS}
+outage_alerted = set()
+t0 = time.perf_counter()
+for i in range(args.checks):
+    for d, k in devices:
+        status, ms = streams[d][i]
+        t = tracker.observe(d, status, ms)
+        if t.alert and i > 0:
+            new[k] += 1
+            if k == "outage" and t.alert == "change" and t.confirmed == "down":
+                outage_alerted.add(d)
+        if t.changed and t.flapping:
+            suppressed[k] += 1
+elapsed = time.perf_counter() - t0
+n = args.devices * args.checks
+
+print(f"{args.devices} devices x {args.checks} checks, DEGRADED_MS={DEGRADED_MS}")
+print(f"{'kind':8} {'old alerts':>11} {'new alerts':>11} {'suppressed':>11}")
+for k in KINDS:
+    print(f"{k:8} {old[k]:11d} {new[k]:11d} {suppressed[k]:11d}")
+print(f"{'total':8} {sum(old.values()):11d} {sum(new.values()):11d} {sum(suppressed.values()):11d}")
+print(f"observe(): {elapsed / n * 1e6:.2f} us per result ({n} results)")
+
+outages = sum(1 for _, k in devices if k == "outage")
+print(f"outages alerted: {len(outage_alerted)}/{outages}")
+raise SystemExit(0 if len(outage_alerted) == outages else 1)
@@ -0,0 +1,149 @@
+"""Recent-window history from the hot tier (app/hot_tier.py) vs SQLite.
+
+    python bench/bench_hot_tier.py --devices 500 --history 1000000 --requests 2000
+
+Seeds raw history, loads each device's newest HOT_TIER_POINTS checks into the
+ring file the way the monitor's writer does, then times the same requests with
+the ring and with it switched off (every read from SQLite):
+  columnar  /api/devices/<id>/history?format=columnar&resolution=raw&from=<--window-min ago>
+  detail    /devices/<id>?resolution=raw&limit=1000
+Checks that both answer the same points, that a reader sees no torn or
+out-of-order ring while a writer thread appends, and that the ring reads back
+the same after the file is reopened (a restart). Exits 1 on any mismatch.
+"""
+import os, sys, time, random, sqlite3, argparse, threading
+from datetime import datetime, timedelta
+
+from stubs import use_temp_db
+
+ap = argparse.ArgumentParser()
+ap.add_argument("--devices", type=int, default=500)
+ap.add_argument("--history", type=int, default=1_000_000, help="raw check_results rows seeded first")
+ap.add_argument("--requests", type=int, default=2000, help="per endpoint and mode")
+ap.add_argument("--window-min", type=float, default=120, help="columnar range, minutes back from now")
+ap.add_argument("--seconds", type=float, default=3, help="concurrent writer/reader check")
+args = ap.parse_args()
+
+db_url = use_temp_db("bench_hot_tier.db")
+os.environ["METRICS_PORT"] = "0"
+
+import io, contextlib
+from seed import seed, sqlite_path
+from app import create_app
+from app import hot_tier
+
+if os.path.exists(sqlite_path(db_url) + ".hot"):
+    os.remove(sqlite_path(db_url) + ".hot")
+with contextlib.redirect_stdout(io.StringIO()):
+    app = create_app()
+seed(db_url, args.devices, args.history)
+
+# ---- backfill the ring from SQLite, through the same append() the writer's on_flush calls
+t = time.perf_counter()
+with app.app_context():
+    writer = hot_tier.open_writer(app)
+con = sqlite3.connect(sqlite_path(db_url))
+writer.track({i: hot_tier.generation(datetime.fromisoformat(c) if c else None)
+              for i, c in con.execute("SELECT id, created_at FROM devices")})
+for device_id in range(1, args.devices + 1):
+    rows = con.execute("SELECT created_at, status, latency_ms FROM check_results WHERE device_id = ? "
+                       "ORDER BY created_at DESC LIMIT ?", (device_id, writer.capacity)).fetchall()
+    writer.append([{"device_id": device_id, "created_at": datetime.fromisoformat(ts), "status": s,
+                    "latency_ms": lat} for ts, s, lat in reversed(rows)])
+con.close()
+size = os.path.getsize(writer.path)
+print(f"{args.devices} devices, {args.history} rows; ring {writer.capacity} points/device, "
+      f"file {size / 1e6:.1f} MB, loaded in {time.perf_counter() - t:.1f}s")
+
+client = app.test_client()
+since = (datetime.utcnow() - timedelta(minutes=args.window_min)).isoformat(sep=" ", timespec="seconds")
+paths = {
+    "columnar": lambda d: f"/api/devices/{d}/history?format=columnar&resolution=raw&from={since}&limit=5000",
+    "detail": lambda d: f"/devices/{d}?resolution=raw&limit=1000",
+}
+
+
+def pct(values, p):
+    s = sorted(values)
+    return s[min(len(s) - 1, int(p / 100.0 * len(s)))]
+
+
+def run(name, mode):
+    app.extensions["hot_tier"] = None if mode == "sqlite" else False   # False: open on first use
+    rng = random.Random(1)
+    lat, served = [], hot_tier.HOT_READS.labels("hot").value()
+    for _ in range(args.requests):
+        path = paths[name](rng.randint(1, args.devices))
+        t = time.perf_counter()
+        resp = client.get(path)
+        lat.append((time.perf_counter() - t) * 1000)
+        assert resp.status_code == 200, (path, resp.status_code)
+    from_ring = hot_tier.HOT_READS.labels("hot").value() - served
+    print(f"{name:8} {mode:6}: p50 {pct(lat, 50):6.2f} ms  p99 {pct(lat, 99):6.2f} ms  "
+          f"{args.requests / (sum(lat) / 1000):7.0f} req/s  (ring served {from_ring:.0f})")
+    return pct(lat, 50)
+
+
+failures = 0
+for name in paths:
+    sql_p50 = run(name, "sqlite")
+    hot_p50 = run(name, "hot")
+    print(f"{name:8} speedup x{sql_p50 / hot_p50:.1f}")
+
+# ---- same answer from both
+for d in random.Random(2).sample(range(1, args.devices + 1), min(50, args.devices)):
+    answers = []
+    for mode in ("sqlite", "hot"):
+        app.extensions["hot_tier"] = None if mode == "sqlite" else False
+        body = client.get(paths["columnar"](d)).get_json()
+        answers.append((body["t"], body["latency_ms"], body["status"]))
+    if answers[0] != answers[1]:
+        failures += 1
+        print(f"mismatch for device {d}: {len(answers[0][0])} sqlite points vs {len(answers[1][0])} ring points")
+print(f"columnar answers compared for 50 devices: {'identical' if not failures else f'{failures} differ'}")
+
+# ---- seqlock: a reader never sees a half-written batch while the writer appends
+reader = hot_tier.HotTier(writer.path)
+stop = threading.Event()
+torn, reads = [0], [0]
+clock = [datetime.utcnow()]
+
+
+def write():
+    while not stop.is_set():
+        clock[0] += timedelta(seconds=1)
+        writer.append([{"device_id": 1, "created_at": clock[0] + timedelta(microseconds=i), "status": "up",
+                        "latency_ms": float(i)} for i in range(64)])
+
+
+def read():
+    while not stop.is_set():
+        recs = reader.read(1)
+        reads[0] += 1
+        # each batch is 64 consecutive µs with latency 0..63; a torn read breaks the order
+        if any(b[0] <= a[0] for a, b in zip(recs, recs[1:])) or len(recs) != writer.capacity:
+            torn[0] += 1
+
+
+threads = [threading.Thread(target=write)] + [threading.Thread(target=read) for _ in range(2)]
+for th in threads:
+    th.start()
+time.sleep(args.seconds)
+stop.set()
+for th in threads:
+    th.join()
+failures += torn[0]
+print(f"concurrent append/read: {reads[0]} reads, {torn[0]} torn or out of order")
+
+# ---- restart: a fresh mapping of the file reads back the same rings
+before = {d: writer.read(d) for d in range(1, args.devices + 1)}
+writer.close()
+reader.close()
+with app.app_context():
+    reopened = hot_tier.open_writer(app)   # the monitor starting again
+reopened.track(writer.generations)
+after = {d: reopened.read(d) for d in range(1, args.devices + 1)}
+same = before == after and all(before.values())
+failures += not same
+print(f"after reopen: {'all rings intact' if same else 'rings differ'}")
+sys.exit(1 if failures else 0)
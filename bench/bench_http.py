@@ -0,0 +1,61 @@
+"""Pooled keep-alive HTTP probes vs a fresh connection per probe.
+
+    python bench/bench_http.py --devices 500 --cycles 5
+
+Points --devices HTTP targets at one local stub (by name, so DNS is part of the
+cost) and runs --cycles probe cycles twice: once on the long-lived probe loop
+(connections and DNS answers reused across cycles) and once starting every
+cycle with an empty pool. Reports cycle time and the latency / TTFB / setup
+time the probes measured.
+"""
+import time, argparse, statistics
+
+from stubs import start_http_stub
+
+import probes
+import http_pool
+
+
+def cycle_stats(results):
+    timed = [r for r in results if r.timings]
+    pick = lambda k: statistics.median(r.timings[k] for r in timed) if timed else float("nan")
+    setup = statistics.median(r.timings["dns"] + r.timings["connect"] + r.timings["tls"] for r in timed) if timed else float("nan")
+    return pick("total"), pick("ttfb"), setup, len(results) - len(timed)
+
+
+def run(label, targets, cycles, fresh):
+    rows = []
+    for _ in range(cycles):
+        if fresh:
+            probes.close_probes()
+        t0 = time.monotonic()
+        res = probes.run_probes(targets)
+        rows.append((time.monotonic() - t0,) + cycle_stats(res))
+    probes.close_probes()
+    # the first pooled cycle is a cold start like every fresh one; report the warm ones
+    warm = rows[1:] if not fresh and len(rows) > 1 else rows
+    took = statistics.median(r[0] for r in warm)
+    total, ttfb, setup = (statistics.median(r[i] for r in warm) for i in (1, 2, 3))
+    failed = sum(r[4] for r in rows)
+    print(f"{label:14s}: cycle {took * 1000:7.1f}ms  latency p50 {total:6.2f}ms  "
+          f"ttfb p50 {ttfb:6.2f}ms  dns+connect+tls p50 {setup:6.2f}ms  failed={failed}")
+    return took
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--devices", type=int, default=500)
+    ap.add_argument("--cycles", type=int, default=5)
+    ap.add_argument("--host", default="localhost")
+    ap.add_argument("--pool", type=int, default=128,
+                    help="idle connections kept per host (HTTP_POOL_PER_HOST); all targets share one host here")
+    args = ap.parse_args()
+    http_pool.HTTP_POOL_PER_HOST = args.pool
+
+    _, port = start_http_stub()
+    targets = [("http", f"http://{args.host}:{port}/d/{i}") for i in range(args.devices)]
+    print(f"{args.devices} http targets on {args.host}:{port}, {args.cycles} cycles, pool {args.pool}/host")
+
+    t_fresh = run("fresh per cycle", targets, args.cycles, fresh=True)
+    t_pool = run("pooled", targets, args.cycles, fresh=False)
+    print(f"pooled cycles are x{t_fresh / t_pool:.1f} faster")
@@ -0,0 +1,49 @@
+"""Native ICMP engine vs one ping process per check, against loopback addresses.
+
+    python bench/bench_icmp.py --hosts 1000
+
+Pings --hosts addresses in 127.0.0.0/8 once through probes.run_probes with the
+in-process socket engine and once with ICMP_MODE=subprocess, and reports the
+cycle time and the RTT each path measured. Needs ping sockets enabled
+(net.ipv4.ping_group_range) or CAP_NET_RAW for the native path.
+"""
+import time, shutil, argparse, statistics
+
+import stubs  # noqa: F401  (puts the repo root on sys.path)
+import icmp
+import probes
+
+
+def hosts(n):
+    return [f"127.{i // 62500}.{i // 250 % 250}.{i % 250 + 1}" for i in range(n)]
+
+
+def run(mode, targets):
+    probes.ICMP_MODE = mode
+    t0 = time.monotonic()
+    res = probes.run_probes(targets)
+    took = time.monotonic() - t0
+    rtts = sorted(r.latency for r in res if r.latency is not None)
+    down = len(res) - len(rtts)
+    if rtts:
+        p50, p99 = statistics.median(rtts), rtts[min(len(rtts) - 1, int(len(rtts) * 0.99))]
+        print(f"{mode:10s}: {took:7.2f}s  down={down}  rtt p50={p50:.3f}ms p99={p99:.3f}ms")
+    else:
+        print(f"{mode:10s}: {took:7.2f}s  down={down}")
+    return took
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--hosts", type=int, default=1000)
+    args = ap.parse_args()
+    targets = [("icmp", h) for h in hosts(args.hosts)]
+
+    t_native = run("auto", targets)
+    if icmp._unavailable:
+        print(f"(native engine unavailable: {icmp._unavailable})")
+    if shutil.which("ping"):
+        t_sub = run("subprocess", targets)
+        print(f"native is x{t_sub / t_native:.1f} faster")
+    else:
+        print("no ping command on PATH; skipping the subprocess run")
@@ -0,0 +1,138 @@
+"""Push ingestion throughput: POST /api/ingest against one gunicorn sync worker.
+
+    python bench/bench_ingest.py --devices 1000 --requests 2000 --per-request 50 --samples 10
+
+Starts `gunicorn -w 1` (one process, one request at a time) on a throwaway
+database, gives --devices devices agent tokens, then --clients threads post
+gzip'd batches of --per-request devices x --samples samples each, the way a
+fleet of agents would. Bodies are built up front so the client side costs little.
+Reports accepted samples/s and request p50/p99, then checks every accepted
+sample reached host_samples. Exits 1 on a failed request, a lost sample, or
+fewer than --min-rate samples/s.
+"""
+import os, sys, json, gzip, time, random, socket, argparse, threading, subprocess
+import http.client
+
+from stubs import use_temp_db, ROOT
+
+ap = argparse.ArgumentParser()
+ap.add_argument("--devices", type=int, default=1000)
+ap.add_argument("--requests", type=int, default=2000)
+ap.add_argument("--per-request", type=int, default=50, help="devices per request")
+ap.add_argument("--samples", type=int, default=10, help="samples per device per request")
+ap.add_argument("--clients", type=int, default=8)
+ap.add_argument("--min-rate", type=float, default=2000, help="accepted samples/s below this fail the run")
+args = ap.parse_args()
+
+db_url = use_temp_db("bench_ingest.db")
+os.environ["METRICS_PORT"] = "0"
+
+import io, contextlib
+from app import create_app, db
+from app.models import Device, HostSample
+from app.ingest import issue_token
+
+with contextlib.redirect_stdout(io.StringIO()):
+    app = create_app()
+with app.app_context():
+    devices = [Device(name=f"host-{i}", host=f"10.1.{i // 250}.{i % 250 + 1}", kind="icmp")
+               for i in range(args.devices)]
+    db.session.add_all(devices)
+    db.session.flush()
+    tokens = {d.id: issue_token(d) for d in devices}
+    db.session.commit()
+    db.session.remove()
+    db.engine.dispose()
+
+rng = random.Random(7)
+ids = list(tokens)
+now = time.time()
+
+def body():
+    groups = []
+    for device_id in rng.sample(ids, min(args.per_request, len(ids))):
+        samples = [[round(now - rng.uniform(0, 60), 3), round(rng.uniform(0, 100), 1),
+                    round(rng.uniform(20, 90), 1)] for _ in range(args.samples)]
+        groups.append({"id": device_id, "token": tokens[device_id], "samples": samples})
+    return gzip.compress(json.dumps({"devices": groups}).encode(), 5)
+
+bodies = [body() for _ in range(min(args.requests, 200))]
+per_request = args.per_request * args.samples
+print(f"{args.devices} devices; {args.requests} requests of {per_request} samples "
+      f"(~{sum(map(len, bodies)) // len(bodies)} bytes gzip'd) from {args.clients} clients")
+
+# ---- one gunicorn sync worker
+s = socket.socket()
+s.bind(("127.0.0.1", 0))
+port = s.getsockname()[1]
+s.close()
+env = dict(os.environ, DATABASE_URL=db_url)
+server = subprocess.Popen([sys.executable, "-m", "gunicorn", "-w", "1", "-b", f"127.0.0.1:{port}",
+                           "--log-level", "warning", "run:app"],
+                          cwd=ROOT, env=env, stdout=subprocess.DEVNULL)
+deadline = time.time() + 30
+while True:
+    try:
+        socket.create_connection(("127.0.0.1", port), timeout=1).close()
+        break
+    except OSError:
+        if time.time() > deadline or server.poll() is not None:
+            sys.exit("gunicorn did not start")
+        time.sleep(0.2)
+
+lock = threading.Lock()
+latencies, accepted, failed = [], [0], [0]
+
+def client(n, offset):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    for i in range(n):
+        data = bodies[(offset + i) % len(bodies)]
+        t = time.perf_counter()
+        try:
+            conn.request("POST", "/api/ingest", body=data,
+                         headers={"Content-Type": "application/json", "Content-Encoding": "gzip"})
+            resp = conn.getresponse()
+            out = resp.read()
+            ok = resp.status == 202
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+            ok, out = False, b""
+        ms = (time.perf_counter() - t) * 1000
+        with lock:
+            latencies.append(ms)
+            if ok:
+                accepted[0] += json.loads(out)["accepted"]
+            else:
+                failed[0] += 1
+    conn.close()
+
+threads = [threading.Thread(target=client, args=(args.requests // args.clients + (c < args.requests % args.clients),
+                                                 c * 37)) for c in range(args.clients)]
+t0 = time.perf_counter()
+for th in threads:
+    th.start()
+for th in threads:
+    th.join()
+wall = time.perf_counter() - t0
+
+# the worker's writer commits within WRITE_FLUSH_MS; wait for the count to settle
+with app.app_context():
+    stored, last = -1, time.monotonic()
+    give_up = last + 60
+    while time.monotonic() - last < 2 and time.monotonic() < give_up:
+        n = db.session.query(HostSample.id).count()
+        db.session.remove()
+        if n != stored:
+            stored, last = n, time.monotonic()
+        time.sleep(0.2)
+server.terminate()
+server.wait(10)
+
+lat = sorted(latencies)
+pct = lambda p: lat[min(len(lat) - 1, int(p / 100.0 * len(lat)))]
+rate = accepted[0] / wall
+print(f"accepted {accepted[0]} samples in {wall:.2f}s: {rate:,.0f} samples/s, {len(lat) / wall:.1f} req/s")
+print(f"request latency p50 {pct(50):.1f} ms  p99 {pct(99):.1f} ms  max {lat[-1]:.1f} ms; failed requests {failed[0]}")
+print(f"host_samples rows {stored} (accepted {accepted[0]})")
+sys.exit(1 if failed[0] or stored != accepted[0] or rate < args.min_rate else 0)
@@ -0,0 +1,69 @@
+"""Cycle time of one-at-a-time checks vs the async probe engine against local stubs.
+
+    python bench/bench_probes.py --devices 1000 --slow 50 --refused 100
+
+Slow HTTP targets answer after --slow-delay seconds, i.e. past HTTP_TIMEOUT_S,
+so the serial path pays one full timeout per slow device while the engine pays
+roughly one timeout for the whole cycle.
+"""
+import os, time, argparse
+
+os.environ.setdefault("HTTP_TIMEOUT_S", "0.5")
+os.environ.setdefault("TCP_TIMEOUT_S", "0.5")
+
+from stubs import start_http_stub, closed_port
+
+import probes
+
+
+def build_targets(n, slow, refused, slow_delay):
+    _, fast_port = start_http_stub()
+    _, slow_port = start_http_stub(delay_s=slow_delay)
+    _, tcp_port = start_http_stub()
+    dead_port = closed_port()
+
+    targets = []
+    for i in range(n):
+        if i < slow:
+            targets.append(("http", f"http://127.0.0.1:{slow_port}/slow"))
+        elif i < slow + refused:
+            targets.append(("tcp", f"127.0.0.1:{dead_port}"))
+        elif i % 2:
+            targets.append(("tcp", f"127.0.0.1:{tcp_port}"))
+        else:
+            targets.append(("http", f"http://127.0.0.1:{fast_port}/"))
+    return targets
+
+
+def run_serial(targets):
+    # the pre-engine behaviour: one device at a time, each waiting for the last
+    return [probes.run_probes([t])[0] for t in targets]
+
+
+def timed(fn, *a):
+    t0 = time.monotonic()
+    out = fn(*a)
+    return time.monotonic() - t0, out
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--devices", type=int, default=1000)
+    ap.add_argument("--slow", type=int, default=50)
+    ap.add_argument("--refused", type=int, default=100)
+    ap.add_argument("--slow-delay", type=float, default=2.0)
+    ap.add_argument("--no-serial", action="store_true")
+    args = ap.parse_args()
+
+    targets = build_targets(args.devices, args.slow, args.refused, args.slow_delay)
+    print(f"{len(targets)} targets: {args.slow} slow http, {args.refused} refused tcp, "
+          f"http timeout={probes.HTTP_TIMEOUT_S}s")
+
+    t_async, res = timed(probes.run_probes, targets)
+    down = sum(1 for r in res if r[0] == "down")
+    print(f"async engine : {t_async:7.2f}s  down={down}")
+
+    if not args.no_serial:
+        t_serial, res = timed(run_serial, targets)
+        down = sum(1 for r in res if r[0] == "down")
+        print(f"serial checks: {t_serial:7.2f}s  down={down}  (x{t_serial / t_async:.1f})")
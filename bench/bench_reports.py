@@ -0,0 +1,179 @@
+"""30-day uptime/SLA report for the whole fleet (app/reports.py).
+
+    python bench/bench_reports.py --devices 1000 --days 30
+
+Builds a per-minute model of every device (2 checks a minute, a few outages of
+a few minutes to an hour, some degraded checks) and stores it the way the
+monitor would have left it: 1d and 1h buckets for the whole range, 1m buckets
+for the edges of the window plus every minute with a failed check elsewhere,
+and raw checks for the last minutes the rollups haven't reached. Then times
+the report cold and cached, and a per-device baseline (one rollup query per
+device, summed in Python), and checks uptime, outage counts and downtime
+against the model. Exits 1 on a mismatch or when the cold report takes longer
+than --max-ms.
+"""
+import os, sys, time, sqlite3, argparse
+from datetime import datetime, timedelta
+
+from stubs import use_temp_db
+
+ap = argparse.ArgumentParser()
+ap.add_argument("--devices", type=int, default=1000)
+ap.add_argument("--days", type=int, default=30)
+ap.add_argument("--outages", type=float, default=3, help="mean outages per device")
+ap.add_argument("--max-ms", type=float, default=1000)
+args = ap.parse_args()
+
+db_url = use_temp_db("bench_reports.db")
+os.environ["METRICS_PORT"] = "0"
+os.environ["RETAIN_1M_DAYS"] = str(args.days + 2)   # the report's first minutes still have 1m buckets
+
+import io, contextlib
+import numpy as np
+from seed import sqlite_path
+from app import create_app, db
+from app.models import CheckRollup
+from app.rollups import EPOCH
+from app.reports import build_report, cached_report
+
+with contextlib.redirect_stdout(io.StringIO()):
+    app = create_app()
+
+D, M = args.devices, args.days * 1440 + 2 * 60   # model minutes: the window plus two hours before it
+now = datetime.utcnow().replace(second=0, microsecond=0)
+end = now
+start = end - timedelta(days=args.days)
+t0_min = (start - EPOCH) // timedelta(minutes=1) - 2 * 60   # first model minute
+rng = np.random.default_rng(7)
+
+# ---- the model: checks, down and degraded checks, latency avg/p95 per device-minute
+count = np.full((D, M), 2, dtype=np.int8)   # int8/float32 keep 1000 devices x 30 days in memory
+down = np.zeros((D, M), dtype=np.int8)
+for d in range(D):
+    for _ in range(rng.poisson(args.outages)):
+        a = int(rng.integers(0, M - 60))
+        length = int(rng.integers(2, 60))
+        down[d, a:a + length] = 2
+        down[d, a] = max(down[d, a] - 1, 1)   # outages start and end mid-minute
+        down[d, a + length - 1] = 1
+degraded = ((rng.random((D, M), dtype=np.float32) < 0.01) & (down == 0)).astype(np.int8)
+up = count - down - degraded
+base = rng.lognormal(3, 0.5, D).astype(np.float32)[:, None]
+lat_n = count - down
+lat_avg = np.where(lat_n > 0, base * (0.8 + 0.4 * rng.random((D, M), dtype=np.float32)), np.nan).astype(np.float32)
+lat_p95 = lat_avg * 1.3
+
+def ts(minute):
+    return (EPOCH + timedelta(minutes=int(minute))).isoformat(sep=" ", timespec="microseconds")
+
+def rollup_rows(width_min, sel=None):
+    # aggregate the model into width_min-minute buckets (sel: per-minute mask of 1m rows to keep)
+    if width_min == 1:
+        d_idx, m_idx = np.nonzero(sel)
+        for d, m in zip(d_idx.tolist(), m_idx.tolist()):
+            yield (60, d + 1, ts(t0_min + m), 2, int(up[d, m]), int(down[d, m]), int(degraded[d, m]),
+                   int(lat_n[d, m]), *(None if np.isnan(v) else float(v)
+                                       for v in (lat_avg[d, m], lat_avg[d, m], lat_avg[d, m], lat_p95[d, m])))
+        return
+    first = -(-t0_min // width_min) * width_min - t0_min
+    n = (M - first) // width_min
+    sl = slice(first, first + n * width_min)
+    shape = (D, n, width_min)
+    agg = lambda a: a[:, sl].reshape(shape)
+    c, u, dn, dg, ln = (agg(a).sum(axis=2) for a in (count, up, down, degraded, lat_n))
+    w = np.nan_to_num(agg(lat_avg) * agg(lat_n))
+    avg = np.where(ln > 0, w.sum(axis=2) / np.maximum(ln, 1), np.nan)
+    mn, mx = np.nanmin(agg(lat_avg), axis=2), np.nanmax(agg(lat_avg), axis=2)
+    p95 = np.nanpercentile(agg(lat_p95), 95, axis=2)
+    for d in range(D):
+        for k in range(n):
+            yield (width_min * 60, d + 1, ts(t0_min + first + k * width_min), int(c[d, k]), int(u[d, k]),
+                   int(dn[d, k]), int(dg[d, k]), int(ln[d, k]),
+                   *(None if np.isnan(v) else float(v) for v in (avg[d, k], mn[d, k], mx[d, k], p95[d, k])))
+
+# ---- store it like the monitor would have
+t = time.perf_counter()
+raw_from = M - 3                      # last 3 minutes not rolled up yet
+edge = np.zeros((D, M), dtype=bool)
+edge[:, :4 * 60] = True               # around the window's start
+edge[:, M - 4 * 60:raw_from] = True   # and its end
+minute_sel = (edge | (down > 0))
+minute_sel[:, raw_from:] = False
+con = sqlite3.connect(sqlite_path(db_url))
+con.execute("PRAGMA synchronous=OFF")
+con.executemany("INSERT INTO devices (id, name, host, kind, enabled, interval_s, created_at) "
+                "VALUES (?, ?, ?, 'icmp', 1, 30, ?)",
+                ((d, f"dev-{d}", f"10.0.{d // 250}.{d % 250 + 1}", ts(t0_min)) for d in range(1, D + 1)))
+sql = ("INSERT INTO check_rollups (resolution, device_id, bucket_start, count, up_count, down_count, "
+       "degraded_count, latency_count, latency_avg, latency_min, latency_max, latency_p95) "
+       "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)")
+for width in (1440, 60, 1):
+    con.executemany(sql, rollup_rows(width, minute_sel))
+raw = []
+for d in range(D):
+    for m in range(raw_from, M):
+        statuses = ["down"] * int(down[d, m]) + ["degraded"] * int(degraded[d, m]) + ["up"] * int(up[d, m])
+        for i, s in enumerate(statuses):
+            lat = None if s == "down" else float(lat_avg[d, m])
+            raw.append((d + 1, s, lat, "ok", (EPOCH + timedelta(minutes=t0_min + m, seconds=30 * i))
+                        .isoformat(sep=" ", timespec="microseconds")))
+con.executemany("INSERT INTO check_results (device_id, status, latency_ms, message, created_at) "
+                "VALUES (?, ?, ?, ?, ?)", raw)
+wm_1m = EPOCH + timedelta(minutes=t0_min + raw_from)
+wm_1h = wm_1m.replace(minute=0)
+wm_1d = wm_1h.replace(hour=0)
+con.executemany("INSERT INTO config (key, value) VALUES (?, ?)",
+                [("ROLLUP_WM_1m", wm_1m.isoformat()), ("ROLLUP_WM_1h", wm_1h.isoformat()),
+                 ("ROLLUP_WM_1d", wm_1d.isoformat())])
+con.commit()
+rollups = con.execute("SELECT resolution, count(*) FROM check_rollups GROUP BY resolution").fetchall()
+con.close()
+print(f"{D} devices, {args.days} days: rollup rows {dict(rollups)}, raw rows {len(raw)} "
+      f"(stored in {time.perf_counter() - t:.0f}s)")
+
+# ---- timings
+with app.app_context():
+    t = time.perf_counter()
+    report = build_report(start, end)
+    cold = (time.perf_counter() - t) * 1000
+    cached_report(start, end)
+    t = time.perf_counter()
+    cached_report(start, end)
+    warm = (time.perf_counter() - t) * 1000
+    db.session.remove()
+
+    # baseline: one rollup query per device, Python sums (uptime only)
+    t = time.perf_counter()
+    for d in range(1, D + 1):
+        rows = CheckRollup.query.filter(CheckRollup.resolution == 3600, CheckRollup.device_id == d,
+                                        CheckRollup.bucket_start >= start, CheckRollup.bucket_start < end).all()
+        sum(r.up_count + r.degraded_count for r in rows) / max(1, sum(r.count for r in rows))
+    naive = (time.perf_counter() - t) * 1000
+    db.session.remove()
+
+print("sources: " + ", ".join(f"{s['resolution']} {s['from'][:16]}..{s['to'][:16]}" for s in report["sources"]))
+print(f"report cold {cold:.0f} ms, cached {warm:.2f} ms; per-device baseline (uptime only) {naive:.0f} ms")
+
+# ---- against the model
+w0 = (start - EPOCH) // timedelta(minutes=1) - t0_min
+win = slice(w0, M)
+exp_count = count[:, win].sum(axis=1)
+exp_up = (up + degraded)[:, win].sum(axis=1)
+exp_downtime = down[:, win].sum(axis=1) * 30
+d_win = down[:, win] > 0
+starts = d_win & ~np.concatenate([np.zeros((D, 1), dtype=bool), d_win[:, :-1]], axis=1)
+exp_outages = starts.sum(axis=1)
+bad = 0
+for i, row in enumerate(report["devices"]):
+    want_up = round(exp_up[i] / exp_count[i] * 100, 4)
+    if (row["checks"] != exp_count[i] or row["uptime_pct"] != want_up or row["outages"] != exp_outages[i]
+            or row["downtime_s"] != exp_downtime[i]):
+        bad += 1
+        if bad <= 5:
+            print(f"device {row['id']}: got checks {row['checks']} uptime {row['uptime_pct']} outages "
+                  f"{row['outages']} downtime {row['downtime_s']}; want {exp_count[i]} {want_up} "
+                  f"{exp_outages[i]} {exp_downtime[i]}")
+fleet = report["fleet"]
+print(f"fleet uptime {fleet['uptime_pct']}%, {fleet['outages']} outages, downtime {fleet['downtime_s']}s; "
+      f"{D - bad}/{D} devices match the model")
+sys.exit(1 if bad or cold > args.max_ms else 0)
@@ -0,0 +1,89 @@
+"""Rebalancing of sharded monitor workers: nothing lost, nothing probed twice.
+
+    python bench/bench_sharding.py --devices 10000
+
+Drives sharding.Shard objects through a simulated timeline against a real
+monitor_workers table (temp SQLite): three workers start, a fourth joins, one
+leaves cleanly, one crashes. Every simulated second each live worker computes
+the devices it owns from its own last read of the table, the way monitor.py
+does. Reports how many devices moved at each change (ideal ~1/N) and fails
+(exit 1) if a device is ever owned by two workers, or by none outside the
+lease window of a crashed worker. tests/test_sharding.py asserts the same
+timeline under pytest; this script is for watching the moves at scale.
+"""
+import sys, argparse
+from datetime import datetime, timedelta
+
+from stubs import use_temp_db
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--devices", type=int, default=10000)
+    args = ap.parse_args()
+
+    use_temp_db("bench_sharding.db")
+    from app import create_app
+    import sharding
+    app = create_app()
+
+    HB, SETTLE, LEASE = 5, 15, 30
+    devices = range(1, args.devices + 1)
+    t0 = datetime(2030, 1, 1)
+    # name -> (start second, clean leave second or None, crash second or None)
+    plan = {
+        "w1": (0, None, None),
+        "w2": (1, None, 150),     # crashes: its devices are unowned until its lease runs out
+        "w3": (2, 90, None),      # leaves cleanly
+        "w4": (60, None, None),   # joins later
+    }
+    expected_gap = (150, 150 + LEASE + HB)   # crash window where unowned devices are allowed
+
+    shards = {}
+    owned = {}
+    prev = None
+    dup_seconds = lost_seconds = 0
+    with app.app_context():
+        for sec in range(0, 240):
+            now = t0 + timedelta(seconds=sec)
+            for name, (start, leave_at, crash_at) in plan.items():
+                if sec < start or (crash_at is not None and sec >= crash_at):
+                    continue
+                sh = shards.get(name)
+                if sh is None:
+                    sh = shards[name] = sharding.Shard(name, settle_s=SETTLE, lease_s=LEASE)
+                if leave_at is not None and sec == leave_at:
+                    sh.leave(now)
+                elif (sec - start) % HB == 0:
+                    sh.heartbeat(now)
+                if sh.update(now) or name not in owned:
+                    owned[name] = {d for d in devices if sh.owns(d)}
+                if sh.active_until is not None and not sh.active:
+                    owned[name] = set()
+            for name, (start, _, crash_at) in plan.items():
+                if crash_at is not None and sec >= crash_at:
+                    owned[name] = set()   # a dead worker probes nothing
+
+            counts = {}
+            for s in owned.values():
+                for d in s:
+                    counts[d] = counts.get(d, 0) + 1
+            dup = sum(1 for c in counts.values() if c > 1)
+            lost = args.devices - len(counts)
+            if sec > SETTLE + 2:   # before the first workers activate nothing is owned yet
+                dup_seconds += bool(dup)
+                if lost and not (expected_gap[0] <= sec < expected_gap[1]):
+                    lost_seconds += 1
+            snapshot = {n: frozenset(s) for n, s in owned.items() if s}
+            if prev is not None and snapshot != prev:
+                before = {d: n for n, s in prev.items() for d in s}
+                moved = sum(1 for n, s in snapshot.items() for d in s if before.get(d) not in (None, n))
+                adopted = sum(1 for s in snapshot.values() for d in s if d not in before)
+                sizes = {n: len(s) for n, s in sorted(snapshot.items())}
+                print(f"t={sec:3d}s workers={sizes} moved={moved} ({moved / args.devices:.0%}) adopted={adopted} "
+                      f"duplicated={dup} unowned={lost}")
+            prev = snapshot
+
+    print(f"seconds with a device owned twice: {dup_seconds}; "
+          f"seconds with unowned devices outside a crashed worker's lease: {lost_seconds}")
+    sys.exit(1 if dup_seconds or lost_seconds else 0)
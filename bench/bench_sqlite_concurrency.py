@@ -0,0 +1,153 @@
+"""Dashboard reads while the monitor writes: the SQLite engine profile (app/db_profile.py).
+
+    python bench/bench_sqlite_concurrency.py --rate 500 --readers 50 --seconds 20
+    python bench/bench_sqlite_concurrency.py --no-profile     # rollback journal, FULL sync, reads on the writer pool
+
+A writer process commits --rate results per second (--batch rows per commit,
+default 1: the worst case of a commit per device check) through ResultWriter,
+including the device_latest_status upsert, while --readers threads in this
+process request /api/devices and device history the way dashboards do.
+Reports reader p50/p99/max, the writer's achieved rate and commit latency, and
+every "database is locked" error seen on either side. Exits 1 on any lock error.
+"""
+import os, sys, json, time, random, argparse, threading, subprocess
+
+from stubs import use_temp_db
+
+ap = argparse.ArgumentParser()
+ap.add_argument("--devices", type=int, default=1000)
+ap.add_argument("--history", type=int, default=200_000, help="raw check_results rows seeded first")
+ap.add_argument("--rate", type=float, default=500, help="writer rows per second")
+ap.add_argument("--batch", type=int, default=1, help="rows per writer commit")
+ap.add_argument("--readers", type=int, default=50)
+ap.add_argument("--seconds", type=float, default=20)
+ap.add_argument("--no-profile", action="store_true", help="approximate the old defaults for comparison")
+ap.add_argument("--writer", help=argparse.SUPPRESS)   # internal: run as the writer process on this DB URL
+args = ap.parse_args()
+
+if args.no_profile:
+    os.environ.update(SQLITE_WAL="false", SQLITE_SYNCHRONOUS="FULL", SQLITE_MMAP_MB="0",
+                      SQLITE_CACHE_MB="2", SQLITE_BUSY_TIMEOUT_MS="5000", DB_READ_ONLY_ROUTES="false")
+os.environ["METRICS_PORT"] = "0"
+
+
+def pct(values, p):
+    s = sorted(values)
+    return round(s[min(len(s) - 1, int(p / 100.0 * len(s)))], 2) if s else None
+
+
+def is_lock_error(e):
+    return "database is locked" in str(e) or "database table is locked" in str(e)
+
+
+# ---- writer process: paced puts into a ResultWriter, stats as the last line on stdout
+if args.writer:
+    os.environ["DATABASE_URL"] = args.writer
+    from datetime import datetime, timezone
+    from app import create_app
+    from app.latest_status import upsert_latest
+    from result_writer import ResultWriter, DB_WRITE_RETRIES
+
+    app = create_app()
+    w = ResultWriter(app, batch_rows=args.batch, flush_ms=1000.0 / args.rate * args.batch)
+    w.txn_hooks.append(upsert_latest)
+    commits = []
+    w.on_flush.append(lambda rows: commits.append(w.last_flush_ms))
+    rng = random.Random(1)
+    t0 = time.monotonic()
+    n = 0
+    while time.monotonic() - t0 < args.seconds:
+        due = t0 + n / args.rate
+        delay = due - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        status = rng.choice(("up", "up", "up", "degraded", "down"))
+        w.put({"device_id": n % args.devices + 1, "status": status,
+               "latency_ms": None if status == "down" else rng.uniform(1, 300), "message": "bench",
+               "created_at": datetime.now(timezone.utc).replace(tzinfo=None)})
+        n += 1
+    w.close()
+    elapsed = time.monotonic() - t0
+    print(json.dumps({"rows": w.rows_written, "rows_per_s": round(w.rows_written / elapsed, 1),
+                       "commits": len(commits), "commit_p50_ms": pct(commits, 50),
+                       "commit_p99_ms": pct(commits, 99), "commit_max_ms": pct(commits, 100),
+                       "retries": int(DB_WRITE_RETRIES._default.value())}), flush=True)
+    sys.exit(0)
+
+
+# ---- seed, start the writer, then read as hard as --readers dashboards can
+db_url = use_temp_db("bench_sqlite_concurrency.db")
+import io, contextlib, sqlite3
+from seed import seed, sqlite_path
+from app import create_app, db
+
+with contextlib.redirect_stdout(io.StringIO()):
+    app = create_app()
+app.config["PROPAGATE_EXCEPTIONS"] = True   # surface OperationalError instead of a 500 page
+seed(db_url, args.devices, args.history)
+if args.no_profile:
+    with app.app_context():
+        db.engine.dispose()   # switching out of WAL needs the only connection
+    con = sqlite3.connect(sqlite_path(db_url))
+    con.execute("PRAGMA journal_mode=DELETE")   # seed() leaves the file in WAL mode
+    con.close()
+with app.app_context():
+    from app.latest_status import backfill_latest_status
+    backfill_latest_status()
+    mode = db.session.execute(db.text("PRAGMA journal_mode")).scalar()
+    db.session.remove()
+print(f"{args.devices} devices, {args.history} history rows, journal_mode={mode}, "
+      f"read-only routes {'off' if args.no_profile else 'on'}")
+
+writer = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--writer", db_url,
+                           "--devices", str(args.devices), "--rate", str(args.rate),
+                           "--batch", str(args.batch), "--seconds", str(args.seconds)]
+                          + (["--no-profile"] if args.no_profile else []),
+                          stdout=subprocess.PIPE, text=True)
+
+lock = threading.Lock()
+latencies, locked, errors = {"/api/devices": [], "history": []}, [0], [0]
+stop = threading.Event()
+
+
+def reader(i):
+    rng = random.Random(i)
+    client = app.test_client()
+    while not stop.is_set():
+        if rng.random() < 0.5:
+            name, path = "/api/devices", "/api/devices"
+        else:
+            name, path = "history", f"/api/devices/{rng.randint(1, args.devices)}/history?limit=200"
+        t = time.perf_counter()
+        try:
+            ok = client.get(path).status_code == 200
+            lock_err = False
+        except Exception as e:
+            ok, lock_err = False, is_lock_error(e)
+        ms = (time.perf_counter() - t) * 1000
+        with lock:
+            latencies[name].append(ms)
+            errors[0] += not ok
+            locked[0] += lock_err
+
+
+threads = [threading.Thread(target=reader, args=(i,), daemon=True) for i in range(args.readers)]
+for th in threads:
+    th.start()
+time.sleep(args.seconds)   # readers overlap the writer's paced phase; its final drain runs alone
+stop.set()
+for th in threads:
+    th.join()
+out, _ = writer.communicate()
+lines = out.strip().splitlines()
+w = json.loads(lines[-1])
+w["locked"] = sum(1 for line in lines if is_lock_error(line))   # the writer logs each failed batch
+
+print(f"writer : {w['rows']} rows, {w['rows_per_s']} rows/s (target {args.rate:g}), {w['commits']} commits, "
+      f"commit p50 {w['commit_p50_ms']} ms p99 {w['commit_p99_ms']} ms max {w['commit_max_ms']} ms, "
+      f"retries {w['retries']}, locked {w['locked']}")
+for name, lat in latencies.items():
+    print(f"readers {name:13}: {len(lat):6d} requests, p50 {pct(lat, 50)} ms p99 {pct(lat, 99)} ms "
+          f"max {pct(lat, 100)} ms")
+print(f"reader errors {errors[0]}, of which locked {locked[0]}")
+sys.exit(1 if locked[0] or w["locked"] else 0)
@@ -0,0 +1,122 @@
+"""Dashboard updates: /api/stream fan-out and /api/devices ETag revalidation.
+
+    python bench/bench_stream.py --devices 1000 --clients 200 --rounds 5
+
+Opens --clients SSE connections against a local threaded server, then writes
+--rounds batches of results (every device gets a new latency) the way the
+monitor does and measures how long until every client has seen every change.
+The hub's query count shows the feed costs the same for 1 or 200 clients.
+Also compares a full /api/devices response with a 304 revalidation.
+Exits 1 if a client missed a change.
+"""
+import os, sys, time, json, socket, logging, argparse, threading, statistics
+from datetime import datetime, timezone
+
+os.environ.setdefault("STREAM_POLL_MS", "200")
+
+from stubs import use_temp_db
+
+ap = argparse.ArgumentParser()
+ap.add_argument("--devices", type=int, default=1000)
+ap.add_argument("--clients", type=int, default=200)
+ap.add_argument("--rounds", type=int, default=5)
+args = ap.parse_args()
+
+use_temp_db("bench_stream.db")
+
+from sqlalchemy import event
+from werkzeug.serving import make_server
+from app import create_app, db
+from app.models import Device
+from app.latest_status import upsert_latest
+
+app = create_app()
+with app.app_context():
+    db.session.bulk_save_objects([Device(name=f"d{i}", host=f"10.0.{i // 250}.{i % 250}", kind="icmp")
+                                  for i in range(args.devices)])
+    db.session.commit()
+    ids = [i for (i,) in db.session.query(Device.id)]
+
+hub = app.extensions["change_hub"]
+queries = [0]
+with app.app_context():
+    event.listen(db.engine, "before_cursor_execute", lambda *a: queries.__setitem__(0, queries[0] + 1))
+
+logging.getLogger("werkzeug").setLevel(logging.ERROR)
+srv = make_server("127.0.0.1", 0, app, threaded=True)
+port = srv.server_port
+threading.Thread(target=srv.serve_forever, daemon=True).start()
+
+
+class SseClient(threading.Thread):
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.seen = {}          # device_id -> last latency received
+        self.hello = threading.Event()
+        self.sock = socket.create_connection(("127.0.0.1", port))
+        self.sock.sendall(b"GET /api/stream HTTP/1.1\r\nHost: x\r\nAccept: text/event-stream\r\n\r\n")
+
+    def run(self):
+        f = self.sock.makefile("rb")
+        while f.readline() not in (b"\r\n", b""):
+            pass
+        event = None
+        for line in f:
+            line = line.rstrip(b"\r\n")
+            if line.startswith(b"event: "):
+                event = line[7:].decode()
+            elif line.startswith(b"data: "):
+                if event == "hello":
+                    self.hello.set()
+                elif event == "delta":
+                    for c in json.loads(line[6:]):
+                        self.seen[c["id"]] = c["latency_ms"]
+
+
+clients = [SseClient() for _ in range(args.clients)]
+for c in clients:
+    c.start()
+for c in clients:
+    c.hello.wait(10)
+time.sleep(0.5)   # let the hub take its first snapshot
+print(f"{len(clients)} clients connected, hub sees {hub.clients}")
+
+lags, ok = [], True
+q0, p0 = queries[0], hub.polls
+for r in range(1, args.rounds + 1):
+    latency = float(r)
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    with app.app_context():
+        upsert_latest([{"device_id": i, "status": "up", "latency_ms": latency, "message": "ok",
+                        "created_at": now} for i in ids])
+        db.session.commit()
+    t0 = time.perf_counter()
+    deadline = t0 + 15
+    while time.perf_counter() < deadline:
+        if all(len(c.seen) == len(ids) and all(v == latency for v in c.seen.values()) for c in clients):
+            break
+        time.sleep(0.01)
+    else:
+        ok = False
+    lags.append((time.perf_counter() - t0) * 1000)
+    print(f"round {r}: {len(ids)} changes reached all {len(clients)} clients in {lags[-1]:7.1f} ms")
+polls = max(1, hub.polls - p0)
+print(f"hub: {polls} polls, {(queries[0] - q0) / polls:.1f} queries per poll for {len(clients)} clients, "
+      f"dropped {hub.dropped}")
+
+http = app.test_client()
+def timed(headers):
+    t0 = time.perf_counter()
+    for _ in range(20):
+        resp = http.get("/api/devices", headers=headers)
+    return (time.perf_counter() - t0) * 1000 / 20, resp
+
+full_ms, resp = timed({})
+etag = resp.headers["ETag"]
+cond_ms, resp304 = timed({"If-None-Match": etag})
+print(f"/api/devices full {full_ms:7.1f} ms ({len(resp.data)} bytes) | If-None-Match {cond_ms:6.2f} ms "
+      f"(status {resp304.status_code})")
+print(f"median fan-out lag {statistics.median(lags):.1f} ms")
+
+srv.shutdown()
+sys.exit(0 if ok and resp304.status_code == 304 else 1)
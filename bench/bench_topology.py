@@ -0,0 +1,119 @@
+"""Dependency-aware checks: a synthetic 10k-device network where switches fail.
+
+    python bench/bench_topology.py --devices 10000 --fail 2
+
+Builds a tree (core -> distribution switches -> access switches -> hosts), all
+TCP checks against a local listener. Then --fail distribution switches go dark
+together with everything behind them: their checks time out (TCP_TIMEOUT_S)
+instead of being refused, like hosts behind a dead uplink. The same outage and
+recovery is run twice through monitor.check_targets, once without parent links
+(every device probed and alerted on its own) and once with them. Reports cycle
+times and alerts per phase. Exits 1 if the topology run alerted more than once
+per failed switch per transition, or probed a device behind a down switch after
+the outage was confirmed.
+"""
+import os, sys, time, sqlite3, argparse
+
+os.environ.setdefault("TCP_TIMEOUT_S", "1.0")
+os.environ.setdefault("ALERT_ON_RECOVERY", "true")
+os.environ["METRICS_PORT"] = "0"
+
+from stubs import use_temp_db, start_tcp_stub, start_blackhole
+
+ap = argparse.ArgumentParser()
+ap.add_argument("--devices", type=int, default=10000)
+ap.add_argument("--dist", type=int, default=20, help="distribution switches under the core")
+ap.add_argument("--access", type=int, default=10, help="access switches per distribution switch")
+ap.add_argument("--fail", type=int, default=2, help="distribution switches that go down")
+ap.add_argument("--cycles", type=int, default=3, help="check passes per phase")
+args = ap.parse_args()
+
+db_url = use_temp_db("bench_topology.db")
+
+import io, contextlib
+with contextlib.redirect_stdout(io.StringIO()):
+    import monitor
+from seed import sqlite_path
+from last_state import StatusTracker
+
+_, up_port = start_tcp_stub()
+_held, dark_port = start_blackhole()
+UP, DARK = f"127.0.0.1:{up_port}", f"127.0.0.1:{dark_port}"
+
+# ---- the tree: ids in breadth-first order, so parents always come first
+D = args.devices
+parents = {1: None}
+dist = list(range(2, 2 + args.dist))
+access = list(range(dist[-1] + 1, dist[-1] + 1 + args.dist * args.access))
+for i in dist:
+    parents[i] = 1
+for k, i in enumerate(access):
+    parents[i] = dist[k // args.access]
+for i in range(access[-1] + 1, D + 1):
+    parents[i] = access[(i - access[-1] - 1) % len(access)]
+failed = dist[:args.fail]
+dark = set(failed)
+for i in sorted(parents):
+    if parents[i] in dark:
+        dark.add(i)
+
+con = sqlite3.connect(sqlite_path(db_url))
+con.executemany("INSERT INTO devices (id, name, host, kind, enabled, parent_id) VALUES (?, ?, ?, 'tcp', 1, ?)",
+                ((i, f"dev-{i}", UP, parents[i]) for i in sorted(parents)))
+con.commit()
+print(f"{D} devices: 1 core, {len(dist)} distribution, {len(access)} access switches; "
+      f"{len(failed)} distribution switches fail with {len(dark) - len(failed)} devices behind them")
+
+alerts = []
+monitor.alerts_out.enqueue = lambda device_id, **kw: alerts.append(device_id)   # count instead of delivering
+
+def set_hosts(host, ids):
+    con.executemany("UPDATE devices SET host = ? WHERE id = ?", ((host, i) for i in ids))
+    con.commit()
+
+def set_links(on):
+    con.executemany("UPDATE devices SET parent_id = ? WHERE id = ?",
+                    ((parents[i] if on else None, i) for i in parents))
+    con.commit()
+
+def cycle():
+    n = len(alerts)
+    t = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()), monitor.app.app_context():
+        out = monitor.check_targets(monitor.load_targets())
+    took = time.perf_counter() - t
+    monitor.writer.flush()
+    woken = len(monitor.priority)
+    monitor.priority.clear()
+    probed_dark = sum(1 for d, status, _ in out if d.id in dark and d.id not in failed and status != "unreachable")
+    return took, len(alerts) - n, probed_dark, woken
+
+def scenario(name, links):
+    set_links(links)
+    set_hosts(UP, parents)
+    monitor.last_state = StatusTracker()
+    cycle()   # first sight of every device: confirmed up (and "up" alerts) without counting
+    result = {}
+    for phase, host in (("outage", DARK), ("recovery", UP)):
+        set_hosts(host, dark)
+        rows = [cycle() for _ in range(args.cycles)]
+        result[phase] = rows
+        print(f"{name:<9} {phase:<8} cycle s " + " ".join(f"{r[0]:5.2f}" for r in rows)
+              + f" | alerts {sum(r[1] for r in rows):5d} | probed behind the failed switches "
+              + " ".join(str(r[2]) for r in rows)
+              + (f" | priority rechecks {max(r[3] for r in rows)}" if links else ""))
+    return result
+
+base = scenario("no links", False)
+topo = scenario("topology", True)
+
+def total(res, phase, col):
+    return sum(r[col] for r in res[phase])
+
+for phase in ("outage", "recovery"):
+    b, t = total(base, phase, 0), total(topo, phase, 0)
+    print(f"{phase}: {args.cycles} cycles {b:.1f}s -> {t:.1f}s ({b / t:.1f}x); "
+          f"alerts {total(base, phase, 1)} -> {total(topo, phase, 1)}")
+bad = (total(topo, "outage", 1) > len(failed) or total(topo, "recovery", 1) > len(failed)
+       or any(r[2] for r in topo["outage"][1:]))
+sys.exit(1 if bad else 0)
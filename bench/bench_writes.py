@@ -0,0 +1,61 @@
+"""CheckResult insert throughput: commit-per-row vs the batched ResultWriter.
+
+    python bench/bench_writes.py --rows 20000
+
+Both runs use a fresh file-backed SQLite database so fsync cost is included.
+"""
+import time, argparse
+from datetime import datetime, timezone
+
+from stubs import use_temp_db
+
+
+def make_rows(n, devices=1000):
+    now = datetime.now(timezone.utc)
+    return [
+        {"device_id": i % devices + 1, "status": "up", "latency_ms": i % 200,
+         "message": "http 200", "created_at": now}
+        for i in range(n)
+    ]
+
+
+def per_row(app, rows):
+    from app import db
+    from app.models import CheckResult
+    with app.app_context():
+        for r in rows:
+            db.session.add(CheckResult(**r))
+            db.session.commit()
+
+
+def batched(app, rows):
+    from result_writer import ResultWriter
+    w = ResultWriter(app)
+    for r in rows:
+        w.put(r)
+    w.close()
+    return w
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, default=20000)
+    ap.add_argument("--per-row-rows", type=int, default=2000,
+                    help="rows for the (slow) commit-per-row baseline")
+    args = ap.parse_args()
+
+    use_temp_db("bench_writes.db")
+    from app import create_app
+    app = create_app()
+
+    rows = make_rows(args.per_row_rows)
+    t0 = time.monotonic()
+    per_row(app, rows)
+    base = len(rows) / (time.monotonic() - t0)
+    print(f"commit per row : {base:10.0f} rows/s  ({len(rows)} rows)")
+
+    rows = make_rows(args.rows)
+    t0 = time.monotonic()
+    w = batched(app, rows)
+    rate = len(rows) / (time.monotonic() - t0)
+    print(f"batched writer : {rate:10.0f} rows/s  ({w.rows_written} rows in {w.batches} batches, x{rate / base:.1f})")
@@ -0,0 +1,115 @@
+"""Query-plan regression check for the hot check_results queries.
+
+    python bench/check_query_plans.py
+
+Runs EXPLAIN QUERY PLAN for each query below against a seeded SQLite database
+and exits non-zero if any of them scans a history table without an index.
+Add new hot queries to hot_queries() as they appear.
+"""
+import sys
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, text, desc, asc
+
+from stubs import use_temp_db
+from seed import seed
+
+# tables (and the aliases used for them) that are small enough to scan
+SMALL_TABLES = ("devices", "d", "config", "device_latest_status")
+
+
+@contextmanager
+def captured(engine):
+    # record the SQL + bound parameters the real ORM query sends to SQLite
+    seen = []
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        seen.append((statement, parameters))
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        yield seen
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+
+def hot_queries():
+    from app import db
+    from app.models import CheckResult, CheckRollup
+    from app.routes import _history_query, _iter_history, _history_page
+    from app.rollups import rollup_query, _from_raw, _from_tier
+    now = datetime.utcnow()
+    day = timedelta(days=1)
+    return {
+        "device_detail (newest first, limit)":
+            _history_query(7).order_by(desc(CheckResult.created_at)).limit(200),
+        "device_detail (from/to window)":
+            _history_query(7, now - day, now).order_by(desc(CheckResult.created_at)).limit(200),
+        "api_device_history (oldest first, window)":
+            _history_query(7, now - day, now).order_by(asc(CheckResult.created_at)).limit(500),
+        "api_device_history (cursor page, columnar)":
+            lambda: _history_page(7, now - 30 * day, now, (now - 2 * day, 0), 500, columnar=True),
+        "history export (keyset chunk)":
+            lambda: list(zip(range(3), _iter_history(7, now - 30 * day, now, chunk=50))),
+        "previous status for one device":
+            CheckResult.query.filter_by(device_id=7).order_by(CheckResult.created_at.desc()).limit(1),
+        "delete_device history batch":
+            db.session.query(CheckResult.id).filter(CheckResult.device_id == 7).limit(5000),
+        "retention: raw batch":
+            db.session.query(CheckResult.id).filter(CheckResult.created_at < now - 7 * day)
+            .order_by(CheckResult.created_at.asc()).limit(5000),
+        "retention: rollup batch":
+            db.session.query(CheckRollup.resolution, CheckRollup.device_id, CheckRollup.bucket_start)
+            .filter(CheckRollup.resolution == 60, CheckRollup.bucket_start < now - 30 * day).limit(5000),
+        "rollup history (1h buckets, window)":
+            rollup_query(7, "1h", now - 30 * day, now).order_by(asc(CheckRollup.bucket_start)).limit(500),
+        "rollup job: raw window":
+            lambda: _from_raw(60, now - day, now),
+        "rollup job: 1m -> 1h window":
+            lambda: _from_tier(3600, 60, now - day, now),
+        "c.py latest per device": text(
+            "select d.id, (select status from check_results cr where cr.device_id=d.id "
+            "order by cr.created_at desc limit 1) from devices d order by d.id"),
+    }
+
+
+def plan_rows(db, q):
+    with captured(db.engine) as seen:
+        if hasattr(q, "all"):
+            q.all()
+        elif callable(q):
+            q()
+        else:
+            db.session.execute(q).fetchall()
+    statement, parameters = seen[-1]
+    cur = db.session.connection().connection.cursor()
+    cur.execute("EXPLAIN QUERY PLAN " + statement, parameters)
+    return [r[-1] for r in cur.fetchall()]
+
+
+def full_scans(details):
+    bad = []
+    for d in details:
+        words = d.replace("TABLE ", "").split()
+        if len(words) >= 2 and words[0] == "SCAN" and words[1] not in SMALL_TABLES and "INDEX" not in d:
+            bad.append(d)
+    return bad
+
+
+if __name__ == "__main__":
+    url = use_temp_db("check_query_plans.db")
+    from app import create_app, db
+    app = create_app()
+    seed(url, devices=50, history=20000)
+
+    failed = 0
+    with app.app_context():
+        db.session.execute(text("ANALYZE"))
+        for name, q in hot_queries().items():
+            details = plan_rows(db, q)
+            bad = full_scans(details)
+            failed += bool(bad)
+            print(f"{'FAIL' if bad else 'ok  '} {name}")
+            for d in details:
+                print(f"       {d}")
+    print(f"\n{failed} quer{'y' if failed == 1 else 'ies'} with a full table scan")
+    sys.exit(1 if failed else 0)
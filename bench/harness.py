@@ -0,0 +1,207 @@
+"""Whole-pipeline benchmark with JSON output, for comparing runs.
+
+    python bench/harness.py --devices 1000 --history 1000000 --out run.json
+    python bench/harness.py --devices 1000 --history 1000000 --baseline run.json   # exits 1 on regression
+
+Seeds a throwaway SQLite database with --devices devices (HTTP and TCP checks
+against local stub targets with --latency-ms/--jitter-ms response time and
+--fail-pct failures) and --history raw check rows, then measures:
+  monitor    run_once cycle time and result rows/s (per cycle and for the writer alone)
+  endpoints  p50/p99 latency and throughput of /, /api/devices, device history and
+             CSV export, each hit by --clients concurrent clients
+With --baseline, every cycle time and p99 is compared with the earlier run and
+anything slower by more than --tolerance percent is reported as a regression.
+"""
+import os, io, sys, json, time, random, sqlite3, logging, argparse, platform, threading, subprocess, contextlib
+import http.client
+from datetime import datetime, timezone
+
+from stubs import use_temp_db, start_http_stub, start_tcp_stub, closed_port, ROOT
+from seed import seed
+
+
+def pct(values, p):
+    s = sorted(values)
+    return round(s[min(len(s) - 1, int(p / 100.0 * len(s)))], 3) if s else None
+
+
+# ---- regressions vs an earlier run (lower is better for everything compared)
+def compared(res):
+    out = {"monitor.cycle_s.p50": res["monitor"]["cycle_s"]["p50"]}
+    for name, e in res["endpoints"].items():
+        out[f"endpoints.{name}.p99_ms"] = e["p99_ms"]
+    return out
+
+def find_regressions(base, result, tolerance):
+    old, new = compared(base), compared(result)
+    out = []
+    for key, v in new.items():
+        b = old.get(key)
+        if b and v is not None and v > b * (1 + tolerance / 100.0):
+            out.append({"metric": key, "baseline": b, "now": v, "pct": round((v / b - 1) * 100, 1)})
+    return out
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--devices", type=int, default=1000)
+    ap.add_argument("--history", type=int, default=1_000_000, help="raw check_results rows")
+    ap.add_argument("--http-pct", type=float, default=50, help="share of devices with HTTP checks (rest TCP)")
+    ap.add_argument("--latency-ms", type=float, default=20, help="stub HTTP response time")
+    ap.add_argument("--jitter-ms", type=float, default=10, help="extra random stub response time, up to")
+    ap.add_argument("--fail-pct", type=float, default=5, help="HTTP 500s and refused TCP ports, percent")
+    ap.add_argument("--cycles", type=int, default=3)
+    ap.add_argument("--clients", type=int, default=8)
+    ap.add_argument("--requests", type=int, default=200, help="requests per endpoint (all clients together)")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--out", help="write the JSON result here (default: stdout only)")
+    ap.add_argument("--baseline", help="JSON of an earlier run to compare with")
+    ap.add_argument("--tolerance", type=float, default=25, help="allowed slowdown vs --baseline, percent")
+    args = ap.parse_args()
+
+    os.environ["METRICS_PORT"] = "0"
+    db_url = use_temp_db("bench_harness.db")
+
+    import monitor
+    from app.latest_status import backfill_latest_status
+    from result_writer import DB_WRITE_SECONDS
+    from werkzeug.serving import make_server
+
+    rng = random.Random(args.seed)
+
+
+    # ---- targets + seed
+    http_srv, http_port = start_http_stub(delay_s=args.latency_ms / 1000.0, jitter_s=args.jitter_ms / 1000.0,
+                                          fail_pct=args.fail_pct)
+    tcp_sock, tcp_port = start_tcp_stub()
+    refused = closed_port()
+
+    def target(i):
+        r = random.Random(args.seed * 1_000_003 + i)
+        if r.random() * 100 < args.http_pct:
+            return "http", f"http://127.0.0.1:{http_port}/dev/{i}"
+        return "tcp", f"127.0.0.1:{refused if r.random() * 100 < args.fail_pct else tcp_port}"
+
+    t0 = time.monotonic()
+    seed(db_url, args.devices, args.history, target=target)
+    with monitor.app.app_context():
+        backfill_latest_status()
+    seed_s = time.monotonic() - t0
+    print(f"[harness] seeded {args.devices} devices / {args.history} rows in {seed_s:.1f}s", file=sys.stderr)
+
+    # ---- monitor cycles
+    cycle_s = []
+    rows0 = monitor.writer.rows_written
+    w_count0, w_sum0 = DB_WRITE_SECONDS.totals()
+    for c in range(args.cycles):
+        t0 = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):   # one log line per device otherwise
+            out = monitor.run_once()
+        cycle_s.append(time.perf_counter() - t0)
+        down = sum(1 for _, status, _ in out if status == "down")
+        print(f"[harness] cycle {c + 1}: {len(out)} devices in {cycle_s[-1]:.2f}s, {down} down", file=sys.stderr)
+    rows = monitor.writer.rows_written - rows0
+    w_count, w_sum = DB_WRITE_SECONDS.totals()
+    monitor_result = {
+        "cycles": args.cycles,
+        "cycle_s": {"p50": pct(cycle_s, 50), "max": round(max(cycle_s), 3), "all": [round(x, 3) for x in cycle_s]},
+        "rows_written": rows,
+        "rows_per_s": round(rows / sum(cycle_s), 1) if cycle_s else None,
+        "writer_batches": int(w_count - w_count0),
+        "writer_rows_per_s": round(rows / (w_sum - w_sum0), 1) if w_sum > w_sum0 else None,
+    }
+    monitor.writer.close()
+
+    # ---- endpoints under concurrent clients
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    srv = make_server("127.0.0.1", 0, monitor.app, threaded=True)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    port = srv.server_port
+
+    ENDPOINTS = {
+        "/": lambda: "/",
+        "/api/devices": lambda: "/api/devices",
+        "/api/devices/<id>/history": lambda: f"/api/devices/{rng.randint(1, args.devices)}/history",
+        "/devices/<id>/history.csv": lambda: f"/devices/{rng.randint(1, args.devices)}/history.csv",
+    }
+
+    def hammer(path_fn, n):
+        latencies, errors, lock = [], [0], threading.Lock()
+        paths = [path_fn() for _ in range(n)]
+
+        def client(my_paths):
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+            for path in my_paths:
+                t = time.perf_counter()
+                try:
+                    conn.request("GET", path)
+                    resp = conn.getresponse()
+                    resp.read()
+                    ok = resp.status == 200
+                except (OSError, http.client.HTTPException):
+                    conn.close()
+                    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+                    ok = False
+                ms = (time.perf_counter() - t) * 1000
+                with lock:
+                    latencies.append(ms)
+                    errors[0] += not ok
+            conn.close()
+
+        threads = [threading.Thread(target=client, args=(paths[i::args.clients],)) for i in range(args.clients)]
+        t0 = time.perf_counter()
+        for th in threads:
+            th.start()
+        for th in threads:
+            th.join()
+        wall = time.perf_counter() - t0
+        return {"requests": n, "errors": errors[0], "p50_ms": pct(latencies, 50), "p99_ms": pct(latencies, 99),
+                "max_ms": round(max(latencies), 3), "rps": round(n / wall, 1)}
+
+    endpoints = {}
+    for name, fn in ENDPOINTS.items():
+        endpoints[name] = hammer(fn, args.requests)
+        e = endpoints[name]
+        print(f"[harness] {name:28} p50 {e['p50_ms']:8.1f} ms  p99 {e['p99_ms']:8.1f} ms  "
+              f"{e['rps']:7.1f} req/s  errors {e['errors']}", file=sys.stderr)
+    srv.shutdown()
+    http_srv.shutdown()
+    tcp_sock.close()
+
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                             text=True).stdout.strip() or None
+    except OSError:
+        rev = None
+
+    result = {
+        "meta": {
+            "time": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git": rev,
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("out", "baseline", "tolerance")},
+        },
+        "seed_s": round(seed_s, 2),
+        "monitor": monitor_result,
+        "endpoints": endpoints,
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            base = json.load(f)
+        if base["meta"]["args"] != result["meta"]["args"]:
+            print("[harness] warning: baseline was run with different arguments", file=sys.stderr)
+        regressions = find_regressions(base, result, args.tolerance)
+        result["regressions"] = regressions
+        for r in regressions:
+            print(f"[harness] REGRESSION {r['metric']}: {r['baseline']} -> {r['now']} (+{r['pct']}%)", file=sys.stderr)
+
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+    sys.exit(1 if regressions else 0)
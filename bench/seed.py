@@ -0,0 +1,50 @@
+import sqlite3, random
+from datetime import datetime, timedelta
+
+STATUSES = ("up", "up", "up", "up", "degraded", "down")
+
+
+def sqlite_path(db_url):
+    return db_url.replace("sqlite:///", "", 1)
+
+
+def seed(db_url, devices, history, interval_s=30, chunk=200_000, target=None):
+    """Fill a fresh database (tables already created) with devices and raw history.
+
+    History rows are spread round-robin over the devices, one every interval_s
+    per device, ending now; inserted with raw sqlite3 for speed.
+    target(i) -> (kind, host) sets what device i points at (default: icmp on 10.0.x.x).
+    """
+    target = target or (lambda i: ("icmp", f"10.0.{i // 250}.{i % 250 + 1}"))
+    con = sqlite3.connect(sqlite_path(db_url))
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=OFF")
+    now = datetime.utcnow().replace(microsecond=0)
+    ts = lambda dt: dt.isoformat(sep=" ", timespec="microseconds")   # SQLAlchemy's SQLite format
+    con.executemany(
+        "INSERT INTO devices (id, name, host, kind, enabled, created_at) VALUES (?, ?, ?, ?, 1, ?)",
+        ((i, f"dev-{i}", target(i)[1], target(i)[0], ts(now)) for i in range(1, devices + 1)),
+    )
+    per_device = max(1, history // max(devices, 1))
+    rnd = random.Random(42)
+
+    def rows():
+        for n in range(history):
+            dev = n % devices + 1
+            step = per_device - n // devices
+            status = rnd.choice(STATUSES)
+            latency = None if status == "down" else rnd.randint(1, 1200)
+            yield (dev, status, latency, "ok", ts(now - timedelta(seconds=step * interval_s)))
+
+    it = rows()
+    while True:
+        batch = [r for _, r in zip(range(chunk), it)]
+        if not batch:
+            break
+        con.executemany(
+            "INSERT INTO check_results (device_id, status, latency_ms, message, created_at) VALUES (?, ?, ?, ?, ?)",
+            batch,
+        )
+        con.commit()
+    con.commit()
+    con.close()
@@ -0,0 +1,186 @@
+import os, sys, json, time, random, socket, tempfile, threading, socketserver
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+# make the repo root importable when running `python bench/<script>.py`
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# ------------------------------
+# Local fake targets
+# ------------------------------
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    wbufsize = 1 << 16   # headers + body in one send; split writes on a kept-alive connection hit delayed ACKs
+    delay_s = 0.0
+    jitter_s = 0.0
+    status = 200
+    fail_pct = 0.0
+
+    def do_GET(self):
+        delay = self.delay_s + (random.uniform(0, self.jitter_s) if self.jitter_s else 0.0)
+        if delay:
+            time.sleep(delay)
+        failed = self.fail_pct and random.random() * 100 < self.fail_pct
+        body = b"ok\n"
+        self.send_response(500 if failed else self.status)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 2048
+
+    def handle_error(self, request, client_address):
+        pass  # probes that time out hang up mid-response; that is expected here
+
+def start_http_stub(delay_s=0.0, status=200, host="127.0.0.1", jitter_s=0.0, fail_pct=0.0):
+    """Start a threaded HTTP server in the background; returns (server, port).
+
+    Each response waits delay_s plus up to jitter_s; fail_pct % of them are a 500.
+    """
+    handler = type("StubHandler", (_Handler,), {"delay_s": delay_s, "status": status,
+                                                "jitter_s": jitter_s, "fail_pct": fail_pct})
+    srv = _Server((host, 0), handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv, srv.server_address[1]
+
+class _TelegramHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    wbufsize = 1 << 16
+
+    def do_POST(self):
+        srv = self.server
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        with srv.lock:
+            srv.requests += 1
+            fail = srv.requests <= srv.fail_first
+            if not fail:
+                srv.messages.append(payload.get("text", ""))
+        if srv.delay_s:
+            time.sleep(srv.delay_s)
+        body = b'{"ok":false,"description":"stub failure"}' if fail else b'{"ok":true,"result":{}}'
+        self.send_response(500 if fail else 200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def start_telegram_stub(delay_s=0.0, fail_first=0, host="127.0.0.1"):
+    """Fake Telegram Bot API (point TELEGRAM_API_URL at it); returns (server, base_url).
+
+    server.messages collects delivered texts; the first fail_first requests get a 500.
+    """
+    srv = _Server((host, 0), _TelegramHandler)
+    srv.lock = threading.Lock()
+    srv.messages, srv.requests, srv.fail_first, srv.delay_s = [], 0, fail_first, delay_s
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv, f"http://{host}:{srv.server_address[1]}"
+
+class _SmtpHandler(socketserver.StreamRequestHandler):
+    # just enough SMTP for smtplib without STARTTLS/AUTH
+    def handle(self):
+        srv = self.server
+        with srv.lock:
+            srv.connections += 1
+        if srv.delay_s:
+            time.sleep(srv.delay_s)   # slow greeting, like a far-away server
+        self.wfile.write(b"220 stub ESMTP\r\n")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            cmd = line[:4].upper()
+            if cmd in (b"EHLO", b"HELO"):
+                self.wfile.write(b"250-stub\r\n250 8BITMIME\r\n")
+            elif cmd == b"DATA":
+                self.wfile.write(b"354 go ahead\r\n")
+                data = []
+                while True:
+                    l = self.rfile.readline()
+                    if not l or l == b".\r\n":
+                        break
+                    data.append(l)
+                with srv.lock:
+                    srv.messages.append(b"".join(data).decode("utf-8", "replace"))
+                self.wfile.write(b"250 queued\r\n")
+            elif cmd == b"QUIT":
+                self.wfile.write(b"221 bye\r\n")
+                return
+            else:   # MAIL, RCPT, RSET, NOOP
+                self.wfile.write(b"250 ok\r\n")
+
+class _SmtpServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+def start_smtp_stub(delay_s=0.0, host="127.0.0.1"):
+    """Plain-text SMTP sink; returns (server, port). Counts server.connections, collects server.messages."""
+    srv = _SmtpServer((host, 0), _SmtpHandler)
+    srv.lock = threading.Lock()
+    srv.messages, srv.connections, srv.delay_s = [], 0, delay_s
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv, srv.server_address[1]
+
+def start_tcp_stub(host="127.0.0.1"):
+    """A listening socket for TCP checks (the kernel completes the handshake); returns (socket, port)."""
+    s = socket.socket()
+    s.bind((host, 0))
+    s.listen(4096)
+
+    def drain():
+        while True:
+            try:
+                conn, _ = s.accept()
+            except OSError:
+                return
+            conn.close()
+
+    threading.Thread(target=drain, daemon=True).start()
+    return s, s.getsockname()[1]
+
+def start_blackhole(host="127.0.0.1"):
+    """A port whose connections time out, like a host behind a dead link; returns (sockets, port).
+
+    The socket listens but never accepts, and its accept queue is filled up
+    front, so the kernel drops further SYNs instead of completing or refusing them.
+    """
+    s = socket.socket()
+    s.bind((host, 0))
+    s.listen(0)
+    port = s.getsockname()[1]
+    held = [s]
+    while True:
+        c = socket.socket()
+        c.settimeout(0.2)
+        try:
+            c.connect((host, port))
+        except OSError:
+            c.close()
+            break
+        held.append(c)
+    return held, port
+
+def closed_port(host="127.0.0.1"):
+    """A port nothing listens on, so connections are refused immediately."""
+    s = socket.socket()
+    s.bind((host, 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+def use_temp_db(name):
+    """Point DATABASE_URL at a throwaway SQLite file before the app is imported."""
+    path = os.path.join(tempfile.gettempdir(), name)
+    if os.path.exists(path):
+        os.remove(path)
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.abspath(path)
+    return os.environ["DATABASE_URL"]
@@ -0,0 +1,176 @@
+import os, ssl, time, socket, asyncio
+from collections import deque
+from urllib.parse import urlsplit
+
+# ---- HTTP client tuning (env)
+HTTP_POOL_PER_HOST = int(os.getenv("HTTP_POOL_PER_HOST", "8"))      # idle keep-alive connections kept per host
+HTTP_KEEPALIVE_S   = float(os.getenv("HTTP_KEEPALIVE_S", "60"))     # drop idle connections older than this
+DNS_CACHE_TTL_S    = float(os.getenv("DNS_CACHE_TTL_S", "60"))
+
+PHASES = ("dns", "connect", "tls", "ttfb")
+
+def _ms(a, b):
+    return round((b - a) * 1000.0, 3)
+
+# ------------------------------
+# Pooled HTTP/1.1 GET client for the probe engine.
+# Keeps idle keep-alive connections per (scheme, host, port) and caches DNS
+# answers for DNS_CACHE_TTL_S, so a probe normally measures one request on a
+# warm connection instead of lookup + TCP + TLS set-up.
+# Streams belong to the event loop they were opened on: use one client per loop.
+# ------------------------------
+class HttpClient:
+    def __init__(self):
+        self.ssl_context = ssl.create_default_context()
+        self.idle = {}   # (scheme, host, port) -> deque of (reader, writer, idle_since)
+        self.dns = {}    # host -> (expires, future of address)
+
+    # Returns (status code, timings); timings are per-phase durations in ms
+    # (dns, connect, tls, ttfb = request sent -> first response byte) plus total.
+    # Reused connections and cached lookups report 0 for the phases they skipped.
+    async def get(self, url):
+        parts = urlsplit(url)
+        https = parts.scheme == "https"
+        host = parts.hostname or ""
+        port = parts.port or (443 if https else 80)
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        request = (f"GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\nUser-Agent: device-monitor\r\n"
+                   f"Accept: */*\r\nConnection: keep-alive\r\n\r\n").encode("latin-1")
+        key = (parts.scheme, host, port)
+
+        t0 = time.perf_counter()
+        conn = self._checkout(key)
+        if conn is not None:
+            t = time.perf_counter()
+            timings = {"dns": 0.0, "connect": 0.0, "tls": 0.0}
+            try:
+                return await self._exchange(key, conn, request, timings, t0, t)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                # the server dropped the idle connection; retry once on a fresh one
+                t0 = time.perf_counter()
+
+        addr = await self._resolve(host)
+        t_dns = time.perf_counter()
+        reader, writer = await asyncio.open_connection(addr, port)
+        t_conn = time.perf_counter()
+        try:
+            if https:
+                await writer.start_tls(self.ssl_context, server_hostname=host)
+        except BaseException:
+            writer.close()
+            raise
+        t_tls = time.perf_counter()
+        timings = {"dns": _ms(t0, t_dns), "connect": _ms(t_dns, t_conn), "tls": _ms(t_conn, t_tls)}
+        return await self._exchange(key, (reader, writer), request, timings, t0, t_tls)
+
+    async def _exchange(self, key, conn, request, timings, t0, t_sent):
+        reader, writer = conn
+        try:
+            writer.write(request)
+            await writer.drain()
+            status_line = await reader.readline()
+            t_first = time.perf_counter()
+            if not status_line:
+                raise ConnectionResetError("connection closed before response")
+            code, keep_alive = await _read_response(reader, status_line)
+        except BaseException:
+            writer.close()
+            raise
+        t_end = time.perf_counter()
+        if keep_alive:
+            self._checkin(key, conn)
+        else:
+            writer.close()
+        timings["ttfb"] = _ms(t_sent, t_first)
+        timings["total"] = _ms(t0, t_end)
+        return code, timings
+
+    # ---- connection pool
+    def _checkout(self, key):
+        pool = self.idle.get(key)
+        now = time.monotonic()
+        while pool:
+            reader, writer, since = pool.pop()
+            if now - since < HTTP_KEEPALIVE_S and not reader.at_eof() and not writer.is_closing():
+                return reader, writer
+            writer.close()
+        return None
+
+    def _checkin(self, key, conn):
+        pool = self.idle.setdefault(key, deque())
+        if len(pool) >= HTTP_POOL_PER_HOST:
+            conn[1].close()
+            return
+        pool.append((conn[0], conn[1], time.monotonic()))
+
+    # ---- DNS cache; concurrent lookups of one name share a single query
+    async def _resolve(self, host):
+        try:
+            socket.inet_pton(socket.AF_INET6 if ":" in host else socket.AF_INET, host)
+            return host
+        except OSError:
+            pass
+        now = time.monotonic()
+        hit = self.dns.get(host)
+        if hit is None or hit[0] < now:
+            loop = asyncio.get_running_loop()
+            fut = asyncio.ensure_future(loop.getaddrinfo(host, None, type=socket.SOCK_STREAM))
+            hit = self.dns[host] = (now + DNS_CACHE_TTL_S, fut)
+        try:
+            infos = await asyncio.shield(hit[1])
+        except OSError:
+            if self.dns.get(host) is hit:
+                del self.dns[host]   # don't cache failures
+            raise
+        return infos[0][4][0]
+
+    def close(self):
+        for pool in self.idle.values():
+            for _, writer, _ in pool:
+                writer.close()
+        self.idle.clear()
+        self.dns.clear()
+
+
+# Reads headers + body of one response; returns (code, connection reusable)
+async def _read_response(reader, status_line):
+    fields = status_line.split(None, 2)
+    if len(fields) < 2 or not fields[1].isdigit():
+        raise ConnectionError(f"bad status line {status_line[:60]!r}")
+    version, code = fields[0].upper(), int(fields[1])
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise asyncio.IncompleteReadError(b"", None)
+        if line in (b"\r\n", b"\n"):
+            break
+        name, _, value = line.partition(b":")
+        headers[name.strip().lower()] = value.strip().lower()
+
+    conn = headers.get(b"connection", b"")
+    keep_alive = (conn != b"close") if version == b"HTTP/1.1" else (conn == b"keep-alive")
+
+    if code in (204, 304) or 100 <= code < 200:
+        return code, keep_alive
+    if b"chunked" in headers.get(b"transfer-encoding", b""):
+        while True:
+            size = int((await reader.readline()).split(b";", 1)[0].strip() or b"0", 16)
+            if size == 0:
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass   # trailers
+                return code, keep_alive
+            await _discard(reader, size + 2)
+    if b"content-length" in headers:
+        await _discard(reader, int(headers[b"content-length"]))
+        return code, keep_alive
+    # no framing: body runs to EOF
+    while await reader.read(65536):
+        pass
+    return code, False
+
+async def _discard(reader, n):
+    while n > 0:
+        n -= len(await reader.readexactly(min(n, 65536)))
@@ -0,0 +1,145 @@
+import os, time, random, socket, struct, asyncio
+
+# ------------------------------
+# In-process ICMP echo (ping) engine.
+# One socket per probe cycle carries the echo requests to every host; replies
+# are matched back to their request by sequence number (plus identifier and a
+# per-socket token on raw sockets) and timed with perf_counter.
+#
+# Socket types, tried in order:
+#   - SOCK_DGRAM/IPPROTO_ICMP: unprivileged "ping socket" on Linux when the
+#     process's group is inside net.ipv4.ping_group_range (and on macOS).
+#     The kernel owns the identifier and only hands us our own replies.
+#   - SOCK_RAW/IPPROTO_ICMP: needs root or CAP_NET_RAW; sees every ICMP
+#     packet for the host, so we filter on identifier + token.
+# When neither can be opened, open_pinger() returns None and callers fall back
+# to the ping subprocess.
+# ------------------------------
+ICMP_RCVBUF = int(os.getenv("ICMP_RCVBUF", str(4 * 1024 * 1024)))   # capped by net.core.rmem_max
+
+ICMP_ECHO_REPLY   = 0
+ICMP_ECHO_REQUEST = 8
+
+_HEADER = struct.Struct("!BBHHH")   # type, code, checksum, identifier, sequence
+_TOKEN  = struct.Struct("!Q")
+
+_unavailable = None   # reason native ICMP could not be used (checked once per process)
+
+
+def checksum(data):
+    if len(data) % 2:
+        data += b"\x00"
+    s = sum(struct.unpack(f"!{len(data) // 2}H", data))
+    s = (s >> 16) + (s & 0xFFFF)
+    s += s >> 16
+    return ~s & 0xFFFF
+
+def echo_request(ident, seq, payload):
+    head = _HEADER.pack(ICMP_ECHO_REQUEST, 0, 0, ident, seq)
+    return _HEADER.pack(ICMP_ECHO_REQUEST, 0, checksum(head + payload), ident, seq) + payload
+
+def _open_socket():
+    errors = []
+    for kind, raw in ((socket.SOCK_DGRAM, False), (socket.SOCK_RAW, True)):
+        try:
+            sock = socket.socket(socket.AF_INET, kind, socket.IPPROTO_ICMP)
+        except OSError as e:
+            errors.append(f"{'raw' if raw else 'dgram'}: {e.strerror or e}")
+            continue
+        sock.setblocking(False)
+        try:
+            # replies to a whole cycle can arrive before the loop gets to read them
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, ICMP_RCVBUF)
+        except OSError:
+            pass
+        return sock, raw
+    raise OSError("no ICMP socket (" + "; ".join(errors) + ")")
+
+
+class Pinger:
+    def __init__(self, sock, raw, loop=None):
+        self.sock = sock
+        self.raw = raw
+        self.loop = loop or asyncio.get_running_loop()
+        # dgram sockets get their identifier rewritten by the kernel; it's only checked on raw ones
+        self.ident = (os.getpid() ^ id(self)) & 0xFFFF
+        self.token = _TOKEN.pack(random.getrandbits(64))
+        self.seq = random.randrange(0x10000)
+        self.pending = {}   # seq -> (future, address)
+        self.loop.add_reader(sock.fileno(), self._on_readable)
+
+    def _next_seq(self):
+        for _ in range(0x10000):
+            self.seq = (self.seq + 1) & 0xFFFF
+            if self.seq not in self.pending:
+                return self.seq
+        raise OSError("too many ICMP requests in flight")
+
+    async def _address(self, host):
+        try:
+            socket.inet_aton(host)
+            return host
+        except OSError:
+            infos = await self.loop.getaddrinfo(host, None, family=socket.AF_INET, type=socket.SOCK_DGRAM)
+            return infos[0][4][0]
+
+    # RTT in milliseconds (float), or None on timeout
+    async def ping(self, host, timeout_s):
+        addr = await self._address(host)
+        seq = self._next_seq()
+        fut = self.loop.create_future()
+        self.pending[seq] = (fut, addr)
+        try:
+            packet = echo_request(self.ident, seq, self.token)
+            t0 = time.perf_counter()
+            self.sock.sendto(packet, (addr, 0))
+            t1 = await asyncio.wait_for(fut, timeout_s)
+            return (t1 - t0) * 1000.0
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self.pending.pop(seq, None)
+
+    def _on_readable(self):
+        while True:
+            try:
+                data, src = self.sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                continue   # queued ICMP error on a dgram socket; the request will time out
+            now = time.perf_counter()
+            if self.raw:
+                data = data[(data[0] & 0x0F) * 4:]   # strip the IPv4 header
+            if len(data) < _HEADER.size + _TOKEN.size:
+                continue
+            typ, _, _, ident, seq = _HEADER.unpack_from(data)
+            if typ != ICMP_ECHO_REPLY or data[_HEADER.size:_HEADER.size + _TOKEN.size] != self.token:
+                continue
+            if self.raw and ident != self.ident:
+                continue
+            entry = self.pending.get(seq)
+            if entry and entry[1] == src[0] and not entry[0].done():
+                entry[0].set_result(now)
+
+    def close(self):
+        self.loop.remove_reader(self.sock.fileno())
+        self.sock.close()
+        for fut, _ in self.pending.values():
+            if not fut.done():
+                fut.cancel()
+        self.pending.clear()
+
+
+# Pinger on the running loop, or None when this process can't open ICMP sockets
+def open_pinger():
+    global _unavailable
+    if _unavailable:
+        return None
+    try:
+        sock, raw = _open_socket()
+    except OSError as e:
+        _unavailable = str(e)
+        print(f"[icmp] native ICMP unavailable, using the ping command: {e}", flush=True)
+        return None
+    return Pinger(sock, raw)
@@ -0,0 +1,175 @@
+import os
+from collections import namedtuple
+
+from dotenv import load_dotenv
+
+from app import db
+from app.models import DeviceLatestStatus
+from probes import DEGRADED_MS
+
+load_dotenv()
+
+# ---- Status transition tuning (env)
+CONFIRM_N          = int(os.getenv("CONFIRM_N", "2"))              # a new status needs N of the last M checks...
+CONFIRM_M          = int(os.getenv("CONFIRM_M", "3"))              # ...before it is confirmed and alerted
+DEGRADED_CLEAR_PCT = float(os.getenv("DEGRADED_CLEAR_PCT", "80"))  # stay degraded until below this % of DEGRADED_MS
+FLAP_WINDOW        = int(os.getenv("FLAP_WINDOW", "20"))           # recent checks kept per device
+FLAP_START_PCT     = float(os.getenv("FLAP_START_PCT", "40"))      # % of them that changed status -> flapping
+FLAP_STOP_PCT      = float(os.getenv("FLAP_STOP_PCT", "20"))       # ...and back below this -> stable again
+
+STATUSES = ("up", "degraded", "down")
+_CODE = {s: i for i, s in enumerate(STATUSES)}
+_FLIP = 4   # bit set on a ring slot whose status differs from the check before it
+
+# What observe() decided for one check:
+#   status     the check's status after hysteresis (what gets stored)
+#   confirmed  the confirmed status after this check
+#   changed    the confirmed status moved (or this is the device's first check)
+#   pending    status differs from confirmed: recheck soon to confirm it
+#   alert      None | "change" | "flapping" | "stable"
+Transition = namedtuple("Transition", "status confirmed changed pending alert flapping flap_pct suppressed")
+
+
+class _Device:
+    __slots__ = ("ring", "pos", "n", "flips", "window", "last", "confirmed", "flapping", "suppressed")
+
+    def __init__(self, size):
+        self.ring = bytearray(size)   # status code | _FLIP, oldest overwritten first
+        self.pos = 0
+        self.n = 0                    # filled slots
+        self.flips = 0                # _FLIP bits in the ring
+        self.window = [0, 0, 0]       # per-status counts over the last CONFIRM_M checks
+        self.last = None              # code of the newest check
+        self.confirmed = None
+        self.flapping = False
+        self.suppressed = 0           # confirmed changes not alerted in the current/last flap episode
+
+
+# ------------------------------
+# Per-device status state machine, O(1) per result.
+# Each device keeps a ring of its last FLAP_WINDOW check statuses with running
+# counts, so a result updates the confirmation window (N of the last M checks
+# must agree before the confirmed status moves), the degraded hysteresis band
+# and the flap score (share of checks that changed status) without rescanning.
+# While a device flaps, confirmed changes are counted instead of alerted; one
+# alert marks the start of flapping and one its end.
+# State is restored from device_latest_status when the monitor (re)starts.
+# ------------------------------
+class StatusTracker:
+    def __init__(self, confirm_n=CONFIRM_N, confirm_m=CONFIRM_M, flap_window=FLAP_WINDOW,
+                 flap_start_pct=FLAP_START_PCT, flap_stop_pct=FLAP_STOP_PCT,
+                 degraded_ms=DEGRADED_MS, clear_pct=DEGRADED_CLEAR_PCT):
+        self.confirm_m = max(1, confirm_m)
+        self.confirm_n = min(max(1, confirm_n), self.confirm_m)
+        self.size = max(flap_window, self.confirm_m)
+        self.flap_start = flap_start_pct
+        self.flap_stop = flap_stop_pct
+        self.clear_ms = degraded_ms * clear_pct / 100.0
+        self._devices = {}
+        self.loaded = False
+
+    def load(self):
+        # needs an app context
+        self._devices = {}
+        self._restore(self._rows())
+        self.loaded = True
+        return len(self._devices)
+
+    def refresh(self, device_ids):
+        # re-read devices this process just took over from another monitor worker
+        ids = list(device_ids)
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            self.forget(chunk)
+            self._restore(self._rows().filter(DeviceLatestStatus.device_id.in_(chunk)))
+        return len(ids)
+
+    def _rows(self):
+        return db.session.query(DeviceLatestStatus.device_id, DeviceLatestStatus.status,
+                                DeviceLatestStatus.confirmed_status, DeviceLatestStatus.flapping,
+                                DeviceLatestStatus.suppressed)
+
+    def _restore(self, rows):
+        for device_id, status, confirmed, flapping, suppressed in rows:
+            if status not in _CODE:
+                status = confirmed   # "unreachable": not probed, the confirmed status still stands
+                if status not in _CODE:
+                    continue
+            st = self._devices[device_id] = _Device(self.size)
+            self._push(st, _CODE[status])
+            st.confirmed = _CODE.get(confirmed, _CODE[status])
+            st.flapping = bool(flapping)
+            st.suppressed = suppressed or 0
+
+    def get(self, device_id):
+        st = self._devices.get(device_id)
+        return STATUSES[st.confirmed] if st and st.confirmed is not None else None
+
+    def is_down(self, device_id):
+        # newest check or confirmed status down: devices behind it can't be reached reliably
+        st = self._devices.get(device_id)
+        return st is not None and _CODE["down"] in (st.last, st.confirmed)
+
+    def forget(self, device_ids):
+        for i in device_ids:
+            self._devices.pop(i, None)
+
+    def __len__(self):
+        return len(self._devices)
+
+    def _push(self, st, code):
+        flip = _FLIP if st.last is not None and code != st.last else 0
+        if st.n >= self.confirm_m:
+            # the check falling out of the confirmation window
+            st.window[st.ring[(st.pos - self.confirm_m) % self.size] & 3] -= 1
+        if st.n == self.size:
+            st.flips -= (st.ring[st.pos] & _FLIP) != 0
+        else:
+            st.n += 1
+        st.ring[st.pos] = code | flip
+        st.pos = (st.pos + 1) % self.size
+        st.flips += flip != 0
+        st.window[code] += 1
+        st.last = code
+
+    # status: the probe's status; graded_ms: the latency it was graded on
+    # (total or ttfb, see DEGRADED_BASIS), used for the degraded hysteresis band
+    def observe(self, device_id, status, graded_ms=None):
+        st = self._devices.get(device_id)
+        if st is None:
+            st = self._devices[device_id] = _Device(self.size)
+        code = _CODE.get(status, _CODE["down"])
+        if (code == _CODE["up"] and st.last == _CODE["degraded"]
+                and graded_ms is not None and graded_ms >= self.clear_ms):
+            code = _CODE["degraded"]   # inside the band: not recovered yet
+        self._push(st, code)
+
+        changed = False
+        if st.confirmed is None:
+            st.confirmed, changed = code, True
+        elif code != st.confirmed and st.window[code] >= self.confirm_n:
+            st.confirmed, changed = code, True
+
+        pct = 100.0 * st.flips / st.n
+        scored = st.n * 2 >= self.size   # judge flapping on a half-full ring at least
+        alert = None
+        if scored and not st.flapping and pct >= self.flap_start:
+            st.flapping, st.suppressed, alert = True, 0, "flapping"
+        elif scored and st.flapping and pct <= self.flap_stop:
+            st.flapping, alert = False, "stable"
+        elif changed and st.flapping:
+            st.suppressed += 1
+        elif changed:
+            alert = "change"
+
+        return Transition(STATUSES[code], STATUSES[st.confirmed], changed, code != st.confirmed,
+                          alert, st.flapping, round(pct, 1), st.suppressed)
+
+    def hold(self, device_id, status="unreachable"):
+        """Transition for a check that was not made (device behind a down parent): state unchanged."""
+        st = self._devices.get(device_id)
+        if st is None:
+            return Transition(status, None, False, False, None, False, 0.0, 0)
+        pct = 100.0 * st.flips / st.n if st.n else 0.0
+        confirmed = STATUSES[st.confirmed] if st.confirmed is not None else None
+        return Transition(status, confirmed, False, False, None, st.flapping, round(pct, 1), st.suppressed)
@@ -0,0 +1,275 @@
+import os, math, bisect, threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# ---- Metrics (env)
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))   # monitor's /metrics listener; 0 = off
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# seconds; covers sub-ms pings up to probe timeouts
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# seconds; alert delivery includes the digest window and retries
+SLOW_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+
+# ------------------------------
+# Tiny in-process metrics registry, rendered in the Prometheus text format.
+# Counters and histograms write to a cell owned by the calling thread (no lock,
+# no contention on the hot path); a scrape sums the cells of all threads.
+# Histogram buckets are a preallocated list per thread, so observe() is one
+# bisect plus two additions. Gauges are callbacks evaluated at scrape time.
+# ------------------------------
+class _Child:
+    __slots__ = ("_local", "_cells", "_retired", "_lock", "_size")
+
+    def __init__(self, size):
+        self._local = threading.local()
+        self._cells = []              # (thread, cell) of every thread that wrote
+        self._retired = [0.0] * size  # folded-in cells of threads that have exited
+        self._lock = threading.Lock()
+        self._size = size
+
+    # first write from this thread: the only locked path
+    def _new_cell(self):
+        cell = self._local.cell = [0.0] * self._size
+        with self._lock:
+            if len(self._cells) >= 32:
+                self._fold()   # servers with a thread per request would grow this forever
+            self._cells.append((threading.current_thread(), cell))
+        return cell
+
+    def _fold(self):
+        live = []
+        for thread, cell in self._cells:
+            if thread.is_alive():
+                live.append((thread, cell))
+            else:
+                for i, v in enumerate(cell):
+                    self._retired[i] += v
+        self._cells = live
+
+    def _sum(self):
+        with self._lock:
+            self._fold()
+            out = list(self._retired)
+            for _, cell in self._cells:
+                for i, v in enumerate(cell):
+                    out[i] += v
+        return out
+
+
+class _CounterChild(_Child):
+    __slots__ = ()
+
+    def __init__(self):
+        super().__init__(1)
+
+    def inc(self, n=1):
+        try:
+            cell = self._local.cell
+        except AttributeError:
+            cell = self._new_cell()
+        cell[0] += n
+
+    def value(self):
+        return self._sum()[0]
+
+
+class _HistogramChild(_Child):
+    __slots__ = ("_bounds",)
+
+    def __init__(self, bounds):
+        super().__init__(len(bounds) + 3)   # buckets..., +Inf, sum, count
+        self._bounds = bounds
+
+    def observe(self, v):
+        try:
+            cell = self._local.cell
+        except AttributeError:
+            cell = self._new_cell()
+        cell[bisect.bisect_left(self._bounds, v)] += 1
+        cell[-2] += v
+        cell[-1] += 1
+
+    # (count, sum) over all threads
+    def totals(self):
+        out = self._sum()
+        return out[-1], out[-2]
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.labelnames:
+            self._default = self._children[()] = self._new_child()
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _label_str(self, values, extra=()):
+        pairs = list(zip(self.labelnames, values)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in sorted(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, n=1):
+        self._default.inc(n)
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{self._label_str(values)} {_num(child.value())}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.bounds = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.bounds)
+
+    def observe(self, v):
+        self._default.observe(v)
+
+    def totals(self):
+        return self._default.totals()
+
+    def _render_child(self, values, child):
+        totals = child._sum()
+        lines, acc = [], 0
+        for bound, n in zip(self.bounds + (math.inf,), totals):
+            acc += n
+            le = "+Inf" if bound == math.inf else _num(bound)
+            lines.append(f"{self.name}_bucket{self._label_str(values, [('le', le)])} {_num(acc)}")
+        lines.append(f"{self.name}_sum{self._label_str(values)} {_num(totals[-2])}")
+        lines.append(f"{self.name}_count{self._label_str(values)} {_num(totals[-1])}")
+        return lines
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    # fn() -> number, or -> {label values tuple: number} for labelled gauges
+    def __init__(self, name, help, fn, labelnames=()):
+        self.fn = fn
+        super().__init__(name, help, labelnames)
+
+    def _new_child(self):
+        return None
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        try:
+            value = self.fn()
+        except Exception:
+            return []   # source not available (e.g. not started): leave the gauge out
+        items = value.items() if isinstance(value, dict) else [((), value)]
+        for values, v in sorted(items):
+            lines.append(f"{self.name}{self._label_str(values)} {_num(v)}")
+        return lines
+
+
+def _escape(v):
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _num(v):
+    if v == math.inf:
+        return "+Inf"
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    # the same name returns the already registered metric (modules may be imported twice)
+    def _add(self, cls, name, *args, **kwargs):
+        with self._lock:
+            m = self._metrics.get(name)
+            if m is None:
+                m = self._metrics[name] = cls(name, *args, **kwargs)
+            return m
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram, name, help, labelnames, buckets)
+
+    # gauges are re-bound on re-registration: the newest source wins
+    def gauge(self, name, help, fn, labelnames=()):
+        g = self._add(Gauge, name, help, fn, labelnames)
+        g.fn = fn
+        return g
+
+    def render(self):
+        lines = []
+        for name in sorted(self._metrics):
+            lines.extend(self._metrics[name].render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+histogram = REGISTRY.histogram
+gauge = REGISTRY.gauge
+render = REGISTRY.render
+
+
+# ---- standalone /metrics listener for processes without a web app (the monitor)
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def serve(port=METRICS_PORT, host="0.0.0.0"):
+    if not port:
+        return None
+    try:
+        srv = ThreadingHTTPServer((host, port), _Handler)
+    except OSError as e:
+        print(f"[metrics] cannot listen on :{port}: {e}", flush=True)
+        return None
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, name="metrics-http", daemon=True).start()
+    print(f"[metrics] serving http://{host}:{srv.server_port}/metrics", flush=True)
+    return srv
@@ -1,144 +1,365 @@
-import os, time, platform, subprocess, socket, re
+import os, sys, time, signal, argparse, subprocess, socket
+from collections import namedtuple
 from datetime import datetime, timezone
 
-import requests
 from dotenv import load_dotenv
 
+import metrics
+
 from app import create_app, db
-from app.models import Device, CheckResult
-from alerts import notify_telegram, send_email
+from app.models import Device, DeviceLatestStatus
+from app.latest_status import upsert_latest
+from app.rollups import run_rollups
+from app.retention import run_retention
+from app.hot_tier import open_writer, generation
+from app.topology import Topology
+from alert_dispatch import AlertDispatcher
+from probes import DEGRADED_BASIS, resolve_kind, run_probes, close_probes
+from http_pool import PHASES
+from app.config_store import get_config
+from scheduler import Scheduler
+from result_writer import ResultWriter
+from last_state import StatusTracker
+from sharding import Shard, WORKER_HEARTBEAT_S
 
 load_dotenv()
 
-# ---- Tuning (env)
-INTERVAL_SECONDS = int(os.getenv("INTERVAL_SECONDS", "30"))
-PING_TIMEOUT_MS  = int(os.getenv("PING_TIMEOUT_MS", "1000"))    # 1s
-HTTP_TIMEOUT_S   = float(os.getenv("HTTP_TIMEOUT_S", "3.0"))    # 3s
-TCP_TIMEOUT_S    = float(os.getenv("TCP_TIMEOUT_S", "2.0"))     # 2s
-DEGRADED_MS      = int(os.getenv("DEGRADED_MS", "800"))         # HTTP latency >= degraded
+# ---- Tuning (env); probe timeouts/concurrency live in probes.py
+INTERVAL_SECONDS = int(os.getenv("INTERVAL_SECONDS", "30"))          # default per-device interval
+DEVICE_REFRESH_S = float(os.getenv("DEVICE_REFRESH_S", "30"))        # reload device list / intervals
+SCHED_BATCH      = int(os.getenv("SCHED_BATCH", "1000"))              # max due devices probed per tick
+SCHED_STATS_EVERY_S = float(os.getenv("SCHED_STATS_EVERY_S", "60"))
+ROLLUP_EVERY_S   = float(os.getenv("ROLLUP_EVERY_S", "60"))           # 1m/1h/1d aggregates (app/rollups.py)
+RETENTION_EVERY_S = float(os.getenv("RETENTION_EVERY_S", "600"))      # batched purge + vacuum (app/retention.py)
 ALERT_ON_RECOVERY = os.getenv("ALERT_ON_RECOVERY", "true").lower() == "true"
 
-IP_RE = re.compile(r"^\d{1,3}(\.\d{1,3}){3}$")
-
 app = create_app()
+writer = ResultWriter(app)   # batched CheckResult inserts (result_writer.py)
+writer.txn_hooks.append(upsert_latest)   # keep device_latest_status in the same transaction
+hot = open_writer(app)   # newest checks per device for the dashboards (app/hot_tier.py)
+if hot is not None:
+    writer.on_flush.append(hot.append)
+last_state = StatusTracker()  # per-device confirmation / hysteresis / flapping (last_state.py)
+alerts_out = AlertDispatcher(app)   # delivery runs in its own threads (alert_dispatch.py)
+topology = Topology()   # which devices sit behind which (app/topology.py), reloaded with the targets
+priority = set()   # device ids to check on the next tick (behind a recovered parent, parents of a failing child)
+_owned = None      # ids this worker checks when sharded (None = every device)
+
+CYCLE_SECONDS = metrics.histogram("monitor_cycle_seconds", "Probe + persist + alert pass over the due devices",
+                                  buckets=metrics.LATENCY_BUCKETS + (30.0, 60.0))
+CYCLE_DEVICES = metrics.counter("monitor_cycle_devices_total", "Devices checked by all passes")
+CHECKS_SKIPPED = metrics.counter("monitor_unreachable_total", "Results recorded as unreachable (behind a down parent)")
+ALERTS_RAISED = metrics.counter("monitor_alerts_total", "Alerts handed to the dispatcher", ("reason",))
+metrics.gauge("monitor_writer_queue_rows", "Results waiting for the writer thread", lambda: writer.qsize())
+metrics.gauge("monitor_alert_queue", "Alerts waiting to be written to alert_outbox", lambda: alerts_out.qsize())
 
 def now_utc():
     return datetime.now(timezone.utc)
 
-def to_status(latency_ms, ok, kind):
-    if not ok:
-        return "down"
-    if kind == "http" and latency_ms is not None and latency_ms >= DEGRADED_MS:
-        return "degraded"
-    return "up"
-
-def check_icmp(host):
-    sys = platform.system().lower()
-    if sys.startswith("win"):
-        cmd = ["ping", "-n", "1", "-w", str(PING_TIMEOUT_MS), host]
-    else:
-        timeout_s = max(1, int(PING_TIMEOUT_MS / 1000))
-        cmd = ["ping", "-c", "1", "-W", str(timeout_s), host]
-    t0 = time.monotonic()
-    try:
-        p = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        elapsed = int((time.monotonic() - t0) * 1000)
-        ok = (p.returncode == 0)
-        return to_status(elapsed if ok else None, ok, "icmp"), (elapsed if ok else None), ("ok" if ok else "no reply")
-    except Exception as e:
-        return "down", None, f"ping error: {e}"
-
-def normalize_url(host_or_url):
-    return host_or_url if host_or_url.startswith(("http://", "https://")) else "http://" + host_or_url
-
-def check_http(host_or_url):
-    url = normalize_url(host_or_url)
-    try:
-        t0 = time.monotonic()
-        r = requests.get(url, timeout=HTTP_TIMEOUT_S)
-        elapsed = int((time.monotonic() - t0) * 1000)
-        ok = 200 <= r.status_code < 400
-        return to_status(elapsed if ok else None, ok, "http"), (elapsed if ok else None), f"http {r.status_code}"
-    except requests.exceptions.Timeout:
-        return "down", None, "http timeout"
-    except requests.RequestException as e:
-        return "down", None, f"http error: {e}"
-
-def parse_host_port(host_with_port):
-    if ":" in host_with_port:
-        h, p = host_with_port.rsplit(":", 1)
-        try:
-            return h, int(p)
-        except ValueError:
-            return host_with_port, None
-    return host_with_port, None
-
-def check_tcp(host_with_port):
-    host, port = parse_host_port(host_with_port)
-    if not port:
-        return "down", None, "no port"
+# Plain snapshot of a Device row, safe to keep across sessions/commits
+Target = namedtuple("Target", "id name host kind interval_s generation")
+
+def load_targets():
+    topology.load()
+    devices = Device.query.filter_by(enabled=True).order_by(Device.id.asc()).all()
+    return [
+        Target(d.id, d.name, d.host, resolve_kind(d.kind, d.host), d.interval_s or INTERVAL_SECONDS,
+               generation(d.created_at))
+        for d in devices
+    ]
+
+# Whether a device counts as down for the devices behind it: this process's
+# state for the devices it checks, the stored latest status for parents that
+# another shard worker checks (one query per pass, only when sharded).
+def _down_lookup(targets):
+    if _owned is None:
+        return last_state.is_down
+    ids = list({a for t in targets for a in topology.ancestors(t.id) if a not in _owned})
+    remote = set()
+    for i in range(0, len(ids), 500):
+        rows = db.session.query(DeviceLatestStatus.device_id, DeviceLatestStatus.status,
+                                DeviceLatestStatus.confirmed_status) \
+            .filter(DeviceLatestStatus.device_id.in_(ids[i:i + 500]))
+        remote.update(device_id for device_id, status, confirmed in rows if "down" in (status, confirmed))
+    return lambda i: last_state.is_down(i) if i in _owned else i in remote
+
+# Probe targets concurrently, then persist/alert in order. Needs an app context.
+# Returns [(target, status, recheck)]; recheck = a status change waits for confirmation.
+# Devices behind a down parent (app/topology.py) are not probed: they get an
+# "unreachable" row, keep their confirmed status and raise no alerts; the parent's
+# alert says how many devices are behind it.
+def check_targets(targets):
     t0 = time.monotonic()
-    try:
-        with socket.create_connection((host, port), timeout=TCP_TIMEOUT_S):
-            elapsed = int((time.monotonic() - t0) * 1000)
-            return "up", elapsed, "tcp ok"
-    except (socket.timeout, OSError) as e:
-        return "down", None, f"tcp error: {e}"
+    # settings page overrides the env default
+    basis = get_config("DEGRADED_BASIS", DEGRADED_BASIS)
+
+    if not last_state.loaded:
+        print(f"[monitor] last-state cache loaded for {last_state.load()} devices", flush=True)
+
+    is_down = _down_lookup(targets) if len(topology) else None
+    behind = {}   # device id -> the down ancestor it is reached through
+    if is_down is not None:
+        for d in targets:
+            a = topology.blocked_by(d.id, is_down)
+            if a is not None:
+                behind[d.id] = a
+    probe = [d for d in targets if d.id not in behind]
+    results = dict(zip((d.id for d in probe), run_probes(((d.kind, d.host) for d in probe), degraded_basis=basis)))
+    skipped = f", {len(behind)} behind a down parent skipped" if behind else ""
+    print(f"[monitor] probed {len(probe)} devices in {time.monotonic() - t0:.2f}s{skipped}", flush=True)
+
+    if is_down is not None:
+        # a failure behind a parent that failed in this same pass is the parent's outage too
+        failed = {i for i, r in results.items() if r[0] == "down"}
+        for i in failed:
+            a = topology.blocked_by(i, lambda j: j in failed or is_down(j))
+            if a is not None:
+                behind[i] = a
+
+    out = []
+    for d in targets:
+        k = d.kind
+        if d.id in behind:
+            t = last_state.hold(d.id)
+            status, latency, timings = t.status, None, None
+            msg = f"unreachable: {topology.name(behind[d.id])} is down"
+            was_down = False
+        else:
+            status, latency, msg, timings = results[d.id]
+            graded = (timings or {}).get("ttfb") if basis == "ttfb" else latency
+            was_down = last_state.is_down(d.id)
+            t = last_state.observe(d.id, status, graded)
+            status = t.status   # after the degraded hysteresis band
+            if was_down and not last_state.is_down(d.id):
+                priority.update(topology.descendants(d.id))   # back up: recheck what is behind it now
+            elif status == "down" and not was_down:
+                priority.update(topology.ancestors(d.id))     # is it the device or its uplink?
+
+        # persist result (buffered; committed in bulk by the writer thread)
+        writer.put({
+            "device_id": d.id,
+            "status": status,
+            "latency_ms": latency,
+            "message": msg,
+            "created_at": now_utc(),
+            # every row carries every key: the writer inserts batches with executemany
+            **{f"{p}_ms": (timings or {}).get(p) for p in PHASES},
+            # device_latest_status only (not check_results columns)
+            "confirmed_status": t.confirmed, "flapping": t.flapping,
+            "flap_pct": t.flap_pct, "suppressed": t.suppressed,
+        })
+
+        print(f"[monitor] {d.name}@{d.host} kind={k} status={status} latency={latency}ms "
+              f"confirmed={t.confirmed} changed={t.changed} flap={t.flap_pct}% msg={msg}", flush=True)
+
+        # alerts on confirmed state-change (optionally include recovery); flapping
+        # devices get one alert when it starts and one when it stops instead
+        if t.alert == "change" and (t.confirmed != "up" or ALERT_ON_RECOVERY):
+            ALERTS_RAISED.labels("change").inc()
+            human_latency = "-" if latency is None else f"{latency} ms"
+            n_behind = len(topology.descendants(d.id))
+            if n_behind and t.confirmed == "down":
+                deps = f"{n_behind} device(s) behind it are unreachable and not checked until it recovers"
+            elif n_behind and was_down:
+                deps = f"rechecking the {n_behind} device(s) behind it"
+            else:
+                deps = None
+            text = f"🔔 {d.name} ({d.host}) → {t.confirmed.upper()}  [{k}]  latency={human_latency}  note={msg}"
+            alerts_out.enqueue(
+                d.id,
+                subject=f"[Monitor] {d.name} is {t.confirmed.upper()}",
+                text=text + (f"  {deps}" if deps else ""),
+                body=f"{d.name} ({d.host})\nkind: {k}\nstatus: {t.confirmed}\nlatency: {human_latency}\nmsg: {msg}\n"
+                     + (f"dependents: {deps}\n" if deps else ""),
+            )
+        elif t.alert == "flapping":
+            ALERTS_RAISED.labels("flapping").inc()
+            alerts_out.enqueue(
+                d.id,
+                subject=f"[Monitor] {d.name} is FLAPPING",
+                text=f"🔁 {d.name} ({d.host}) is FLAPPING  [{k}]  {t.flap_pct}% of recent checks changed status; "
+                     f"alerts paused until it settles",
+                body=f"{d.name} ({d.host})\nkind: {k}\nflapping: {t.flap_pct}% of the last checks changed status\n"
+                     f"last status: {status}\nFurther changes are not alerted until it is stable.\n",
+            )
+        elif t.alert == "stable":
+            ALERTS_RAISED.labels("stable").inc()
+            alerts_out.enqueue(
+                d.id,
+                subject=f"[Monitor] {d.name} stopped flapping, {t.confirmed.upper()}",
+                text=f"✅ {d.name} ({d.host}) stopped flapping → {t.confirmed.upper()}  [{k}]  "
+                     f"{t.suppressed} change(s) were not alerted",
+                body=f"{d.name} ({d.host})\nkind: {k}\nstatus: {t.confirmed}\n"
+                     f"changes not alerted while flapping: {t.suppressed}\n",
+            )
+        # unconfirmed change: recheck soon (not while flapping, that only adds load)
+        out.append((d, status, t.pending and not t.flapping))
+    CYCLE_SECONDS.observe(time.monotonic() - t0)
+    CYCLE_DEVICES.inc(len(targets))
+    if behind:
+        CHECKS_SKIPPED.inc(len(behind))
+    return out
 
+# One full sweep of every enabled device (ad-hoc runs, benchmarks)
 def run_once():
     with app.app_context():
-        devices = Device.query.filter_by(enabled=True).order_by(Device.id.asc()).all()
-        for d in devices:
-            k = (d.kind or "").lower()
-            if k not in ("icmp", "http", "tcp"):
-                # fallback heuristic for legacy rows
-                k = "icmp" if IP_RE.match(d.host) else "http"
-
-            if k == "icmp":
-                status, latency, msg = check_icmp(d.host)
-            elif k == "http":
-                status, latency, msg = check_http(d.host)
-            else:
-                status, latency, msg = check_tcp(d.host)
+        targets = load_targets()
+        if hot is not None:
+            hot.track({t.id: t.generation for t in targets})
+        out = check_targets(targets)
+    writer.flush()
+    priority.clear()   # no schedule to move them up on
+    return out
 
-            prev = (
-                CheckResult.query
-                .filter_by(device_id=d.id)
-                .order_by(CheckResult.created_at.desc())
-                .first()
-            )
-            changed = (not prev) or (prev.status != status)
-
-            # persist result
-            db.session.add(CheckResult(
-                device_id=d.id,
-                status=status,
-                latency_ms=latency,
-                message=msg,
-                created_at=now_utc(),
-            ))
-            db.session.commit()
-
-            print(f"[monitor] {d.name}@{d.host} kind={k} status={status} latency={latency}ms changed={changed} msg={msg}", flush=True)
-
-            # alerts on state-change (optionally include recovery)
-            if changed and (status != "up" or ALERT_ON_RECOVERY):
-                human_latency = "-" if latency is None else f"{latency} ms"
-                text = f"🔔 {d.name} ({d.host}) → {status.upper()}  [{k}]  latency={human_latency}  note={msg}"
-                ok_tg, info_tg = notify_telegram(text)
-                ok_em, info_em = send_email(
-                    subject=f"[Monitor] {d.name} is {status.upper()}",
-                    body=f"{d.name} ({d.host})\nkind: {k}\nstatus: {status}\nlatency: {human_latency}\nmsg: {msg}\n"
-                )
-                print(f"[alert] telegram={ok_tg} {info_tg} | email={ok_em} {info_em}", flush=True)
-
-def run_loop():
+_stopping = False
+
+def _sigterm(signum, frame):
+    # stop at the top of the next loop tick (a sharded worker first hands its devices over)
+    global _stopping
+    _stopping = True
+
+# Per-device schedule: each device runs on its own interval from a heap of next-due times.
+# shard: a sharding.Shard to run as one worker of a pool, None to own every device.
+def run_loop(shard=None):
+    signal.signal(signal.SIGTERM, _sigterm)   # stop like Ctrl+C so buffered rows get flushed
+    metrics.serve()   # /metrics on METRICS_PORT
+    if shard is not None:
+        alerts_out.owner = shard.worker_id   # each worker delivers the alerts it raised
+    alerts_out.start()
+    try:
+        _schedule_forever(shard)
+    finally:
+        close_probes()
+        writer.close()
+        alerts_out.close()   # undelivered alerts stay in alert_outbox for the next start
+        if shard is not None and shard.active:
+            with app.app_context():
+                shard.leave(settle_s=0)   # interrupted mid-way: let the others take over now
+        print(f"[monitor] stopped; writer flushed {writer.rows_written} rows", flush=True)
+
+def _schedule_forever(shard=None):
+    global _owned
+    sched = Scheduler(INTERVAL_SECONDS)
+    metrics.gauge("scheduler_devices", "Devices on this worker's schedule", lambda: len(sched))
+    targets = {}
+    last_sync = last_stats = last_rollup = last_retention = last_beat = float("-inf")
     while True:
         try:
-            run_once()
+            now = time.monotonic()
+            if shard is not None:
+                if now - last_beat >= WORKER_HEARTBEAT_S or (_stopping and shard.active_until is None):
+                    with app.app_context():
+                        if _stopping and shard.active_until is None:
+                            until = shard.leave()
+                            print(f"[shard] {shard.worker_id} leaving at {until:%H:%M:%S}", flush=True)
+                        shard.heartbeat()
+                    last_beat = now
+                if shard.update():
+                    print(f"[shard] {shard.worker_id}: workers={list(shard.members)} "
+                          f"active={shard.active} leader={shard.leader}", flush=True)
+                    last_sync = float("-inf")   # re-partition right away
+                if _stopping and shard.active_until is not None and not shard.active:
+                    return
+            elif _stopping:
+                return
+
+            if now - last_sync >= DEVICE_REFRESH_S:
+                with app.app_context():
+                    targets = {t.id: t for t in load_targets() if shard is None or shard.owns(t.id)}
+                    added, removed = sched.sync({i: t.interval_s for i, t in targets.items()}, now)
+                    _owned = set(targets) if shard is not None else None
+                    if hot is not None:
+                        # rings of devices taken over from another worker start over
+                        hot.track({i: t.generation for i, t in targets.items()}, restart_new=shard is not None)
+                    last_state.forget(removed)
+                    if shard is not None:
+                        shard.devices = len(targets)
+                        if added and last_state.loaded:
+                            last_state.refresh(added)   # taken over: continue from the last stored status
+                if added or removed:
+                    print(f"[sched] devices={len(sched)} added={len(added)} removed={len(removed)}", flush=True)
+                last_sync = now
+
+            popped = sched.pop_due(now, limit=SCHED_BATCH)
+            due = [targets[i] for i in popped if i in targets]
+            if due:
+                try:
+                    with app.app_context():
+                        for d, status, recheck in check_targets(due):
+                            sched.report(d.id, status, recheck)
+                finally:
+                    sched.rearm(popped, now)   # a failed pass must not drop its devices from the schedule
+                if priority:
+                    sched.reschedule_now(priority, now)
+                    priority.clear()
+
+            # pool-wide jobs run in one worker only
+            maintenance = shard is None or shard.leader
+
+            if maintenance and now - last_rollup >= ROLLUP_EVERY_S:
+                with app.app_context():
+                    done = run_rollups()
+                if any(done.values()):
+                    print(f"[rollup] {done}", flush=True)
+                last_rollup = now
+
+            if maintenance and now - last_retention >= RETENTION_EVERY_S:
+                with app.app_context():
+                    report = run_retention()
+                    if shard is not None:
+                        shard.prune()
+                if report["raw_deleted"] or any(report["rollups_deleted"].values()) or report.get("reclaimed_bytes"):
+                    print(f"[retention] {report}", flush=True)
+                last_retention = now
+
+            if now - last_stats >= SCHED_STATS_EVERY_S:
+                print(f"[sched] {sched.stats()} writer_queue={writer.qsize()}", flush=True)
+                last_stats = now
         except Exception as e:
             print("monitor loop error:", e, flush=True)
-        time.sleep(INTERVAL_SECONDS)
+        wait = sched.seconds_until_next()
+        time.sleep(min(wait if wait is not None else DEVICE_REFRESH_S, DEVICE_REFRESH_S, 1.0))
+
+# ------------------------------
+# Supervisor: run N sharded workers on this host and restart any that exit.
+# Workers are named <WORKER_ID or hostname>-w<i>, so a restarted worker keeps
+# its partition. More workers can join from other hosts with --shard.
+# ------------------------------
+def supervise(n):
+    base = os.getenv("WORKER_ID") or socket.gethostname()
+    procs = {}
+
+    def spawn(i):
+        # one /metrics port per worker: METRICS_PORT+1+i (the supervisor itself serves none)
+        port = metrics.METRICS_PORT + 1 + i if metrics.METRICS_PORT else 0
+        env = dict(os.environ, WORKER_ID=f"{base}-w{i}", METRICS_PORT=str(port))
+        procs[i] = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--shard"], env=env)
+        print(f"[supervisor] started {env['WORKER_ID']} pid={procs[i].pid}", flush=True)
+
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        for i in range(n):
+            spawn(i)
+        while True:
+            time.sleep(1.0)
+            for i, p in list(procs.items()):
+                if p.poll() is not None:
+                    print(f"[supervisor] worker {i} exited with {p.returncode}; restarting", flush=True)
+                    spawn(i)
+    finally:
+        for p in procs.values():
+            if p.poll() is None:
+                p.terminate()   # SIGTERM: each worker hands its devices over, flushes and exits
+        for p in procs.values():
+            p.wait()
 
 if __name__ == "__main__":
-    run_loop()
+    ap = argparse.ArgumentParser(description="Device monitor")
+    ap.add_argument("--shard", action="store_true",
+                    help="run as one worker of a sharded pool (id from WORKER_ID, default host-pid)")
+    ap.add_argument("--workers", type=int, default=0, help="start and supervise N sharded workers")
+    args = ap.parse_args()
+    if args.workers:
+        supervise(args.workers)
+    else:
+        run_loop(Shard() if args.shard else None)
@@ -0,0 +1,204 @@
+import os, re, ssl, time, asyncio, platform
+from collections import namedtuple
+
+from dotenv import load_dotenv
+
+import icmp
+import metrics
+from http_pool import HttpClient
+
+load_dotenv()
+
+# ---- Probe tuning (env)
+PING_TIMEOUT_MS  = int(os.getenv("PING_TIMEOUT_MS", "1000"))    # 1s
+HTTP_TIMEOUT_S   = float(os.getenv("HTTP_TIMEOUT_S", "3.0"))    # 3s
+TCP_TIMEOUT_S    = float(os.getenv("TCP_TIMEOUT_S", "2.0"))     # 2s
+DEGRADED_MS      = int(os.getenv("DEGRADED_MS", "800"))         # HTTP latency >= degraded
+DEGRADED_BASIS   = os.getenv("DEGRADED_BASIS", "total").lower() # compare DEGRADED_MS to total | ttfb
+ICMP_MODE        = os.getenv("ICMP_MODE", "auto").lower()       # auto (native socket, else ping) | subprocess
+
+# ---- Concurrency limits: one global cap plus one cap per probe kind
+PROBE_CONCURRENCY      = int(os.getenv("PROBE_CONCURRENCY", "256"))
+PROBE_CONCURRENCY_HTTP = int(os.getenv("PROBE_CONCURRENCY_HTTP", "128"))
+PROBE_CONCURRENCY_TCP  = int(os.getenv("PROBE_CONCURRENCY_TCP", "128"))
+PROBE_CONCURRENCY_ICMP = int(os.getenv("PROBE_CONCURRENCY_ICMP", "128"))
+
+KINDS = ("icmp", "http", "tcp")
+
+PROBE_SECONDS = metrics.histogram("probe_duration_seconds", "Wall time of one probe, timeouts included", ("kind",))
+PROBES_TOTAL = metrics.counter("probes_total", "Probes run by kind and result status", ("kind", "status"))
+_in_flight = 0   # probes holding a concurrency slot (event loop thread only)
+metrics.gauge("probes_in_flight", "Probes currently running", lambda: _in_flight)
+IP_RE = re.compile(r"^\d{1,3}(\.\d{1,3}){3}$")
+
+def to_status(latency_ms, ok, kind):
+    if not ok:
+        return "down"
+    if kind == "http" and latency_ms is not None and latency_ms >= DEGRADED_MS:
+        return "degraded"
+    return "up"
+
+def resolve_kind(kind, host):
+    k = (kind or "").lower()
+    if k not in KINDS:
+        # fallback heuristic for legacy rows
+        k = "icmp" if IP_RE.match(host) else "http"
+    return k
+
+def normalize_url(host_or_url):
+    return host_or_url if host_or_url.startswith(("http://", "https://")) else "http://" + host_or_url
+
+def parse_host_port(host_with_port):
+    if ":" in host_with_port:
+        h, p = host_with_port.rsplit(":", 1)
+        try:
+            return h, int(p)
+        except ValueError:
+            return host_with_port, None
+    return host_with_port, None
+
+def _elapsed_ms(t0):
+    return int((time.monotonic() - t0) * 1000)
+
+# ------------------------------
+# Async checks. Results carry the same (status, latency_ms, msg) as monitor.check_*,
+# plus per-phase timings in ms for HTTP (see http_pool.PHASES), None otherwise
+# ------------------------------
+ProbeResult = namedtuple("ProbeResult", "status latency msg timings", defaults=(None,))
+
+# pinger: an icmp.Pinger shared by the whole cycle; without one, fork ping
+async def check_icmp(host, pinger=None):
+    if pinger is not None:
+        try:
+            rtt = await pinger.ping(host, PING_TIMEOUT_MS / 1000.0)
+        except OSError as e:
+            return ProbeResult("down", None, f"icmp error: {e}")
+        if rtt is None:
+            return ProbeResult("down", None, "no reply")
+        return ProbeResult(to_status(rtt, True, "icmp"), round(rtt, 3), "ok")
+    return await _ping_subprocess(host)
+
+async def _ping_subprocess(host):
+    if platform.system().lower().startswith("win"):
+        cmd = ["ping", "-n", "1", "-w", str(PING_TIMEOUT_MS), host]
+    else:
+        timeout_s = max(1, int(PING_TIMEOUT_MS / 1000))
+        cmd = ["ping", "-c", "1", "-W", str(timeout_s), host]
+    t0 = time.monotonic()
+    try:
+        p = await asyncio.create_subprocess_exec(
+            *cmd, stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL
+        )
+        rc = await p.wait()
+        elapsed = _elapsed_ms(t0)
+        ok = (rc == 0)
+        return ProbeResult(to_status(elapsed if ok else None, ok, "icmp"), (elapsed if ok else None), ("ok" if ok else "no reply"))
+    except Exception as e:
+        return ProbeResult("down", None, f"ping error: {e}")
+
+# client: the pooled http_pool.HttpClient of the probe loop; without one the
+# check opens (and closes) a private client, i.e. no connection reuse
+async def check_http(host_or_url, client=None, basis=None):
+    url = normalize_url(host_or_url)
+    own = client is None
+    if own:
+        client = HttpClient()
+    try:
+        code, timings = await asyncio.wait_for(client.get(url), HTTP_TIMEOUT_S)
+        ok = 200 <= code < 400
+        if not ok:
+            return ProbeResult("down", None, f"http {code}", timings)
+        total = timings["total"]
+        graded = timings["ttfb"] if (basis or DEGRADED_BASIS) == "ttfb" else total
+        return ProbeResult(to_status(graded, True, "http"), total, f"http {code}", timings)
+    except asyncio.TimeoutError:
+        return ProbeResult("down", None, "http timeout")
+    except (OSError, ValueError, ssl.SSLError, asyncio.IncompleteReadError) as e:
+        return ProbeResult("down", None, f"http error: {e}")
+    finally:
+        if own:
+            client.close()
+
+async def check_tcp(host_with_port):
+    host, port = parse_host_port(host_with_port)
+    if not port:
+        return ProbeResult("down", None, "no port")
+    t0 = time.monotonic()
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), TCP_TIMEOUT_S)
+        elapsed = _elapsed_ms(t0)
+        writer.close()
+        return ProbeResult("up", elapsed, "tcp ok")
+    except asyncio.TimeoutError:
+        return ProbeResult("down", None, "tcp error: timed out")
+    except OSError as e:
+        return ProbeResult("down", None, f"tcp error: {e}")
+
+CHECKS = {"icmp": check_icmp, "http": check_http, "tcp": check_tcp}
+
+# ------------------------------
+# Engine
+# ------------------------------
+# Runs every (kind, host) target concurrently; results keep the input order.
+async def probe_all(targets, concurrency=None, limits=None, client=None, degraded_basis=None):
+    global_sem = asyncio.Semaphore(concurrency or PROBE_CONCURRENCY)
+    limits = limits or {}
+    kind_sems = {
+        "icmp": asyncio.Semaphore(limits.get("icmp", PROBE_CONCURRENCY_ICMP)),
+        "http": asyncio.Semaphore(limits.get("http", PROBE_CONCURRENCY_HTTP)),
+        "tcp":  asyncio.Semaphore(limits.get("tcp", PROBE_CONCURRENCY_TCP)),
+    }
+
+    pinger = None
+    if ICMP_MODE != "subprocess" and any(k == "icmp" for k, _ in targets):
+        pinger = icmp.open_pinger()
+
+    async def run(kind, host):
+        # take the per-kind slot first so a queue of one kind never pins global slots
+        global _in_flight
+        async with kind_sems[kind], global_sem:
+            _in_flight += 1
+            t0 = time.perf_counter()
+            try:
+                if kind == "icmp":
+                    r = await check_icmp(host, pinger)
+                elif kind == "http":
+                    r = await check_http(host, client, degraded_basis)
+                else:
+                    r = await CHECKS[kind](host)
+            except Exception as e:
+                r = ProbeResult("down", None, f"{kind} error: {e}")
+            finally:
+                _in_flight -= 1
+            PROBE_SECONDS.labels(kind).observe(time.perf_counter() - t0)
+            PROBES_TOTAL.labels(kind, r[0]).inc()
+            return r
+
+    try:
+        return await asyncio.gather(*(run(k, h) for k, h in targets))
+    finally:
+        if pinger is not None:
+            pinger.close()
+
+# The probe loop lives as long as the process so pooled HTTP connections and
+# cached DNS answers carry over from one cycle to the next.
+_loop = None
+_client = None
+
+def run_probes(targets, concurrency=None, limits=None, degraded_basis=None):
+    global _loop, _client
+    targets = list(targets)
+    if not targets:
+        return []
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+        _client = HttpClient()
+    return _loop.run_until_complete(probe_all(targets, concurrency, limits, _client, degraded_basis))
+
+def close_probes():
+    global _loop, _client
+    if _loop is not None and not _loop.is_closed():
+        _client.close()
+        _loop.run_until_complete(asyncio.sleep(0))   # let the transports finish closing
+        _loop.close()
+    _loop = _client = None
@@ -0,0 +1,166 @@
+import os, time, queue, threading
+
+from dotenv import load_dotenv
+
+from sqlalchemy.exc import DBAPIError, OperationalError
+
+import metrics
+from app import db
+from app.models import CheckResult
+
+load_dotenv()
+
+# ---- Write pipeline tuning (env)
+WRITE_BATCH_ROWS = int(os.getenv("WRITE_BATCH_ROWS", "500"))    # flush when this many rows are buffered
+WRITE_FLUSH_MS   = int(os.getenv("WRITE_FLUSH_MS", "500"))      # ...or when the oldest row is this old
+WRITE_QUEUE_MAX  = int(os.getenv("WRITE_QUEUE_MAX", "10000"))   # producers block beyond this (backpressure)
+WRITE_RETRIES    = int(os.getenv("WRITE_RETRIES", "5"))         # retries of a batch on a locked/busy database
+
+DB_WRITE_SECONDS = metrics.histogram("db_write_seconds", "Insert + hooks + commit of one result batch")
+DB_ROWS_WRITTEN = metrics.counter("db_rows_written_total", "Check results committed")
+DB_WRITE_RETRIES = metrics.counter("db_write_retries_total", "Result batches that failed and were retried")
+DB_ROWS_DROPPED = metrics.counter("db_rows_dropped_total", "Check results dropped because they could not be written")
+
+_FLUSH = object()
+_STOP = object()
+
+
+# Buffered writer stage: probes put() CheckResult rows, one background thread
+# turns them into bulk INSERTs (one transaction per batch). `table` points it at
+# another table (the web app's pushed host samples, see app/ingest.py).
+class ResultWriter:
+    def __init__(self, app, batch_rows=WRITE_BATCH_ROWS, flush_ms=WRITE_FLUSH_MS, max_queue=WRITE_QUEUE_MAX,
+                 table=None):
+        self.app = app
+        self.table = CheckResult.__table__ if table is None else table
+        self.max_queue = max_queue
+        self.batch_rows = batch_rows
+        self.flush_s = flush_ms / 1000.0
+        self._q = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._lock = threading.Lock()
+        self.txn_hooks = []    # callbacks(rows), run inside each batch's transaction before commit
+        self.on_flush = []     # callbacks(rows), run in the writer thread after each commit
+        self.rows_written = 0
+        self.batches = 0
+        self.last_flush_ms = 0.0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="result-writer", daemon=True)
+                self._thread.start()
+        return self
+
+    def put(self, row, timeout=None):
+        # blocks while the queue is full so a stalled database slows the probes
+        # down instead of growing memory without bound
+        if self._thread is None:
+            self.start()
+        self._q.put(row, timeout=timeout)
+
+    def qsize(self):
+        return self._q.qsize()
+
+    def flush(self):
+        # write everything queued so far and wait for it to commit
+        if self._thread is None:
+            return
+        self._q.put(_FLUSH)
+        self._q.join()
+
+    def close(self):
+        if self._thread is None:
+            return
+        self._q.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        buf = []
+        unacked = 0          # items taken off the queue but not yet task_done()
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                item = self._q.get(timeout=timeout)
+                unacked += 1
+            except queue.Empty:
+                item = _FLUSH    # T ms passed since the oldest buffered row
+
+            if item is not _FLUSH and item is not _STOP:
+                buf.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_s
+                if len(buf) < self.batch_rows:
+                    continue
+
+            if buf:
+                self._write(buf)
+                buf, deadline = [], None
+            for _ in range(unacked):
+                self._q.task_done()
+            unacked = 0
+            if item is _STOP:
+                return
+
+    def _write(self, rows):
+        with self.app.app_context():
+            t0 = time.monotonic()
+            written = self._write_rows(rows)
+            self.last_flush_ms = (time.monotonic() - t0) * 1000
+        DB_WRITE_SECONDS.observe(self.last_flush_ms / 1000.0)
+        if not written:
+            return
+        DB_ROWS_WRITTEN.inc(len(written))
+        self.rows_written += len(written)
+        self.batches += 1
+        for cb in self.on_flush:
+            try:
+                cb(written)
+            except Exception as e:
+                print(f"[writer] on_flush {getattr(cb, '__name__', cb)} error: {e}", flush=True)
+
+    def _write_rows(self, rows):
+        # returns the rows that were committed
+        attempt = 0
+        while True:
+            try:
+                db.session.execute(self.table.insert(), rows)
+                for hook in self.txn_hooks:
+                    hook(rows)
+                db.session.commit()
+                return rows
+            except Exception as e:
+                db.session.rollback()
+                if not _transient(e) or attempt >= WRITE_RETRIES:
+                    error = e
+                    break
+                DB_WRITE_RETRIES.inc()
+                attempt += 1
+                print(f"[writer] flush of {len(rows)} rows failed (attempt {attempt}): {e}", flush=True)
+                time.sleep(min(0.5 * attempt, 5.0))
+        if _transient(error) or len(rows) == 1:
+            self._drop(rows, error)
+            return []
+        # a permanent error (a row for a deleted device, a hook that chokes on
+        # one row) fails the whole batch: write the halves on their own so only
+        # the rows that cannot be written are lost
+        mid = len(rows) // 2
+        return self._write_rows(rows[:mid]) + self._write_rows(rows[mid:])
+
+    def _drop(self, rows, error):
+        DB_ROWS_DROPPED.inc(len(rows))
+        ids = sorted({r.get("device_id") for r in rows}, key=lambda i: (i is None, i))
+        print(f"[writer] dropped {len(rows)} row(s) for device(s) {ids[:20]}: {error}", flush=True)
+
+
+def _transient(e):
+    # a locked/busy SQLite file or a dropped connection clears up on its own;
+    # anything else (constraint, bad data, a failing hook) fails again the same way
+    if isinstance(e, DBAPIError) and e.connection_invalidated:
+        return True
+    if isinstance(e, OperationalError):
+        msg = str(e.orig if e.orig is not None else e).lower()
+        return "locked" in msg or "busy" in msg
+    return False
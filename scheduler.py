@@ -0,0 +1,195 @@
+import os, time, heapq, random
+from collections import deque
+
+from dotenv import load_dotenv
+
+import metrics
+
+load_dotenv()
+
+# ---- Scheduling tuning (env)
+SCHED_JITTER_PCT  = float(os.getenv("SCHED_JITTER_PCT", "0.05"))   # +/- share of the interval per run
+BACKOFF_AFTER     = int(os.getenv("BACKOFF_AFTER", "3"))           # consecutive downs before backing off
+MAX_BACKOFF_S     = float(os.getenv("MAX_BACKOFF_S", "600"))       # cap for a backed-off interval
+CONFIRM_RECHECK_S = float(os.getenv("CONFIRM_RECHECK_S", "5"))     # quick recheck after a status change
+
+LAG_WINDOW = 1024   # recent lag samples kept for percentiles
+
+SCHED_LAG_SECONDS = metrics.histogram("scheduler_lag_seconds", "How late a device was dispatched after its due time")
+
+
+class _Entry:
+    __slots__ = ("interval", "anchor", "due", "downs", "gen", "early", "queued")
+
+    def __init__(self, interval, anchor):
+        self.interval = interval
+        self.anchor = anchor     # nominal slot; advances by whole intervals so the period never drifts
+        self.due = anchor
+        self.downs = 0
+        self.gen = 0
+        self.early = False       # queued ahead of its slot (confirm recheck / priority)
+        self.queued = False      # has a live heap item; False between pop_due() and report()
+
+
+# Per-device next-due times on a min-heap: O(log n) per push/pop.
+# Stale heap items (removed devices, rescheduled entries) are skipped lazily
+# by comparing the generation stamped on the item with the live entry.
+class Scheduler:
+    def __init__(self, default_interval, jitter_pct=SCHED_JITTER_PCT, backoff_after=BACKOFF_AFTER,
+                 max_backoff_s=MAX_BACKOFF_S, confirm_s=CONFIRM_RECHECK_S, clock=time.monotonic):
+        self.default_interval = float(default_interval)
+        self.jitter_pct = jitter_pct
+        self.backoff_after = backoff_after
+        self.max_backoff_s = max_backoff_s
+        self.confirm_s = confirm_s
+        self.clock = clock
+        self._heap = []
+        self._entries = {}
+        self._seq = 0
+        self._lags = deque(maxlen=LAG_WINDOW)
+        self.dispatched = 0
+        self.skipped_slots = 0
+        self.lag_max = 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, device_id):
+        return device_id in self._entries
+
+    def _push(self, device_id, entry, due, early=False):
+        entry.gen += 1
+        entry.early = early
+        entry.queued = True
+        entry.due = due
+        self._seq += 1
+        heapq.heappush(self._heap, (due, self._seq, device_id, entry.gen))
+
+    def _jitter(self, interval):
+        return random.uniform(-self.jitter_pct, self.jitter_pct) * interval if self.jitter_pct else 0.0
+
+    def add(self, device_id, interval_s=None, now=None):
+        now = self.clock() if now is None else now
+        interval = float(interval_s or self.default_interval)
+        entry = self._entries.get(device_id)
+        if entry:
+            if entry.interval != interval:
+                entry.interval = interval
+                self._push(device_id, entry, min(entry.due, now + interval))
+            elif not entry.queued:
+                self.rearm([device_id], now)   # popped but never reported: don't lose it
+            return
+        # spread first runs over one interval so the fleet isn't probed in the same instant
+        entry = _Entry(interval, now + random.random() * interval)
+        self._entries[device_id] = entry
+        self._push(device_id, entry, entry.anchor)
+
+    def remove(self, device_id):
+        self._entries.pop(device_id, None)   # its heap items go stale and are skipped
+
+    # make the schedule match {device_id: interval_s}; returns (added, removed) id lists
+    def sync(self, intervals, now=None):
+        added = [i for i in intervals if i not in self._entries]
+        removed = [i for i in self._entries if i not in intervals]
+        for i in removed:
+            self.remove(i)
+        for i, interval in intervals.items():
+            self.add(i, interval, now)
+        return added, removed
+
+    def reschedule_now(self, device_ids, now=None):
+        now = self.clock() if now is None else now
+        for i in device_ids:
+            entry = self._entries.get(i)
+            if entry and entry.due > now:
+                self._push(i, entry, now, early=True)
+
+    def pop_due(self, now=None, limit=None):
+        now = self.clock() if now is None else now
+        out = []
+        while self._heap and self._heap[0][0] <= now and (limit is None or len(out) < limit):
+            due, _, device_id, gen = heapq.heappop(self._heap)
+            entry = self._entries.get(device_id)
+            if entry is None or entry.gen != gen:
+                continue
+            lag = now - due
+            self._lags.append(lag)
+            SCHED_LAG_SECONDS.observe(lag)
+            if lag > self.lag_max:
+                self.lag_max = lag
+            self.dispatched += 1
+            entry.queued = False
+            out.append(device_id)
+        return out
+
+    # schedule the next run of a device from the status its check just returned
+    def report(self, device_id, status, changed=False, now=None):
+        entry = self._entries.get(device_id)
+        if entry is None:
+            return
+        now = self.clock() if now is None else now
+        entry.downs = entry.downs + 1 if status == "down" else 0
+
+        if entry.downs > self.backoff_after:
+            # host stays down: double the interval per extra failure, capped
+            backoff = min(entry.interval * 2 ** (entry.downs - self.backoff_after), self.max_backoff_s)
+            entry.anchor = now + max(backoff, entry.interval)
+            self._push(device_id, entry, entry.anchor)
+            return
+
+        if entry.early:
+            # confirm recheck / priority run: the nominal slot still stands
+            nxt = entry.anchor
+        else:
+            nxt = self._advance(entry, now)
+
+        if changed and self.confirm_s and now + self.confirm_s < nxt:
+            self._push(device_id, entry, now + self.confirm_s, early=True)
+        else:
+            self._push(device_id, entry, nxt + self._jitter(entry.interval))
+
+    def _advance(self, entry, now):
+        # the next nominal slot after the current one
+        nxt = entry.anchor + entry.interval
+        if nxt <= now:
+            # fell behind by whole intervals: drop the missed slots instead of bursting
+            missed = int((now - nxt) // entry.interval) + 1
+            self.skipped_slots += missed
+            nxt += missed * entry.interval
+        entry.anchor = nxt
+        return nxt
+
+    # put popped devices whose report() never came (the check pass failed) back
+    # on their next slot; devices already reported are left alone
+    def rearm(self, device_ids, now=None):
+        now = self.clock() if now is None else now
+        for i in device_ids:
+            entry = self._entries.get(i)
+            if entry is None or entry.queued:
+                continue
+            nxt = entry.anchor if entry.early and entry.anchor > now else self._advance(entry, now)
+            self._push(i, entry, nxt + self._jitter(entry.interval))
+
+    def seconds_until_next(self, now=None):
+        now = self.clock() if now is None else now
+        while self._heap:
+            due, _, device_id, gen = self._heap[0]
+            entry = self._entries.get(device_id)
+            if entry is not None and entry.gen == gen:
+                return max(0.0, due - now)
+            heapq.heappop(self._heap)
+        return None
+
+    def stats(self):
+        lags = sorted(self._lags)
+        def pct(p):
+            return round(lags[min(len(lags) - 1, int(p * len(lags)))] * 1000, 1) if lags else 0.0
+        return {
+            "devices": len(self._entries),
+            "heap_size": len(self._heap),
+            "dispatched": self.dispatched,
+            "skipped_slots": self.skipped_slots,
+            "lag_p50_ms": pct(0.50),
+            "lag_p99_ms": pct(0.99),
+            "lag_max_ms": round(self.lag_max * 1000, 1),
+        }
@@ -0,0 +1,108 @@
+import os, socket, hashlib
+from datetime import datetime, timedelta, timezone
+
+from app.models import db, MonitorWorker
+
+# ---- Sharding tuning (env)
+WORKER_HEARTBEAT_S = float(os.getenv("WORKER_HEARTBEAT_S", "5"))
+WORKER_LEASE_S     = float(os.getenv("WORKER_LEASE_S", "30"))    # no heartbeat for this long = worker is gone
+WORKER_SETTLE_S    = float(os.getenv("WORKER_SETTLE_S", str(3 * WORKER_HEARTBEAT_S)))  # join/leave hand-over delay
+WORKER_FORGET_S    = 24 * 3600   # rows of dead workers are deleted after this
+
+def _now():
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+def default_worker_id():
+    return os.getenv("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+
+def _score(worker_id, device_id):
+    h = hashlib.blake2b(f"{worker_id}/{device_id}".encode(), digest_size=8).digest()
+    return int.from_bytes(h, "big")
+
+# Rendezvous (highest random weight) hashing: every worker derives the same owner
+# from the same member list, and a join or leave only moves ~1/N of the devices.
+def owner(device_id, workers):
+    return max(workers, key=lambda w: _score(w, device_id)) if workers else None
+
+
+# ------------------------------
+# One worker's view of the worker pool.
+# Membership is a function of time computed from the monitor_workers rows, not
+# of when a worker happened to read them: a joiner becomes active at
+# started_at + WORKER_SETTLE_S, a clean leave ends at the active_until it
+# announces, and a crashed worker drops out at heartbeat_at + WORKER_LEASE_S.
+# As long as every worker re-reads the table more often than the settle delay,
+# they all switch ownership at the same instants (clock skew aside), so a
+# device is never probed by two workers at once.
+# ------------------------------
+class Shard:
+    def __init__(self, worker_id=None, settle_s=WORKER_SETTLE_S, lease_s=WORKER_LEASE_S):
+        self.worker_id = worker_id or default_worker_id()
+        self.settle = timedelta(seconds=settle_s)
+        self.lease = timedelta(seconds=lease_s)
+        self.started_at = None
+        self.active_until = None
+        self.rows = {}        # worker_id -> (active_from, active_until, heartbeat_at), as last read
+        self.members = ()     # sorted ids of the workers active at the last update()
+        self.devices = 0      # owned device count, reported with the heartbeat
+
+    # Write our heartbeat and re-read the pool. Needs an app context.
+    def heartbeat(self, now=None):
+        now = now or _now()
+        if self.started_at is None:
+            # a restarted worker with the same WORKER_ID keeps its place if its lease is still valid
+            row = MonitorWorker.query.get(self.worker_id)
+            fresh = row is not None and row.active_until is None and row.heartbeat_at + self.lease > now
+            self.started_at = row.started_at if fresh else now
+        db.session.merge(MonitorWorker(
+            worker_id=self.worker_id, hostname=socket.gethostname(), pid=os.getpid(),
+            started_at=self.started_at, active_from=self.started_at + self.settle,
+            active_until=self.active_until, heartbeat_at=now, devices=self.devices,
+        ))
+        db.session.commit()
+        self.rows = {
+            w: (active_from, until, beat) for w, active_from, until, beat in
+            db.session.query(MonitorWorker.worker_id, MonitorWorker.active_from,
+                             MonitorWorker.active_until, MonitorWorker.heartbeat_at)
+        }
+
+    def members_at(self, now):
+        return tuple(sorted(
+            w for w, (active_from, until, beat) in self.rows.items()
+            if active_from <= now and (until is None or now < until) and now < beat + self.lease
+        ))
+
+    # Recompute membership for `now`; returns True when it changed.
+    def update(self, now=None):
+        members = self.members_at(now or _now())
+        changed = members != self.members
+        self.members = members
+        return changed
+
+    def owns(self, device_id):
+        return owner(device_id, self.members) == self.worker_id
+
+    @property
+    def active(self):
+        return self.worker_id in self.members
+
+    # the lowest active worker id runs the pool-wide jobs (rollups, retention)
+    @property
+    def leader(self):
+        return bool(self.members) and self.members[0] == self.worker_id
+
+    # Announce a clean leave: keep probing until the returned time, the others
+    # take our devices over at that instant. settle_s=0 leaves immediately.
+    def leave(self, now=None, settle_s=None):
+        now = now or _now()
+        settle = self.settle if settle_s is None else timedelta(seconds=settle_s)
+        self.active_until = now + settle
+        self.heartbeat(now)
+        return self.active_until
+
+    # Drop rows of workers that have been gone for a long time (leader only)
+    def prune(self, now=None):
+        cutoff = (now or _now()) - timedelta(seconds=WORKER_FORGET_S)
+        n = MonitorWorker.query.filter(MonitorWorker.heartbeat_at < cutoff).delete(synchronize_session=False)
+        db.session.commit()
+        return n
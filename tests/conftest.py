@@ -0,0 +1,29 @@
+import os, sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "bench")]   # the bench helpers (stubs, seed) double as fixtures
+os.environ["METRICS_PORT"] = "0"
+
+from stubs import use_temp_db   # noqa: E402
+from seed import seed           # noqa: E402
+
+DB_URL = use_temp_db("pytest_monitor.db")   # before anything imports the app
+
+
+# One seeded SQLite database for the whole run: 50 devices, 400 checks each
+@pytest.fixture(scope="session")
+def app():
+    import io, contextlib
+    from app import create_app
+    with contextlib.redirect_stdout(io.StringIO()):
+        app = create_app()
+    seed(DB_URL, devices=50, history=20000)
+    return app
+
+
+@pytest.fixture
+def app_ctx(app):
+    with app.app_context() as ctx:
+        yield ctx
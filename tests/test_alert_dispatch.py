@@ -0,0 +1,166 @@
+from datetime import timedelta
+
+import pytest
+
+import alerts
+import alert_dispatch
+from alert_dispatch import AlertDispatcher, TokenBucket
+from stubs import start_smtp_stub, start_telegram_stub
+
+SETTINGS = ("TELEGRAM_BOT_TOKEN", "TELEGRAM_CHAT_ID", "SMTP_HOST", "SMTP_PORT", "SMTP_STARTTLS", "SMTP_USER",
+            "ALERT_EMAIL_TO", "ALERT_EMAIL_FROM")
+
+
+@pytest.fixture(scope="module")
+def servers():
+    tg, tg_url = start_telegram_stub()
+    smtp, smtp_port = start_smtp_stub()
+    yield tg, tg_url, smtp, smtp_port
+    tg.shutdown()
+    smtp.shutdown()
+
+
+# Both channels pointed at the stubs; the dispatcher is driven step by step
+# through _deliver() on a fake clock instead of its threads.
+@pytest.fixture
+def dispatcher(app_ctx, servers, monkeypatch):
+    from app import db
+    from app.models import AlertOutbox, MonitorWorker
+    from app.config_store import set_many
+    tg, tg_url, smtp, smtp_port = servers
+    tg.messages.clear(); smtp.messages.clear()
+    tg.requests, tg.fail_first = 0, 0
+    monkeypatch.setattr(alerts, "TELEGRAM_API_URL", tg_url)
+    set_many({"TELEGRAM_BOT_TOKEN": "123:stub", "TELEGRAM_CHAT_ID": "42", "SMTP_HOST": "127.0.0.1",
+              "SMTP_PORT": str(smtp_port), "SMTP_STARTTLS": "false", "SMTP_USER": "",
+              "ALERT_EMAIL_TO": "ops@example.com", "ALERT_EMAIL_FROM": "monitor@example.com"})
+    clock = [alert_dispatch._now()]
+    monkeypatch.setattr(alert_dispatch, "_now", lambda: clock[0])
+    d = AlertDispatcher(app_ctx.app, owner="test-worker")
+    d.clock = clock
+    yield d
+    d.smtp.close()
+    d.http.close()
+    set_many({k: "" for k in SETTINGS})
+    AlertOutbox.query.delete()
+    MonitorWorker.query.delete()
+    db.session.commit()
+
+
+def _queue(d, n, first=1):
+    d._persist([{"device_id": i, "subject": f"[Monitor] dev-{i} is DOWN", "text": f"dev-{i} → DOWN",
+                 "body": f"dev-{i}\nstatus: down\n", "created_at": d.clock[0]} for i in range(first, first + n)])
+
+
+def _tick(d, seconds):
+    d.clock[0] += timedelta(seconds=seconds)
+
+
+def _states(channel):
+    from app.models import AlertOutbox
+    return [(r.state, r.attempts) for r in AlertOutbox.query.filter_by(channel=channel).order_by(AlertOutbox.id)]
+
+
+def test_token_bucket_on_an_injected_clock():
+    t = [0.0]
+    b = TokenBucket(rate_per_s=0.5, burst=2, clock=lambda: t[0])
+    assert b.take() == 0 and b.take() == 0
+    assert b.take() == pytest.approx(2.0)    # empty: one token every 2s
+    t[0] += 1.0
+    assert b.take() == pytest.approx(1.0)
+    t[0] += 1.0
+    assert b.take() == 0
+    t[0] += 100.0                            # refills up to the burst, not beyond
+    assert [b.take() for _ in range(3)] == [0, 0, pytest.approx(2.0)]
+    b = TokenBucket(0, 1, clock=lambda: 0.0)
+    assert b.take() == 0 and b.take() == 60.0    # rate 0: the burst, then a fixed wait
+
+
+def test_changes_within_the_digest_window_go_out_as_one_message(dispatcher, monkeypatch, servers):
+    tg, _, smtp, _ = servers
+    monkeypatch.setattr(alert_dispatch, "ALERT_DIGEST_S", 10)
+    bucket = TokenBucket(1, 10)
+    _queue(dispatcher, 5)
+    wait = dispatcher._deliver("telegram", bucket)
+    assert wait == pytest.approx(10) and not tg.messages       # held for the rest of the burst
+    _tick(dispatcher, 4)
+    _queue(dispatcher, 3, first=6)
+    assert dispatcher._deliver("telegram", bucket) == pytest.approx(6)
+    _tick(dispatcher, 6)
+    assert dispatcher._deliver("telegram", bucket) == 0
+    assert dispatcher._deliver("email", bucket) == 0
+    assert len(tg.messages) == 1 and tg.messages[0].startswith("🔔 8 status changes")
+    assert all(f"dev-{i} → DOWN" in tg.messages[0] for i in range(1, 9))
+    assert len(smtp.messages) == 1 and "Subject: [Monitor] 8 status changes" in smtp.messages[0]
+    assert _states("telegram") == _states("email") == [("sent", 1)] * 8
+    assert dispatcher.sent == {"telegram": 1, "email": 1}
+    assert dispatcher.delivered == {"telegram": 8, "email": 8}
+
+
+def test_digest_is_capped_at_digest_max(dispatcher, monkeypatch, servers):
+    tg = servers[0]
+    monkeypatch.setattr(alert_dispatch, "ALERT_DIGEST_MAX", 3)
+    _queue(dispatcher, 7)
+    bucket = TokenBucket(1, 10)
+    for _ in range(2):    # a full digest does not wait for the window
+        assert dispatcher._deliver("telegram", bucket) == 0
+    assert dispatcher._deliver("telegram", bucket) > 0        # the leftover one does
+    _tick(dispatcher, alert_dispatch.ALERT_DIGEST_S)
+    assert dispatcher._deliver("telegram", bucket) == 0
+    assert [m.splitlines()[0] for m in tg.messages] == ["🔔 3 status changes", "🔔 3 status changes", "dev-7 → DOWN"]
+
+
+def test_sends_are_rate_limited_per_channel(dispatcher, monkeypatch, servers):
+    tg = servers[0]
+    monkeypatch.setattr(alert_dispatch, "ALERT_DIGEST_S", 0)
+    t = [0.0]
+    bucket = TokenBucket(rate_per_s=0.1, burst=1, clock=lambda: t[0])
+    _queue(dispatcher, 1)
+    assert dispatcher._deliver("telegram", bucket) == 0
+    _queue(dispatcher, 1, first=2)
+    assert dispatcher._deliver("telegram", bucket) == pytest.approx(10)
+    assert len(tg.messages) == 1 and _states("telegram") == [("sent", 1), ("pending", 0)]
+    t[0] += 10
+    assert dispatcher._deliver("telegram", bucket) == 0
+    assert tg.messages == ["dev-1 → DOWN", "dev-2 → DOWN"]
+
+
+def test_failed_sends_back_off_then_give_up(dispatcher, monkeypatch, servers):
+    from app.models import AlertOutbox
+    tg = servers[0]
+    monkeypatch.setattr(alert_dispatch, "ALERT_DIGEST_S", 0)
+    monkeypatch.setattr(alert_dispatch, "ALERT_RETRY_BASE_S", 5)
+    monkeypatch.setattr(alert_dispatch, "ALERT_MAX_ATTEMPTS", 3)
+    tg.fail_first = 10 ** 6
+    bucket = TokenBucket(1, 10)
+    _queue(dispatcher, 1)
+    for attempt, delay in ((1, 5), (2, 10)):
+        assert dispatcher._deliver("telegram", bucket) == 0
+        assert _states("telegram") == [("pending", attempt)]
+        assert dispatcher._deliver("telegram", bucket) == pytest.approx(delay)   # not due yet
+        _tick(dispatcher, delay)
+    assert dispatcher._deliver("telegram", bucket) == 0
+    row = AlertOutbox.query.filter_by(channel="telegram").one()
+    assert (row.state, row.attempts) == ("failed", 3) and row.last_error and row.sent_at is None
+    assert tg.requests == 3 and not tg.messages
+    assert dispatcher._deliver("telegram", bucket) == 30.0      # nothing left to do
+
+
+def test_reclaim_adopts_pending_rows_of_dead_workers_only(dispatcher):
+    from app import db
+    from app.models import AlertOutbox, MonitorWorker
+    now = alert_dispatch._now()
+    lease = timedelta(seconds=alert_dispatch.WORKER_LEASE_S)
+    for w, beat in (("dead", now - 2 * lease), ("alive", now)):
+        db.session.add(MonitorWorker(worker_id=w, hostname="h", pid=1, started_at=now - 3 * lease,
+                                     active_from=now - 3 * lease, heartbeat_at=beat))
+    for owner, channel, state in (("dead", "telegram", "pending"), ("dead", "telegram", "sent"),
+                                  ("dead", "email", "pending"), ("alive", "telegram", "pending")):
+        db.session.add(AlertOutbox(owner=owner, channel=channel, state=state, body="x", attempts=0,
+                                   created_at=now, next_attempt_at=now))
+    db.session.commit()
+
+    dispatcher._reclaim("telegram")
+    owners = sorted((r.owner, r.channel, r.state) for r in AlertOutbox.query)
+    assert owners == [("alive", "telegram", "pending"), ("dead", "email", "pending"),
+                      ("dead", "telegram", "sent"), ("test-worker", "telegram", "pending")]
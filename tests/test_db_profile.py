@@ -0,0 +1,50 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+import app.db_profile as db_profile
+from app.db_profile import apply_profile, engine_options
+
+
+@pytest.mark.parametrize("method, read_only", [("GET", True), ("HEAD", True), ("POST", False), ("DELETE", False)])
+def test_session_binds_by_request_method(app, method, read_only):
+    from app import db
+    with app.test_request_context("/", method=method):
+        bind = db.session.get_bind()
+        assert bind is (db.get_read_engine() if read_only else db.engine)
+        assert bind.execute(text("PRAGMA query_only")).scalar() == int(read_only)
+
+
+def test_background_work_and_disabled_routing_use_the_primary(app, monkeypatch):
+    from app import db
+    with app.app_context():
+        assert db.session.get_bind() is db.engine
+    monkeypatch.setattr(db_profile, "DB_READ_ONLY_ROUTES", False)
+    with app.test_request_context("/", method="GET"):
+        assert db.session.get_bind() is db.engine
+
+
+def test_new_connections_get_the_profile(app):
+    from app import db
+    with app.app_context():
+        url = db.engine.url
+    for read_only in (False, True):
+        engine = apply_profile(create_engine(url, **engine_options(url)), read_only=read_only)
+        try:
+            with engine.connect() as conn:
+                pragma = lambda name: conn.execute(text(f"PRAGMA {name}")).scalar()
+                assert pragma("journal_mode") == "wal"
+                assert pragma("busy_timeout") == db_profile.SQLITE_BUSY_TIMEOUT_MS
+                assert pragma("cache_size") == -db_profile.SQLITE_CACHE_MB * 1024
+                assert pragma("query_only") == int(read_only)
+                if read_only:
+                    with pytest.raises(OperationalError, match="readonly"):
+                        conn.execute(text("DELETE FROM devices WHERE id = -1"))
+        finally:
+            engine.dispose()
+
+
+def test_pools_only_for_sqlite_files():
+    assert engine_options("postgresql://u@h/db") == {}
+    assert engine_options("sqlite://") == {}
+    assert engine_options("sqlite:////tmp/x.db")["connect_args"]["check_same_thread"] is False
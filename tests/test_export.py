@@ -0,0 +1,70 @@
+import os, csv, io, json, sqlite3, zlib, tracemalloc
+from datetime import datetime, timedelta
+
+import pytest
+
+from seed import sqlite_path
+
+ROWS = 100_000
+DEVICE = 1000
+
+
+# A device of its own with ROWS checks, one a second up to now
+@pytest.fixture(scope="module")
+def big_device(app):
+    now = datetime.utcnow().replace(microsecond=0)
+    ts = lambda dt: dt.isoformat(sep=" ", timespec="microseconds")
+    con = sqlite3.connect(sqlite_path(os.environ["DATABASE_URL"]))
+    con.execute("INSERT INTO devices (id, name, host, kind, enabled) VALUES (?, 'export', '10.9.9.9', 'icmp', 1)",
+                (DEVICE,))
+    con.executemany("INSERT INTO check_results (device_id, status, latency_ms, message, created_at) "
+                    "VALUES (?, ?, ?, 'ok', ?)",
+                    ((DEVICE, "down" if i % 7 == 0 else "up", None if i % 7 == 0 else float(i % 900),
+                      ts(now - timedelta(seconds=ROWS - i))) for i in range(ROWS)))
+    con.commit()
+    con.close()
+    return now
+
+
+def _stream(client, path):
+    resp = client.get(path, buffered=False)
+    assert resp.status_code == 200
+    parts = list(resp.response)
+    resp.close()
+    return parts
+
+
+def test_export_memory_stays_flat(app, big_device):
+    # Python allocations only: RSS also counts SQLite's page cache and mmap
+    client = app.test_client()
+    tracemalloc.start()
+    try:
+        resp = client.get(f"/devices/{DEVICE}/history.csv", buffered=False)
+        lines = sum(part.count(b"\n") for part in resp.response)
+        resp.close()
+        peak = tracemalloc.get_traced_memory()[1] / 1e6
+    finally:
+        tracemalloc.stop()
+    assert lines == ROWS + 1
+    # loading the rows at once would take well over 100 MB
+    assert peak < 16, f"export peaked at {peak:.1f} MB"
+
+
+def test_csv_export(app, big_device):
+    parts = _stream(app.test_client(), f"/devices/{DEVICE}/history.csv")
+    rows = list(csv.reader(io.StringIO(b"".join(parts).decode())))
+    assert rows[0] == ["timestamp", "status", "latency_ms", "message"]
+    assert len(rows) == ROWS + 1
+    assert rows[1][1] == "down" and rows[1][2] == ""
+    assert rows[1][0] < rows[-1][0]           # oldest first
+    assert len(parts) >= ROWS // 2000         # one part per EXPORT_CHUNK_ROWS, not one big body
+
+
+def test_ndjson_gzip_export(app, big_device):
+    since = (big_device - timedelta(seconds=1000)).isoformat(sep=" ")
+    parts = _stream(app.test_client(), f"/devices/{DEVICE}/history.ndjson?gzip=1&from={since}")
+    lines = zlib.decompress(b"".join(parts), 16 + zlib.MAX_WBITS).decode().splitlines()
+    assert len(lines) == 1000
+    first = json.loads(lines[0])
+    assert set(first) == {"timestamp", "status", "latency_ms", "message"}
+    assert first["status"] in ("up", "down")
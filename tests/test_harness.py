@@ -0,0 +1,35 @@
+import pytest
+
+from harness import pct, compared, find_regressions
+
+
+def _run(cycle_p50, p99s):
+    return {"monitor": {"cycle_s": {"p50": cycle_p50}},
+            "endpoints": {name: {"p99_ms": v} for name, v in p99s.items()}}
+
+
+def test_pct():
+    assert pct([], 50) is None
+    assert pct([3.0, 1.0, 2.0], 50) == 2.0
+    assert pct(range(1, 101), 99) == 100
+    assert pct([0.12345], 99) == 0.123
+
+
+def test_compared_keys():
+    assert compared(_run(1.5, {"/": 10, "/api/devices": 20})) == {
+        "monitor.cycle_s.p50": 1.5, "endpoints./.p99_ms": 10, "endpoints./api/devices.p99_ms": 20}
+
+
+def test_only_slowdowns_beyond_the_tolerance_are_regressions():
+    base = _run(2.0, {"/": 10.0, "/api/devices": 20.0, "/gone": 5.0})
+    now = _run(2.4, {"/": 13.0, "/api/devices": 10.0, "/new": 999.0})
+    assert find_regressions(base, now, 25) == [
+        {"metric": "endpoints./.p99_ms", "baseline": 10.0, "now": 13.0, "pct": 30.0}]
+    assert [r["metric"] for r in find_regressions(base, now, 10)] == ["monitor.cycle_s.p50", "endpoints./.p99_ms"]
+    assert find_regressions(base, base, 0) == []
+
+
+@pytest.mark.parametrize("missing", [None, 0])
+def test_missing_values_are_not_compared(missing):
+    assert find_regressions(_run(missing, {"/": missing}), _run(5.0, {"/": 50.0}), 25) == []
+    assert find_regressions(_run(1.0, {"/": 1.0}), _run(None, {"/": None}), 25) == []
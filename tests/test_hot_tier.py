@@ -0,0 +1,71 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.hot_tier import HotTier, generation
+
+T0 = datetime(2024, 1, 1)
+OLD, NEW = generation(T0), generation(T0 + timedelta(days=1))
+
+
+def _rows(device_id, start, n):
+    return [{"device_id": device_id, "created_at": T0 + timedelta(seconds=start + i),
+             "status": "up", "latency_ms": float(i)} for i in range(n)]
+
+
+@pytest.fixture
+def hot(tmp_path):
+    w = HotTier(str(tmp_path / "ring.hot"), capacity=16)
+    r = HotTier(w.path)
+    yield w, r
+    r.close()
+    w.close()
+
+
+def test_ring_keeps_the_newest_records(hot):
+    w, r = hot
+    w.track({3: OLD})
+    w.append(_rows(3, 0, 20))
+    recs = r.read(3, OLD)
+    assert len(recs) == 16 and recs[-1][2] == 19.0
+    assert r.window(3, OLD, limit=5, newest=True) == recs[-5:]
+
+
+def test_untracked_devices_are_skipped(hot):
+    w, r = hot
+    w.track({3: OLD})
+    w.append(_rows(4, 0, 5))      # e.g. rows still buffered for a deleted device
+    assert r.read(4) == []
+
+
+def test_reused_id_never_shows_the_old_history(hot):
+    w, r = hot
+    w.track({3: OLD})
+    w.append(_rows(3, 0, 10))
+    assert r.window(3, NEW, limit=5, newest=True) is None
+    w.track({3: NEW})             # the monitor sees the new device row
+    w.append(_rows(3, 100, 2))
+    assert [x[2] for x in r.read(3, NEW)] == [0.0, 1.0]
+    assert r.read(3, OLD) == []
+
+
+def test_ring_behind_the_latest_status_is_a_miss(hot):
+    w, r = hot
+    w.track({3: OLD})
+    w.append(_rows(3, 0, 10))
+    newest = T0 + timedelta(seconds=9)
+    assert r.window(3, OLD, limit=5, newest=True, latest=newest) is not None
+    assert r.window(3, OLD, limit=5, newest=True, latest=newest + timedelta(seconds=30)) is None
+
+
+def test_taken_over_device_starts_a_new_ring(hot):
+    w, r = hot
+    w.track({3: OLD})
+    w.append(_rows(3, 0, 10))
+    w.track({3: OLD, 5: OLD}, restart_new=True)
+    w.append(_rows(3, 10, 1) + _rows(5, 0, 1))
+    assert len(r.read(3, OLD)) == 11          # still owned: continues
+    w.track({5: OLD})
+    w.track({3: OLD, 5: OLD}, restart_new=True)
+    w.append(_rows(3, 50, 1))
+    assert len(r.read(3, OLD)) == 1           # came back: the gap is not papered over
@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+from http_pool import _read_response
+
+NEXT = b"HTTP/1.1 200 OK\r\n"   # the next response on the same connection
+
+
+def _read(data):
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        status = await reader.readline()
+        out = await _read_response(reader, status)
+        return out, await reader.read()
+    return asyncio.run(run())
+
+
+def test_chunked_body_with_extensions_and_trailers():
+    body = (b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n"
+            b"5;name=x\r\nhello\r\n"
+            b"1A\r\n" + b"a" * 26 + b"\r\n"
+            b"0\r\nX-Checksum: abc\r\n\r\n")
+    assert _read(body + NEXT) == ((200, True), NEXT)
+
+
+def test_content_length_body():
+    resp = b"HTTP/1.1 404 Not Found\r\nContent-Length: 4\r\nConnection: close\r\n\r\nnope"
+    assert _read(resp + NEXT) == ((404, False), NEXT)
+
+
+def test_keep_alive_defaults_per_version():
+    assert _read(b"HTTP/1.0 200 OK\r\nContent-Length: 0\r\n\r\n")[0] == (200, False)
+    assert _read(b"HTTP/1.0 200 OK\r\nConnection: Keep-Alive\r\nContent-Length: 0\r\n\r\n")[0] == (200, True)
+
+
+def test_bodyless_codes_and_unframed_bodies():
+    assert _read(b"HTTP/1.1 204 No Content\r\n\r\n" + NEXT) == ((204, True), NEXT)
+    assert _read(b"HTTP/1.1 304 Not Modified\r\nContent-Length: 99\r\n\r\n" + NEXT) == ((304, True), NEXT)
+    # no length and not chunked: the body runs to EOF, so the connection can't be reused
+    assert _read(b"HTTP/1.1 200 OK\r\n\r\nsome body") == ((200, False), b"")
+
+
+def test_bad_or_truncated_responses():
+    with pytest.raises(ConnectionError):
+        _read(b"garbage\r\n\r\n")
+    with pytest.raises(asyncio.IncompleteReadError):
+        _read(b"HTTP/1.1 200 OK\r\nContent-Length: 10\r\n\r\nshort")
+    with pytest.raises(asyncio.IncompleteReadError):
+        _read(b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n10\r\nshort")
+    with pytest.raises(asyncio.IncompleteReadError):
+        _read(b"HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\n")
@@ -0,0 +1,84 @@
+import asyncio, socket, struct
+
+import pytest
+
+from icmp import ICMP_ECHO_REPLY, ICMP_ECHO_REQUEST, Pinger, checksum, echo_request
+
+
+def test_checksum_rfc1071_example():
+    assert checksum(bytes.fromhex("0001f203f4f5f6f7")) == 0x220D
+    assert checksum(b"\x01") == checksum(b"\x01\x00")   # odd length: zero padded
+
+
+def test_echo_request_checksums_to_zero():
+    packet = echo_request(0x1234, 7, b"token123")
+    assert packet[0] == ICMP_ECHO_REQUEST
+    assert struct.unpack("!HH", packet[4:8]) == (0x1234, 7)
+    assert checksum(packet) == 0
+
+
+class FakeSocket:
+    # recvfrom() hands out queued datagrams; the socketpair only lends a file descriptor
+    def __init__(self):
+        self._pair = socket.socketpair()
+        self.inbox = []
+
+    def fileno(self):
+        return self._pair[0].fileno()
+
+    def recvfrom(self, n):
+        if not self.inbox:
+            raise BlockingIOError
+        return self.inbox.pop(0)
+
+    def close(self):
+        for s in self._pair:
+            s.close()
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+def _pinger(loop, raw):
+    p = Pinger(FakeSocket(), raw, loop=loop)
+    fut = loop.create_future()
+    p.pending[5] = (fut, "10.0.0.1")
+    return p, fut
+
+
+def _reply(p, seq=5, ident=None, token=None, typ=ICMP_ECHO_REPLY):
+    body = struct.pack("!BBHHH", typ, 0, 0, p.ident if ident is None else ident, seq)
+    return body + (p.token if token is None else token)
+
+
+def test_dgram_reply_matched_by_seq_token_and_source(loop):
+    p, fut = _pinger(loop, raw=False)
+    p.sock.inbox += [
+        (_reply(p, token=b"\0" * 8), ("10.0.0.1", 0)),           # another process's ping
+        (_reply(p), ("10.0.0.2", 0)),                            # right seq, wrong host
+        (_reply(p, typ=ICMP_ECHO_REQUEST), ("10.0.0.1", 0)),     # not a reply
+        (_reply(p, seq=6), ("10.0.0.1", 0)),                     # nobody waiting
+        (b"\0\0", ("10.0.0.1", 0)),                              # runt
+    ]
+    p._on_readable()
+    assert not fut.done() and not p.sock.inbox
+    p.sock.inbox.append((_reply(p, ident=0xBEEF), ("10.0.0.1", 0)))   # the kernel rewrote the identifier
+    p._on_readable()
+    assert fut.done()
+    p.close()
+
+
+def test_raw_reply_strips_ip_header_and_checks_identifier(loop):
+    p, fut = _pinger(loop, raw=True)
+    ip = bytes([0x45]) + b"\0" * 19
+    p.sock.inbox.append((ip + _reply(p, ident=(p.ident + 1) & 0xFFFF), ("10.0.0.1", 0)))
+    p._on_readable()
+    assert not fut.done()
+    p.sock.inbox.append((ip + _reply(p), ("10.0.0.1", 0)))
+    p._on_readable()
+    assert fut.done()
+    p.close()
@@ -0,0 +1,107 @@
+import gzip, json, time
+
+import pytest
+
+import app.ingest as ingest_mod
+from app.ingest import issue_token
+
+DEVICE = 30
+
+
+@pytest.fixture
+def token(app):
+    from app import db
+    from app.models import Device
+    with app.app_context():
+        t = issue_token(Device.query.get(DEVICE))
+        db.session.commit()
+    return t
+
+
+# Nothing a test pushed may still sit in the writer thread when the next test
+# module starts: its timed flush would land in the middle of someone else's SQL.
+@pytest.fixture(autouse=True)
+def drain(app):
+    yield
+    ingest_mod.sample_writer(app).flush()
+
+
+def _push(client, groups, **kw):
+    return client.post("/api/ingest", data=json.dumps({"devices": groups}), **kw)
+
+
+def _samples(app, since):
+    from app.models import HostSample
+    ingest_mod.sample_writer(app).flush()
+    with app.app_context():
+        return HostSample.query.filter(HostSample.device_id == DEVICE, HostSample.cpu_percent == since).count()
+
+
+def test_valid_push_is_written(app, token):
+    now = time.time()
+    resp = _push(app.test_client(), [{"id": DEVICE, "token": token,
+                                      "samples": [[now - 2, 12.5, 40], [now - 1, 12.5, None]]}])
+    assert resp.status_code == 202
+    assert resp.get_json() == {"accepted": 2, "rejected": 0, "errors": []}
+    assert _samples(app, 12.5) == 2
+
+
+def test_gzip_body(app, token):
+    body = gzip.compress(json.dumps({"devices": [{"id": DEVICE, "token": token,
+                                                  "samples": [[time.time(), 13.5, 1]]}]}).encode())
+    resp = app.test_client().post("/api/ingest", data=body, headers={"Content-Encoding": "gzip"})
+    assert resp.status_code == 202 and resp.get_json()["accepted"] == 1
+
+
+@pytest.mark.parametrize("group", [
+    {"id": DEVICE, "samples": [[0, 1, 1]]},                      # no token
+    {"id": DEVICE, "token": "wrong", "samples": [[0, 1, 1]]},
+    {"id": 10 ** 6, "token": "wrong", "samples": [[0, 1, 1]]},   # unknown device, same answer
+])
+def test_missing_or_wrong_token_is_401(app, token, group):
+    resp = _push(app.test_client(), [group])
+    assert resp.status_code == 401
+    assert resp.get_json()["errors"] == [{"id": group["id"], "error": "unknown device or bad token"}]
+
+
+def test_oversized_body_is_413(app, token, monkeypatch):
+    monkeypatch.setattr(ingest_mod, "INGEST_MAX_BYTES", 1000)
+    samples = [[time.time(), 1, 1]] * 100
+    assert _push(app.test_client(), [{"id": DEVICE, "token": token, "samples": samples}]).status_code == 413
+    # small on the wire, too big once decompressed
+    body = gzip.compress(json.dumps({"devices": [], "pad": "x" * 10000}).encode())
+    resp = app.test_client().post("/api/ingest", data=body, headers={"Content-Encoding": "gzip"})
+    assert resp.status_code == 413
+
+
+def test_malformed_samples_are_counted_not_fatal(app, token):
+    now = time.time()
+    samples = [
+        [now, 14.5, 2],                       # good
+        [now, 101, 2],                        # not a percentage
+        [now, True, 2],
+        [now - 10 * 86400, 1, 1],             # too old
+        [now + 3600, 1, 1],                   # too far ahead
+        ["soon", 1, 1],
+        [now, 1],                             # wrong shape
+        None,
+        ["BIG", 1, 1],                        # an integer timestamp float() can't hold
+    ]
+    raw = json.dumps({"devices": [{"id": DEVICE, "token": token, "samples": samples}]})
+    raw = raw.replace('"BIG"', "1" + "0" * 400)
+    resp = app.test_client().post("/api/ingest", data=raw)
+    assert resp.status_code == 202
+    assert resp.get_json() == {"accepted": 1, "rejected": 8, "errors": []}
+
+
+def test_token_rotation(app, token):
+    client = app.test_client()
+    with client.session_transaction() as s:
+        s["logged_in"] = True
+    assert client.post(f"/devices/{DEVICE}/ingest-token").status_code == 302
+    with client.session_transaction() as s:
+        message = s["_flashes"][-1][1]
+    new = message.rsplit(": ", 1)[1]
+    sample = [[time.time(), 1, 1]]
+    assert _push(client, [{"id": DEVICE, "token": token, "samples": sample}]).status_code == 401
+    assert _push(client, [{"id": DEVICE, "token": new, "samples": sample}]).status_code == 202
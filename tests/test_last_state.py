@@ -0,0 +1,68 @@
+from last_state import StatusTracker
+
+
+def _tracker(**kw):
+    kw.setdefault("confirm_n", 2)
+    kw.setdefault("confirm_m", 3)
+    kw.setdefault("flap_window", 10)
+    kw.setdefault("flap_start_pct", 40)
+    kw.setdefault("flap_stop_pct", 20)
+    kw.setdefault("degraded_ms", 800)
+    kw.setdefault("clear_pct", 80)
+    return StatusTracker(**kw)
+
+
+def test_first_check_is_confirmed():
+    t = _tracker().observe(1, "up")
+    assert (t.status, t.confirmed, t.changed, t.pending, t.alert) == ("up", "up", True, False, "change")
+
+
+def test_change_needs_n_of_the_last_m_checks():
+    tr = _tracker()
+    tr.observe(1, "up")
+    t = tr.observe(1, "down")
+    assert (t.confirmed, t.changed, t.pending, t.alert) == ("up", False, True, None)
+    assert tr.is_down(1)                      # the newest check already counts for children
+    t = tr.observe(1, "up")
+    assert (t.confirmed, t.changed, t.pending) == ("up", False, False)
+    t = tr.observe(1, "down")                 # 2 downs within the last 3: confirmed
+    assert (t.confirmed, t.changed, t.alert) == ("down", True, "change")
+    assert tr.get(1) == "down"
+
+
+def test_single_blips_never_confirm():
+    tr = _tracker()
+    for s in ("up", "down", "up", "up", "down", "up", "up"):
+        t = tr.observe(1, s)
+    assert tr.get(1) == "up" and not t.changed
+
+
+def test_degraded_clears_only_below_the_band():
+    tr = _tracker(confirm_n=1, confirm_m=1)
+    tr.observe(1, "up", 100)
+    assert tr.observe(1, "degraded", 900).confirmed == "degraded"
+    t = tr.observe(1, "up", 700)              # under 800 ms but above 80 % of it
+    assert (t.status, t.confirmed) == ("degraded", "degraded")
+    t = tr.observe(1, "up", 500)
+    assert (t.status, t.confirmed, t.alert) == ("up", "up", "change")
+
+
+def test_flapping_suppresses_changes_then_reports_stable():
+    tr = _tracker(confirm_n=1, confirm_m=1)
+    alerts = [tr.observe(1, s).alert for s in ["up", "down"] * 4]
+    assert alerts.count("flapping") == 1
+    assert alerts[-1] is None
+    t = tr.observe(1, "up")
+    assert t.flapping and t.changed and t.alert is None and t.suppressed >= 1
+    while t.flapping:
+        t = tr.observe(1, "up")
+    assert t.alert == "stable" and t.flap_pct <= 20
+
+
+def test_hold_keeps_state():
+    tr = _tracker()
+    tr.observe(1, "down")
+    t = tr.hold(1)
+    assert (t.status, t.confirmed, t.changed, t.alert) == ("unreachable", "down", False, None)
+    assert tr.is_down(1)
+    assert tr.hold(2).confirmed is None and not tr.is_down(2)
@@ -0,0 +1,78 @@
+import time
+from datetime import timedelta
+
+import pytest
+
+import app.live as live
+from app.live import ChangeHub, _Client, devices_etag
+
+
+@pytest.fixture
+def hub(app, app_ctx):
+    from app import db
+    from app.models import DeviceLatestStatus
+    h = ChangeHub(app)
+    h.client = _Client()
+    h._clients.add(h.client)
+    yield h
+    DeviceLatestStatus.query.filter(DeviceLatestStatus.device_id.in_([40, 41])).delete(synchronize_session=False)
+    db.session.commit()
+
+
+def _write(device_id, status, updated_at):
+    from app import db
+    from app.models import DeviceLatestStatus
+    db.session.merge(DeviceLatestStatus(device_id=device_id, status=status, latency_ms=1.0, created_at=updated_at,
+                                        updated_at=updated_at))
+    db.session.commit()
+
+
+def test_device_edits_change_the_etag_and_the_stream(app, app_ctx):
+    from app import db
+    from app.models import Device
+    hub = ChangeHub(app)
+    client = _Client()
+    hub._clients.add(client)
+    hub.poll()                                  # first poll only takes a snapshot
+    before = devices_etag()
+    d = Device.query.get(5)
+    try:
+        time.sleep(0.002)
+        d.parent_id = 4                         # edits keep the device count and max id
+        db.session.commit()
+        assert devices_etag() != before
+        hub.poll()
+        assert "event: devices" in client.q.get_nowait()
+        hub.poll()
+        assert client.q.empty()                 # nothing new: nothing sent
+    finally:
+        d.parent_id = None
+        db.session.commit()
+
+
+def test_row_committed_behind_the_overlap_is_sent_on_the_resync(hub, monkeypatch):
+    _write(40, "up", live._now())
+    hub.poll()
+    # stamped long before it became visible: the next incremental poll cannot see it
+    _write(41, "down", hub._watermark - timedelta(seconds=3 * live.STREAM_OVERLAP_S))
+    hub.poll()
+    assert hub.client.q.empty()
+    monkeypatch.setattr(live, "STREAM_RESYNC_S", 0)
+    hub.poll()
+    msg = hub.client.q.get_nowait()
+    assert "event: delta" in msg and '"id":41' in msg and '"status":"down"' in msg
+    hub.poll()
+    assert hub.client.q.empty()                 # the resync only sends what changed
+
+
+def test_resync_forgets_deleted_devices(hub, monkeypatch):
+    from app import db
+    from app.models import DeviceLatestStatus
+    _write(40, "up", live._now())
+    hub.poll()
+    assert 40 in hub._state
+    DeviceLatestStatus.query.filter_by(device_id=40).delete()
+    db.session.commit()
+    monkeypatch.setattr(live, "STREAM_RESYNC_S", 0)
+    hub.poll()
+    assert 40 not in hub._state and hub.client.q.empty()
@@ -0,0 +1,26 @@
+from sqlalchemy import text
+
+from check_query_plans import hot_queries, plan_rows, full_scans
+
+
+def test_hot_queries_use_indexes(app_ctx):
+    # the same check as bench/check_query_plans.py, on the session's seeded database
+    from app import db
+    db.session.execute(text("ANALYZE"))
+    queries = hot_queries()
+    assert len(queries) >= 10
+    bad = {}
+    for name, q in queries.items():
+        details = plan_rows(db, q)
+        assert details, name
+        if full_scans(details):
+            bad[name] = details
+    assert bad == {}
+
+
+def test_full_scans_flags_unindexed_history():
+    assert full_scans(["SCAN check_results"]) == ["SCAN check_results"]
+    assert full_scans(["SCAN TABLE check_rollups"]) == ["SCAN TABLE check_rollups"]
+    assert full_scans(["SCAN devices", "SCAN d",
+                       "SEARCH check_results USING INDEX ix_check_results_device_created (device_id=?)",
+                       "SCAN check_results USING INDEX ix_check_results_created"]) == []
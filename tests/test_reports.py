@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.reports import cover, parse_window
+
+M, H, D = 60, 3600, 86400
+FAR = datetime(2100, 1, 1)
+ALL = {M: FAR, H: FAR, D: FAR}
+
+
+def _contiguous(segs, start, end):
+    assert segs[0][1] == start and segs[-1][2] == end
+    assert all(a[2] == b[1] for a, b in zip(segs, segs[1:]))
+    assert all(s < e for _, s, e in segs)
+
+
+def test_coarsest_tier_in_the_middle_finer_at_the_edges():
+    start, end = datetime(2024, 1, 1, 0, 0, 30), datetime(2024, 1, 3, 12, 0, 10)
+    segs = cover(start, end, ALL)
+    _contiguous(segs, start, end)
+    assert segs == [
+        (0, start, datetime(2024, 1, 1, 0, 1)),
+        (M, datetime(2024, 1, 1, 0, 1), datetime(2024, 1, 1, 1)),
+        (H, datetime(2024, 1, 1, 1), datetime(2024, 1, 2)),
+        (D, datetime(2024, 1, 2), datetime(2024, 1, 3)),
+        (H, datetime(2024, 1, 3), datetime(2024, 1, 3, 12)),
+        (0, datetime(2024, 1, 3, 12), end),
+    ]
+
+
+def test_tiers_stop_at_their_watermark():
+    start, end = datetime(2024, 1, 1), datetime(2024, 1, 5)
+    wm = {D: datetime(2024, 1, 3), H: datetime(2024, 1, 4, 6), M: datetime(2024, 1, 4, 6, 30)}
+    segs = cover(start, end, wm)
+    _contiguous(segs, start, end)
+    assert segs == [
+        (D, start, datetime(2024, 1, 3)),
+        (H, datetime(2024, 1, 3), datetime(2024, 1, 4, 6)),
+        (M, datetime(2024, 1, 4, 6), datetime(2024, 1, 4, 6, 30)),
+        (0, datetime(2024, 1, 4, 6, 30), end),
+    ]
+
+
+def test_no_rollups_yet_or_empty_window():
+    start = datetime(2024, 1, 1)
+    assert cover(start, start + timedelta(days=2), {}) == [(0, start, start + timedelta(days=2))]
+    assert cover(start, start, ALL) == []
+    assert cover(start + timedelta(seconds=1), start, ALL) == []
+
+
+def test_parse_window_rejects_unusable_day_counts():
+    now = datetime(2024, 1, 10)
+    assert parse_window(None, None, 7, now=now) == (now - timedelta(days=7), now)
+    for days in (1e10, float("inf"), float("nan"), 0, -1):
+        with pytest.raises(ValueError):
+            parse_window(None, None, days, now=now)
+
+
+def test_parse_window_converts_offsets_to_naive_utc():
+    start = datetime.fromisoformat("2024-01-01T02:00+02:00")
+    end = datetime.fromisoformat("2024-01-02T00:00+00:00")
+    assert parse_window(start, end, 30) == (datetime(2024, 1, 1), datetime(2024, 1, 2))
+    assert parse_window(start, None, 30, now=datetime(2024, 1, 2))[0] == datetime(2024, 1, 1)
+
+
+@pytest.mark.parametrize("qs", ["days=1e10", "days=inf", "days=nan", "days=x", "devices=a",
+                                "from=2024-01-02&to=2024-01-01"])
+def test_uptime_api_answers_bad_windows_with_400(app, qs):
+    assert app.test_client().get(f"/api/reports/uptime?{qs}").status_code == 400
+
+
+def test_uptime_api_accepts_offsets(app):
+    resp = app.test_client().get("/api/reports/uptime?from=2024-01-01T00:00%2B00:00&to=2024-01-02T00:00%2B02:00")
+    assert resp.status_code == 200
@@ -0,0 +1,66 @@
+import sqlite3
+from datetime import datetime
+
+import pytest
+from sqlalchemy.exc import OperationalError
+
+import result_writer
+from result_writer import ResultWriter
+
+
+def _rows(devices, n=30):
+    now = datetime.utcnow()
+    return [{"device_id": devices[i % len(devices)], "status": "up", "latency_ms": 1.0,
+             "message": "test", "created_at": now} for i in range(n)]
+
+
+@pytest.fixture
+def writer(app, monkeypatch):
+    monkeypatch.setattr(result_writer.time, "sleep", lambda s: None)
+    w = ResultWriter(app, batch_rows=1000)
+    seen = []
+    w.on_flush.append(seen.extend)
+    yield w, seen
+    w.close()
+
+
+def test_rows_that_always_fail_are_dropped_alone(writer):
+    w, seen = writer
+    def hook(rows):
+        if any(r["device_id"] == 47 for r in rows):
+            raise ValueError("device 47 is gone")
+    w.txn_hooks.append(hook)
+    dropped = result_writer.DB_ROWS_DROPPED._default.value()
+    for r in _rows([41, 42, 47]):
+        w.put(r)
+    w.flush()
+    assert w.rows_written == 20 and len(seen) == 20
+    assert {r["device_id"] for r in seen} == {41, 42}
+    assert result_writer.DB_ROWS_DROPPED._default.value() - dropped == 10
+
+
+def _locked():
+    return OperationalError("INSERT", {}, sqlite3.OperationalError("database is locked"))
+
+
+def test_locked_database_is_retried_a_bounded_number_of_times(writer, monkeypatch):
+    w, seen = writer
+    monkeypatch.setattr(result_writer, "WRITE_RETRIES", 3)
+    calls, failures = [], [3]
+    def hook(rows):
+        calls.append(len(rows))
+        if failures[0]:
+            failures[0] -= 1
+            raise _locked()
+    w.txn_hooks.append(hook)
+    for r in _rows([43], n=5):
+        w.put(r)
+    w.flush()
+    assert calls == [5, 5, 5, 5] and len(seen) == 5   # the batch stays whole while it is only busy
+
+    calls.clear()
+    failures[0] = 100
+    for r in _rows([43], n=5):
+        w.put(r)
+    w.flush()                                         # locked for good: gives up instead of hanging
+    assert calls == [5, 5, 5, 5] and len(seen) == 5
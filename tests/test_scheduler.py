@@ -0,0 +1,108 @@
+from pytest import approx
+
+from scheduler import Scheduler
+
+
+def _sched(**kw):
+    kw.setdefault("jitter_pct", 0)
+    kw.setdefault("backoff_after", 3)
+    kw.setdefault("max_backoff_s", 100)
+    kw.setdefault("confirm_s", 2)
+    return Scheduler(10, clock=lambda: 0.0, **kw)
+
+
+def _first_run(s, device_id=1, interval=10):
+    # first runs are spread over one interval; returns when this one fell
+    s.add(device_id, interval, now=0.0)
+    due = s.seconds_until_next(now=0.0)
+    assert 0 <= due <= interval
+    assert s.pop_due(now=due) == [device_id]
+    return due
+
+
+def test_next_run_keeps_the_anchor_not_the_finish_time():
+    s = _sched()
+    t = _first_run(s)
+    s.report(1, "up", now=t + 3)           # a slow check doesn't push the period out
+    assert s.seconds_until_next(now=t + 3) == approx(7)
+    assert s.pop_due(now=t + 9.9) == []
+    assert s.pop_due(now=t + 10) == [1]
+
+
+def test_missed_slots_are_skipped_not_burst():
+    s = _sched()
+    t = _first_run(s)
+    s.report(1, "up", now=t + 35)
+    assert s.skipped_slots == 3
+    assert s.seconds_until_next(now=t + 35) == approx(5)
+
+
+def test_backoff_doubles_after_consecutive_downs_and_caps():
+    s = _sched()
+    t = _first_run(s)
+    waits = []
+    for _ in range(7):
+        s.report(1, "down", now=t)
+        waits.append(s.seconds_until_next(now=t))
+        t += waits[-1]
+        assert s.pop_due(now=t) == [1]
+    # three downs on the normal period, then 20, 40, 80 and the 100 s cap
+    assert waits == approx([10, 10, 10, 20, 40, 80, 100])
+    s.report(1, "up", now=t)
+    assert s.seconds_until_next(now=t) == approx(10)
+
+
+def test_status_change_gets_a_quick_recheck_then_the_slot_stands():
+    s = _sched()
+    t = _first_run(s)
+    s.report(1, "down", changed=True, now=t + 1)
+    assert s.seconds_until_next(now=t + 1) == approx(2)
+    assert s.pop_due(now=t + 3) == [1]
+    s.report(1, "down", now=t + 3)
+    assert s.seconds_until_next(now=t + 3) == approx(7)   # back on the t + 10 slot
+
+
+def test_reschedule_now_and_removed_devices():
+    s = _sched()
+    t = _first_run(s)
+    s.report(1, "up", now=t)
+    s.reschedule_now([1, 99], now=t + 1)
+    assert s.pop_due(now=t + 1) == [1]
+    s.report(1, "up", now=t + 1)
+    assert s.seconds_until_next(now=t + 1) == approx(9)    # the early run doesn't move the slot
+
+    s.add(2, 10, now=t)
+    s.sync({2: 10}, now=t)
+    assert 1 not in s and 2 in s
+    assert s.pop_due(now=t + 100) == [2]           # device 1's heap items are skipped
+
+
+def test_interval_change_applies_without_waiting_out_the_old_one():
+    s = _sched()
+    t = _first_run(s, interval=600)
+    s.report(1, "up", now=t)
+    s.add(1, 30, now=t)
+    assert s.seconds_until_next(now=t) == approx(30)
+
+
+def test_popped_devices_are_not_lost_when_report_never_comes():
+    s = _sched()
+    t = _first_run(s)
+    s.add(2, 10, now=0.0)
+    s.pop_due(now=t + 10)                          # the check pass then fails: no report()
+    for now in (t + 30, t + 60, t + 600):
+        s.sync({1: 10, 2: 10}, now=now)
+        assert s.seconds_until_next(now=now) is not None
+    assert 1 in s.pop_due(now=t + 1000)
+
+
+def test_rearm_puts_unreported_devices_on_their_next_slot():
+    s = _sched()
+    t = _first_run(s)
+    s.rearm([1], now=t + 1)
+    assert s.seconds_until_next(now=t + 1) == approx(9)
+    s.pop_due(now=t + 10)
+    s.report(1, "up", now=t + 10)
+    s.rearm([1], now=t + 10)                       # reported: left where report() put it
+    assert s.seconds_until_next(now=t + 10) == approx(10)
+    assert len(s._heap) == 1
@@ -0,0 +1,97 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import sharding
+from sharding import Shard, owner
+
+HB, SETTLE, LEASE = 5, 15, 30
+DEVICES = range(1, 2001)
+T0 = datetime(2030, 1, 1)
+
+
+@pytest.fixture
+def workers(app_ctx):
+    from app import db
+    from app.models import MonitorWorker
+    yield
+    MonitorWorker.query.delete()
+    db.session.commit()
+
+
+def test_owner_moves_only_the_leavers_devices():
+    before = {d: owner(d, ("a", "b", "c")) for d in DEVICES}
+    after = {d: owner(d, ("a", "c")) for d in DEVICES}
+    moved = [d for d in DEVICES if before[d] != after[d]]
+    assert all(before[d] == "b" for d in moved)
+    assert len(moved) == sum(1 for o in before.values() if o == "b")
+    assert 0.25 < len(moved) / len(DEVICES) < 0.42    # ~1/3
+    assert owner(1, ()) is None
+
+
+# Timeline like bench/bench_sharding.py: w1-w3 start, w4 joins, w3 leaves
+# cleanly, w2 crashes. Each live worker owns what its own last read of the
+# table says it owns.
+def test_rebalancing_never_duplicates_or_loses_a_device(workers):
+    plan = {                      # name -> (start, clean leave, crash)
+        "w1": (0, None, None),
+        "w2": (1, None, 150),
+        "w3": (2, 90, None),
+        "w4": (60, None, None),
+    }
+    gap = (150, 150 + LEASE + HB)   # w2's devices are unowned until its lease runs out
+    shards, owned = {}, {}
+    sizes = []
+    for sec in range(0, 240):
+        now = T0 + timedelta(seconds=sec)
+        for name, (start, leave_at, crash_at) in plan.items():
+            if sec < start:
+                continue
+            if crash_at is not None and sec >= crash_at:
+                owned[name] = set()
+                continue
+            sh = shards.get(name)
+            if sh is None:
+                sh = shards[name] = Shard(name, settle_s=SETTLE, lease_s=LEASE)
+            if sec == leave_at:
+                sh.leave(now)
+            elif (sec - start) % HB == 0:
+                sh.heartbeat(now)
+            if sh.update(now) or name not in owned:
+                owned[name] = {d for d in DEVICES if sh.owns(d)}
+
+        counts = {}
+        for s in owned.values():
+            for d in s:
+                counts[d] = counts.get(d, 0) + 1
+        assert all(c == 1 for c in counts.values()), f"device owned twice at t={sec}s"
+        if sec > SETTLE + 2 and not gap[0] <= sec < gap[1]:
+            assert len(counts) == len(DEVICES), f"{len(DEVICES) - len(counts)} device(s) unowned at t={sec}s"
+        sizes.append(sum(1 for s in owned.values() if s))
+
+    assert sizes[SETTLE + 3] == 3     # w1-w3 active
+    assert sizes[80] == 4             # w4 joined
+    assert sizes[120] == 3            # w3 left
+    assert sizes[-1] == 2             # w2's lease ran out, w1 and w4 hold everything
+    assert shards["w1"].leader and not shards["w4"].leader
+
+
+def test_restarted_worker_keeps_its_place_within_the_lease(workers):
+    a = Shard("w1", settle_s=SETTLE, lease_s=LEASE)
+    a.heartbeat(T0)
+    again = Shard("w1", settle_s=SETTLE, lease_s=LEASE)
+    again.heartbeat(T0 + timedelta(seconds=LEASE - 1))
+    assert again.started_at == T0
+    late = Shard("w1", settle_s=SETTLE, lease_s=LEASE)
+    late.heartbeat(T0 + timedelta(seconds=3 * LEASE))
+    assert late.started_at == T0 + timedelta(seconds=3 * LEASE)
+
+
+def test_prune_forgets_long_dead_workers(workers):
+    Shard("old", settle_s=SETTLE, lease_s=LEASE).heartbeat(T0)
+    live = Shard("new", settle_s=SETTLE, lease_s=LEASE)
+    later = T0 + timedelta(seconds=sharding.WORKER_FORGET_S + 60)
+    live.heartbeat(later)
+    assert live.prune(later) == 1
+    live.heartbeat(later)
+    assert set(live.rows) == {"new"}
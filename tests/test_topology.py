@@ -0,0 +1,48 @@
+import pytest
+
+from app.topology import Topology, check_parent
+
+
+def test_build_cuts_cycles_and_keeps_the_rest():
+    # 2 -> 1 is a plain chain; 3 -> 4 -> 5 -> 3 loops; 6 hangs off the loop; 7 points nowhere
+    t = Topology({1: None, 2: 1, 3: 4, 4: 5, 5: 3, 6: 3, 7: 99, 8: 8})
+    assert t.cycles == 3
+    assert t.parents == {2: 1, 6: 3}
+    assert t.ancestors(6) == [3]
+    assert t.ancestors(3) == []
+
+
+def test_walks():
+    t = Topology({1: None, 2: 1, 3: 1, 4: 2, 5: 4, 6: 3})
+    assert t.ancestors(5) == [4, 2, 1]
+    assert t.descendants(1) == [2, 3, 4, 6, 5]   # nearest first
+    assert t.descendants(5) == []
+    assert len(t) == 5
+
+
+def test_blocked_by_nearest_enabled_down_ancestor():
+    t = Topology({1: None, 2: 1, 3: 2, 4: 3}, enabled={1, 3, 4})
+    down = {1, 2}
+    assert t.blocked_by(4, down.__contains__) == 1     # 2 is disabled: it can't block
+    down.add(3)
+    assert t.blocked_by(4, down.__contains__) == 3
+    assert t.blocked_by(1, down.__contains__) is None
+
+
+def test_check_parent(app_ctx):
+    from app import db
+    from app.models import Device
+    try:
+        Device.query.get(2).parent_id = 1
+        Device.query.get(3).parent_id = 2
+        db.session.flush()
+        check_parent(4, 3)
+        check_parent(3, None)
+        with pytest.raises(ValueError, match="itself"):
+            check_parent(3, 3)
+        with pytest.raises(ValueError, match="loop"):
+            check_parent(1, 3)            # 3 -> 2 -> 1 already
+        with pytest.raises(ValueError, match="no device"):
+            check_parent(1, 10 ** 6)
+    finally:
+        db.session.rollback()